@@ -62,6 +62,7 @@ setup(
     entry_points={
         "console_scripts": [
             "cloudb = cloudb.main:main",
+            "cloudb-benchmark = cloudb.benchmark:main",
         ]
     },
 )
@@ -6,12 +6,24 @@ A module that denotes this as a module
 """
 
 import logging
-from os import getenv
+from contextlib import contextmanager
+from os import getenv, getpid
 from sys import stdout
+from threading import BoundedSemaphore, Lock
+from time import monotonic, perf_counter
 
 import psycopg2
+from psycopg2.pool import ThreadedConnectionPool
 
-CONNECTION_TABLE_CACHE = {}
+from . import metrics
+
+POOL_SIZE = int(getenv("CLOUDB_POOL_SIZE", "8"))
+HEALTH_CHECK_SECONDS = 30
+
+_pools = {}
+_pools_lock = Lock()
+_pools_pid = None
+_last_used = {}
 
 level = getenv("LOG_LEVEL", "INFO")
 log_level = logging.INFO
@@ -35,15 +47,124 @@ logging.basicConfig(
 )
 
 
-def execute_sql(sql, connection):
+def _get_pool(connection):
+    """gets the connection pool for a connection in the current process
+    connection: dict with connection information
+    returns: tuple with 0: the pool, 1: a semaphore so callers wait for a free connection
+    """
+    global _pools_pid
+
+    key = tuple(sorted(connection.items()))
+
+    with _pools_lock:
+        if _pools_pid != getpid():
+            #: a forked or spawned process must not share the sockets of its parent
+            _pools.clear()
+            _last_used.clear()
+            _pools_pid = getpid()
+
+        if key not in _pools:
+            logging.debug("creating connection pool for %s", connection["database"])
+            pool = ThreadedConnectionPool(0, POOL_SIZE, keepalives=1, **connection)
+            _pools[key] = (pool, BoundedSemaphore(POOL_SIZE))
+
+        return _pools[key]
+
+
+def _is_healthy(conn):
+    """checks that a pooled connection is still usable before handing it out"""
+    if conn.closed:
+        return False
+
+    if monotonic() - _last_used.get(id(conn), 0) < HEALTH_CHECK_SECONDS:
+        return True
+
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT 1")
+
+        conn.rollback()
+    except psycopg2.Error:
+        return False
+
+    return True
+
+
+@contextmanager
+def connect(connection, settings=None, autocommit=False):
+    """borrows a connection from the pool for one transaction. the transaction is committed when the block
+    finishes, rolled back if it raises, and the connection goes back to the pool either way
+    connection: dict with connection information
+    settings: dict of session settings, e.g. statement_timeout, that only apply to this transaction
+    autocommit: run each statement on its own for statements like create index concurrently
+    """
+    pool, slots = _get_pool(connection)
+
+    with slots:
+        conn = pool.getconn()
+
+        if not _is_healthy(conn):
+            logging.debug("replacing unhealthy connection")
+            pool.putconn(conn, close=True)
+            conn = pool.getconn()
+
+        try:
+            conn.autocommit = autocommit
+
+            if settings:
+                with conn.cursor() as cursor:
+                    for name, value in settings.items():
+                        cursor.execute("SELECT set_config(%s, %s, %s)", (name, str(value), not autocommit))
+
+            yield conn
+
+            if not autocommit:
+                conn.commit()
+        except Exception:
+            if not conn.closed and not autocommit:
+                conn.rollback()
+
+            raise
+        finally:
+            if autocommit and not conn.closed:
+                #: without a transaction the settings last for the session so reset them for the next borrower
+                try:
+                    with conn.cursor() as cursor:
+                        cursor.execute("RESET ALL")
+
+                    conn.autocommit = False
+                except psycopg2.Error:
+                    conn.close()
+
+            _last_used[id(conn)] = monotonic()
+            pool.putconn(conn, close=bool(conn.closed))
+
+
+def close_pools():
+    """closes every pooled connection in this process. the cli and server call this on exit"""
+    with _pools_lock:
+        if _pools_pid != getpid():
+            return
+
+        for pool, _ in _pools.values():
+            pool.closeall()
+
+        _pools.clear()
+        _last_used.clear()
+
+
+def execute_sql(sql, connection, settings=None):
     """executes sql on the information
     sql: string T-SQL
     connection: dict with connection information
+    settings: dict of session settings for the statement
     """
     logging.debug("  executing %s", sql)
+    start_seconds = perf_counter()
 
-    with psycopg2.connect(**connection) as conn:
-        with conn.cursor() as cursor:
-            cursor.execute(sql)
-
-        conn.commit()
+    try:
+        with connect(connection, settings) as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(sql)
+    finally:
+        metrics.observe("cloudb_execute_sql_seconds", perf_counter() - start_seconds)
@@ -0,0 +1,428 @@
+#!/usr/bin/env python
+# * coding: utf8 *
+"""
+cloudb-benchmark
+Measures the sync throughput with a synthetic sgid in a geopackage and a local postgis database.
+The database must be named opensgid, e.g.
+docker run -e POSTGRES_PASSWORD=postgres -e POSTGRES_DB=opensgid -p 5432:5432 postgis/postgis
+
+Usage:
+  cloudb-benchmark [--rows=<n> --workers=<n> --seed=<n> --source=<path> --host=<host> --password=<password> --output=<path>]
+                   [--profile=<name> | --calibrate=<path>] [--loader=<engine>]
+
+Options:
+  --rows=<n>             The number of address points. The other tables are sized from it [default: 10000]
+  --workers=<n>          The number of tables to sync at the same time [default: 1]
+  --seed=<n>             The seed for the synthetic data [default: 0]
+  --source=<path>        The geopackage to create [default: sgid.gpkg]
+  --host=<host>          The postgis host [default: localhost]
+  --password=<password>  The password for the postgres user [default: postgres]
+  --output=<path>        Write the results to a json file instead of stdout
+  --profile=<name>       Load every table with one load profile
+  --calibrate=<path>     Load with each profile and write the profiles with the boundaries where each was fastest.
+                         CLOUDB_LOAD_PROFILES points cloudb at the file
+  --loader=<engine>      gdal or native to stream the rows with binary copy [default: gdal]
+"""
+
+import json
+import logging
+import os
+import random
+import sys
+from datetime import datetime
+from pathlib import Path
+from tempfile import mkdtemp
+from time import perf_counter
+
+from docopt import docopt
+from osgeo import ogr, osr
+
+from . import profiles
+
+#: utah in utm zone 12n
+EXTENT = (230000, 4090000, 670000, 4650000)
+#: the share of polygons that are self intersecting so the transfer has shapes to repair
+INVALID_RATIO = 0.01
+WORDS = ["main", "center", "state", "canyon", "lake", "valley", "ridge", "river", "mill", "park"]
+
+#: the synthetic sgid. ratio sizes each table relative to --rows
+TABLES = {
+    "location.address_points": {
+        "title": "Utah Address Points",
+        "geometry_type": "POINT",
+        "ratio": 1,
+        "fields": {
+            "fulladd": ogr.OFTString,
+            "city": ogr.OFTString,
+            "zipcode": ogr.OFTInteger,
+            "addsystem": ogr.OFTString,
+        },
+    },
+    "transportation.roads": {
+        "title": "Utah Roads",
+        "geometry_type": "POLYLINE",
+        "ratio": 0.5,
+        "fields": {
+            "fullname": ogr.OFTString,
+            "speed_lmt": ogr.OFTInteger,
+            "dot_aadt": ogr.OFTInteger64,
+        },
+    },
+    "cadastre.salt_lake_county_parcels": {
+        "title": "Utah Salt Lake County Parcels",
+        "geometry_type": "POLYGON",
+        "ratio": 0.25,
+        "fields": {
+            "parcel_id": ogr.OFTString,
+            "parcel_acres": ogr.OFTReal,
+            "total_mkt_value": ogr.OFTReal,
+        },
+    },
+    "economy.employers": {
+        "title": "Utah Employers",
+        "geometry_type": "STAND ALONE",
+        "ratio": 0.1,
+        "fields": {
+            "name": ogr.OFTString,
+            "naics": ogr.OFTInteger,
+            "employees": ogr.OFTInteger,
+        },
+    },
+}
+
+GEOMETRY_TYPES = {
+    "POINT": ogr.wkbPoint,
+    "POLYLINE": ogr.wkbLineString,
+    "POLYGON": ogr.wkbPolygon,
+    "STAND ALONE": ogr.wkbNone,
+}
+
+
+def _create_value(field_type, generator):
+    """a random value for a field type"""
+    if field_type == ogr.OFTInteger:
+        return generator.randint(0, 99999)
+
+    if field_type == ogr.OFTInteger64:
+        return generator.randint(0, 10**10)
+
+    if field_type == ogr.OFTReal:
+        return round(generator.uniform(0, 10**6), 2)
+
+    return f"{generator.randint(1, 9999)} {generator.choice(WORDS)} {generator.choice(WORDS)}"
+
+
+def _create_geometry(geometry_type, generator):
+    """a random shape within utah
+    returns: wkt
+    """
+    x = generator.uniform(EXTENT[0], EXTENT[2])
+    y = generator.uniform(EXTENT[1], EXTENT[3])
+
+    if geometry_type == "POINT":
+        return f"POINT ({x} {y})"
+
+    if geometry_type == "POLYLINE":
+        vertices = [(x, y)]
+
+        for _ in range(generator.randint(1, 7)):
+            x += generator.uniform(-200, 200)
+            y += generator.uniform(-200, 200)
+            vertices.append((x, y))
+
+        return f"LINESTRING ({', '.join(f'{x} {y}' for x, y in vertices)})"
+
+    size = generator.uniform(20, 200)
+
+    if generator.random() < INVALID_RATIO:
+        #: a bowtie
+        return f"POLYGON (({x} {y}, {x + size} {y + size}, {x + size} {y}, {x} {y + size}, {x} {y}))"
+
+    return f"POLYGON (({x} {y}, {x + size} {y}, {x + size} {y + size}, {x} {y + size}, {x} {y}))"
+
+
+def _create_table(source, name, fields, rows):
+    """creates a table without a shape
+    rows: array of arrays of values in field order
+    """
+    layer = source.CreateLayer(name, None, ogr.wkbNone)
+
+    for field, field_type in fields.items():
+        layer.CreateField(ogr.FieldDefn(field, field_type))
+
+    definition = layer.GetLayerDefn()
+
+    for row in rows:
+        feature = ogr.Feature(definition)
+
+        for field, value in zip(fields, row, strict=True):
+            feature.SetField(field, value)
+
+        layer.CreateFeature(feature)
+
+
+def create_source(path, rows, seed=0):
+    """creates a geopackage shaped like the sgid with point, line, polygon, and stand alone tables
+    and the meta.agolitems and meta.changedetection tables
+    path: the geopackage to create. it is replaced if it exists
+    rows: the number of address points
+    seed: the seed for the random data
+    returns: dictionary of schema.table to the number of rows
+    """
+    generator = random.Random(seed)
+    path = Path(path)
+    path.unlink(missing_ok=True)
+
+    source = ogr.GetDriverByName("GPKG").CreateDataSource(str(path))
+    reference = osr.SpatialReference()
+    reference.ImportFromEPSG(26912)
+
+    counts = {}
+
+    for table, details in TABLES.items():
+        geometry_type = GEOMETRY_TYPES[details["geometry_type"]]
+        layer = source.CreateLayer(
+            table, reference if geometry_type != ogr.wkbNone else None, geometry_type, ["FID=objectid"]
+        )
+
+        for field, field_type in details["fields"].items():
+            layer.CreateField(ogr.FieldDefn(field, field_type))
+
+        definition = layer.GetLayerDefn()
+        counts[table] = max(int(rows * details["ratio"]), 1)
+
+        layer.StartTransaction()
+
+        for _ in range(counts[table]):
+            feature = ogr.Feature(definition)
+
+            for field, field_type in details["fields"].items():
+                feature.SetField(field, _create_value(field_type, generator))
+
+            if geometry_type != ogr.wkbNone:
+                feature.SetGeometry(ogr.CreateGeometryFromWkt(_create_geometry(details["geometry_type"], generator)))
+
+            layer.CreateFeature(feature)
+
+        layer.CommitTransaction()
+
+    now = datetime.now().strftime("%Y/%m/%d %H:%M:%S")
+
+    _create_table(
+        source,
+        "meta.agolitems",
+        {"TABLENAME": ogr.OFTString, "AGOL_PUBLISHED_NAME": ogr.OFTString, "GEOMETRY_TYPE": ogr.OFTString},
+        [[f"SGID.{table.upper()}", details["title"], details["geometry_type"]] for table, details in TABLES.items()],
+    )
+    _create_table(
+        source,
+        "meta.changedetection",
+        {"TABLE_NAME": ogr.OFTString, "LAST_MODIFIED": ogr.OFTDateTime},
+        [[f"SGID.{table.upper()}", now] for table in TABLES],
+    )
+
+    source = None
+
+    return counts
+
+
+def run(source, counts, workers=1):
+    """syncs the source into the destination with the real pipeline and times each phase
+    source: the ogr source that CLOUDB_SOURCE points to
+    counts: dictionary of schema.table to the number of rows from create_source
+    workers: the number of tables to sync at the same time
+    returns: dictionary of phase timings, per table throughput, and totals
+    """
+    #: config reads the connections when it is imported so it can only be imported once the environment is set
+    from . import catalog, config, connect, index
+    from . import main as cloudb
+
+    phases = {}
+
+    start_seconds = perf_counter()
+    snapshot = cloudb.get_table_meta()
+    phases["meta"] = perf_counter() - start_seconds
+
+    destination_tables = {}
+
+    for table in counts:
+        schema_name, table_name = table.split(".")
+        destination_tables[table] = f"{schema_name}.{snapshot.tables[schema_name][table_name]['title']}"
+
+    with connect(config.DBO_CONNECTION) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("CREATE EXTENSION IF NOT EXISTS postgis")
+            cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+
+            for table in destination_tables.values():
+                cursor.execute(f"CREATE SCHEMA IF NOT EXISTS {table.split('.')[0]}")
+                cursor.execute(f"DROP TABLE IF EXISTS {table}")
+
+    start_seconds = perf_counter()
+    cloudb._populate_table_cache(source)
+    layer_schema_map = cloudb._get_tables_with_fields(source, [])
+    phases["discover"] = perf_counter() - start_seconds
+
+    catalog.invalidate(config.format_ogr_connection(config.DBO_CONNECTION))
+
+    start_seconds = perf_counter()
+    cloudb._get_destination_catalog()
+    phases["destination_catalog"] = perf_counter() - start_seconds
+
+    start_seconds = perf_counter()
+    summary = cloudb._sync_tables(layer_schema_map, snapshot.tables, False, workers)
+    phases["sync"] = perf_counter() - start_seconds
+
+    #: every index was built with its table so this measures the diff
+    start_seconds = perf_counter()
+    index.sync_indexes(
+        {layer: layer for layer in index.INDEXES},
+        config.DBO_CONNECTION,
+        config.SESSION_SETTINGS["index"],
+        workers=workers,
+        concurrently=True,
+    )
+    phases["index"] = perf_counter() - start_seconds
+
+    tables = {}
+    failed = dict(summary["failed"])
+
+    with connect(config.DBO_CONNECTION) as conn:
+        with conn.cursor() as cursor:
+            for table, expected in counts.items():
+                destination_table = destination_tables[table]
+
+                cursor.execute(
+                    "SELECT to_regclass(%s) IS NOT NULL, coalesce(pg_total_relation_size(to_regclass(%s)), 0)",
+                    (destination_table, destination_table),
+                )
+                exists, size = cursor.fetchone()
+                rows = 0
+
+                #: the throughput is measured from the rows that were published, not the rows that were generated
+                if exists:
+                    cursor.execute(f"SELECT count(*) FROM {destination_table}")
+                    rows = cursor.fetchone()[0]
+
+                if rows != expected and table not in failed:
+                    failed[table] = f"{destination_table} has {rows} rows but {expected} were generated"
+
+                result = summary["tables"].get(table, {})
+                timings = result.get("timings") or {}
+                seconds = sum(timings.values())
+
+                tables[table] = {
+                    "loader": result.get("loader"),
+                    "profile": result.get("profile"),
+                    "weight": result.get("weight"),
+                    "rows": rows,
+                    "bytes": size,
+                    "timings": timings,
+                    "rows_per_second": rows / seconds if seconds else None,
+                    "mb_per_second": size / 10**6 / seconds if seconds else None,
+                }
+
+    rows = sum(table["rows"] for table in tables.values())
+    size = sum(table["bytes"] for table in tables.values())
+
+    return {
+        "workers": workers,
+        "phases": phases,
+        "tables": tables,
+        "failed": failed,
+        "totals": {
+            "rows": rows,
+            "bytes": size,
+            "seconds": sum(phases.values()),
+            "rows_per_second": rows / phases["sync"],
+            "mb_per_second": size / 10**6 / phases["sync"],
+        },
+    }
+
+
+def main():
+    """Main entry point for the benchmark. Creates the source, points cloudb at it, and prints the results."""
+    args = docopt(__doc__)
+
+    rows = int(args["--rows"])
+    source = Path(args["--source"]).resolve()
+    working_directory = Path(mkdtemp(prefix="cloudb-benchmark-"))
+    secrets_file = working_directory / "connection"
+
+    secrets_file.write_text(
+        json.dumps(
+            {
+                "host": args["--host"],
+                "pgPassword": args["--password"],
+                "adminPassword": args["--password"],
+                "publicPassword": args["--password"],
+                "srcHost": "",
+                "srcPassword": "",
+            }
+        ),
+        encoding="utf-8",
+    )
+
+    #: workers are spawned so they inherit these instead of the values of this process
+    os.environ["CLOUDB_SECRETS_FILE"] = str(secrets_file)
+    os.environ["CLOUDB_CACHE_DIRECTORY"] = str(working_directory / "cache")
+    os.environ["CLOUDB_STATE"] = str(working_directory / "state")
+    os.environ["CLOUDB_SOURCE"] = str(source)
+
+    logging.info("creating %s", source)
+    start_seconds = perf_counter()
+    counts = create_source(source, rows, int(args["--seed"]))
+    generate_seconds = perf_counter() - start_seconds
+
+    workers = max(int(args["--workers"]), 1)
+    os.environ["CLOUDB_LOADER"] = args["--loader"]
+
+    if args["--calibrate"]:
+        results = {"profiles": {}, "failed": {}}
+        measurements = []
+
+        for profile in profiles.get_profiles():
+            os.environ["CLOUDB_LOAD_PROFILE"] = profile["name"]
+
+            profile_results = run(str(source), counts, workers)
+            results["profiles"][profile["name"]] = profile_results
+            results["failed"].update(profile_results["failed"])
+
+            for name, table in profile_results["tables"].items():
+                if name not in profile_results["failed"]:
+                    measurements.append((table["weight"], profile["name"], table["rows_per_second"]))
+
+        del os.environ["CLOUDB_LOAD_PROFILE"]
+
+        results["calibrated"] = profiles.calibrate(measurements)
+        Path(args["--calibrate"]).write_text(json.dumps(results["calibrated"], indent=2), encoding="utf-8")
+    else:
+        if args["--profile"]:
+            os.environ["CLOUDB_LOAD_PROFILE"] = args["--profile"]
+
+        results = run(str(source), counts, workers)
+
+    results.setdefault("phases", {})["generate"] = generate_seconds
+
+    if args["--loader"] == "native":
+        #: sql server repairs the shapes as the native loader reads them but a geopackage cannot
+        results["notes"] = [
+            f"the native loader does not repair the {INVALID_RATIO:.0%} invalid shapes in the geopackage "
+            "so it does less work than gdal -makevalid"
+        ]
+        logging.warning("%s", results["notes"][0])
+    results["source_bytes"] = source.stat().st_size
+
+    output = json.dumps(results, indent=2, sort_keys=True)
+
+    if args["--output"]:
+        Path(args["--output"]).write_text(output, encoding="utf-8")
+    else:
+        sys.stdout.write(output + "\n")
+
+    if results["failed"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
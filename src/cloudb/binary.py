@@ -0,0 +1,298 @@
+#!/usr/bin/env python
+# * coding: utf8 *
+"""
+binary.py
+A module that encodes source rows in the postgres binary copy format
+"""
+
+import struct
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from functools import partial
+
+HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack(">ii", 0, 0)
+TRAILER = struct.pack(">h", -1)
+NULL = struct.pack(">i", -1)
+
+#: the rows to fetch from the source at a time
+BATCH_SIZE = 5000
+#: the bytes postgres asks for at a time
+READ_SIZE = 2**20
+
+EPOCH = date(2000, 1, 1)
+EPOCH_TIME = datetime(2000, 1, 1, tzinfo=timezone.utc)
+
+#: the ewkb flag that the srid follows the geometry type
+SRID_FLAG = 0x20000000
+#: the envelope bytes of a geopackage shape for each envelope indicator
+GEOPACKAGE_ENVELOPES = [0, 32, 48, 48, 64]
+
+
+def _encode_struct(code, value):
+    """packs a number in network byte order"""
+    return struct.pack(code, value)
+
+
+def _encode_boolean(value):
+    """encodes a boolean or a 0 or 1 bit"""
+    return b"\x01" if value else b"\x00"
+
+
+def _encode_text(value):
+    """encodes a string as utf8"""
+    return str(value).encode("utf-8")
+
+
+def _encode_numeric(value):
+    """encodes a decimal as base 10000 digits with its weight, sign, and scale"""
+    value = value if isinstance(value, Decimal) else Decimal(str(value))
+
+    if value.is_nan():
+        return struct.pack(">hhHh", 0, 0, 0xC000, 0)
+
+    sign, digits, exponent = value.as_tuple()
+    scale = max(-exponent, 0)
+    text = "".join(str(digit) for digit in digits) + "0" * max(exponent, 0)
+    text = text.rjust(scale + 1, "0")
+
+    integer = text[: len(text) - scale]
+    fraction = text[len(text) - scale :]
+
+    integer = integer.rjust(-(-len(integer) // 4) * 4, "0")
+    fraction = fraction.ljust(-(-len(fraction) // 4) * 4, "0")
+
+    groups = [int(integer[i : i + 4]) for i in range(0, len(integer), 4)]
+    weight = len(groups) - 1
+    groups += [int(fraction[i : i + 4]) for i in range(0, len(fraction), 4)]
+
+    while groups and groups[0] == 0:
+        groups.pop(0)
+        weight -= 1
+
+    while groups and groups[-1] == 0:
+        groups.pop()
+
+    if not groups:
+        weight = 0
+
+    return struct.pack(f">hhHh{len(groups)}h", len(groups), weight, 0x4000 if sign else 0, scale, *groups)
+
+
+def _encode_date(value):
+    """encodes a date as the days since 2000"""
+    if isinstance(value, str):
+        value = date.fromisoformat(value[:10])
+    elif isinstance(value, datetime):
+        value = value.date()
+
+    return struct.pack(">i", (value - EPOCH).days)
+
+
+def _encode_timestamp(value):
+    """encodes a time as the microseconds since 2000. times without a zone are utc"""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    elif not isinstance(value, datetime):
+        value = datetime(value.year, value.month, value.day)
+
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+
+    delta = value - EPOCH_TIME
+
+    return struct.pack(">q", (delta.days * 86400 + delta.seconds) * 10**6 + delta.microseconds)
+
+
+#: the encoder for each postgres type without its size
+ENCODERS = {
+    "boolean": _encode_boolean,
+    "smallint": partial(_encode_struct, ">h"),
+    "integer": partial(_encode_struct, ">i"),
+    "bigint": partial(_encode_struct, ">q"),
+    "real": partial(_encode_struct, ">f"),
+    "double precision": partial(_encode_struct, ">d"),
+    "numeric": _encode_numeric,
+    "varchar": _encode_text,
+    "date": _encode_date,
+    "timestamp with time zone": _encode_timestamp,
+}
+
+
+def get_encoder(column_type):
+    """gets the encoder for a postgres column type, e.g. numeric(38, 8)
+    returns: function that encodes a value or None when the type is not supported
+    """
+    return ENCODERS.get(column_type.split("(")[0].strip())
+
+
+def from_geopackage(blob):
+    """strips the geopackage header and envelope from a shape
+    returns: wkb
+    """
+    flags = blob[3]
+
+    return bytes(blob[8 + GEOPACKAGE_ENVELOPES[(flags >> 1) & 0x07] :])
+
+
+def _get_length(wkb, offset=0):
+    """the number of bytes of the two dimensional wkb shape that starts at an offset"""
+    order = "<" if wkb[offset] == 1 else ">"
+    geometry_type, count = struct.unpack_from(f"{order}II", wkb, offset + 1)
+
+    if geometry_type == 1:
+        return 21
+
+    if geometry_type == 2:
+        return 9 + 16 * count
+
+    position = offset + 9
+
+    if geometry_type == 3:
+        for _ in range(count):
+            points = struct.unpack_from(f"{order}I", wkb, position)[0]
+            position += 4 + 16 * points
+    elif geometry_type in (4, 5, 6, 7):
+        for _ in range(count):
+            position += _get_length(wkb, position)
+    else:
+        raise ValueError(f"unsupported wkb type {geometry_type}")
+
+    return position - offset
+
+
+def extract(wkb, multi):
+    """keeps the parts of a geometry collection that a multi type holds, e.g. the polygons of a repaired shape
+    without the lines and points it collapsed to
+    wkb: a geometry collection
+    multi: the wkb type of the column
+    returns: wkb of the multi type
+    """
+    order = "<" if wkb[0] == 1 else ">"
+    count = struct.unpack_from(f"{order}I", wkb, 5)[0]
+    position = 9
+    parts = []
+
+    for _ in range(count):
+        length = _get_length(wkb, position)
+        part = wkb[position : position + length]
+        part_order = "<" if part[0] == 1 else ">"
+        part_type = struct.unpack_from(f"{part_order}I", part, 1)[0]
+
+        if part_type == multi - 3:
+            parts.append(part)
+        elif part_type == multi:
+            nested = 9
+
+            for _ in range(struct.unpack_from(f"{part_order}I", part, 5)[0]):
+                nested_length = _get_length(part, nested)
+                parts.append(part[nested : nested + nested_length])
+                nested += nested_length
+
+        position += length
+
+    return wkb[:1] + struct.pack(f"{order}II", multi, len(parts)) + b"".join(parts)
+
+
+def to_ewkb(wkb, srid, multi=None):
+    """adds the srid to a wkb shape so postgis accepts it for a column with an srid
+    wkb: the shape from the source
+    srid: the srid of the column
+    multi: the wkb type of the column when it is a multi type so single parts are promoted to it
+    returns: ewkb
+    """
+    wkb = bytes(wkb)
+    order = "<" if wkb[0] == 1 else ">"
+    geometry_type = struct.unpack_from(f"{order}I", wkb, 1)[0]
+
+    if multi is not None and geometry_type == 7:
+        wkb = extract(wkb, multi)
+        geometry_type = multi
+
+    if multi is not None and geometry_type == multi - 3:
+        wkb = wkb[:1] + struct.pack(f"{order}II", multi, 1) + wkb
+        geometry_type = multi
+
+    #: a shape that was repaired to a lower dimension, e.g. a polygon that collapsed to a line, has no part
+    #: the column holds so it is empty the way gdal -makevalid drops it
+    if multi is not None and geometry_type != multi:
+        wkb = wkb[:1] + struct.pack(f"{order}II", multi, 0)
+        geometry_type = multi
+
+    return wkb[:1] + struct.pack(f"{order}II", geometry_type | SRID_FLAG, srid) + wkb[5:]
+
+
+def get_geometry_encoder(srid, multi=None, geopackage=False):
+    """gets the encoder for the shape column
+    srid: the srid of the column
+    multi: the wkb type of the column when it is a multi type
+    geopackage: true when the shapes are geopackage blobs instead of wkb
+    returns: function that encodes a value
+    """
+    if geopackage:
+        return lambda value: to_ewkb(from_geopackage(value), srid, multi)
+
+    return lambda value: to_ewkb(value, srid, multi)
+
+
+def encode_row(buffer, values, encoders):
+    """appends a row to the copy buffer
+    buffer: bytearray
+    values: the values of the row in column order
+    encoders: the encoder for each column
+    """
+    buffer += struct.pack(">h", len(encoders))
+
+    for value, encode in zip(values, encoders, strict=True):
+        if value is None:
+            buffer += NULL
+
+            continue
+
+        data = encode(value)
+        buffer += struct.pack(">i", len(data))
+        buffer += data
+
+
+class CopyStream:
+    """a file like object for copy_expert that encodes the rows of a cursor as they are read so the memory
+    it holds is one batch of rows and one read no matter how big the table is. with flagged rows the last value of
+    each row is not copied and the rows where it is true are counted as repaired
+    """
+
+    def __init__(self, cursor, encoders, batch_size=BATCH_SIZE, flagged=False):
+        self.cursor = cursor
+        self.encoders = encoders
+        self.batch_size = batch_size
+        self.flagged = flagged
+        self.buffer = bytearray(HEADER)
+        self.rows = 0
+        self.repaired = 0
+        self.done = False
+
+    def read(self, size=-1):
+        """returns: up to size bytes of the copy data or an empty bytes when it is done"""
+        while not self.done and (size < 0 or len(self.buffer) < size):
+            rows = self.cursor.fetchmany(self.batch_size)
+
+            if not rows:
+                self.buffer += TRAILER
+                self.done = True
+
+                break
+
+            for row in rows:
+                if self.flagged:
+                    self.repaired += 1 if row[-1] else 0
+                    row = row[:-1]
+
+                encode_row(self.buffer, row, self.encoders)
+
+            self.rows += len(rows)
+
+        if size < 0:
+            size = len(self.buffer)
+
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+
+        return data
@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+# * coding: utf8 *
+"""
+catalog.py
+A module that discovers the tables in a database and caches them on disk between runs
+"""
+
+import json
+import logging
+import os
+from hashlib import sha256
+from pathlib import Path
+from tempfile import gettempdir
+from time import time
+
+from . import connect
+
+CACHE_DIRECTORY = Path(os.getenv("CLOUDB_CACHE_DIRECTORY", Path(gettempdir()) / "cloudb"))
+TTL = int(os.getenv("CLOUDB_CACHE_TTL", "3600"))
+
+
+def _get_path(connection_string):
+    """a method to get the cache file for a connection without putting credentials in the file name"""
+    key = sha256(connection_string.encode("utf-8")).hexdigest()
+
+    return CACHE_DIRECTORY / f"{key}.json"
+
+
+def get_tables(connection_string):
+    """gets the cached tables for a connection
+    connection_string: string of the db the tables are in
+    returns: dictionary of schema.table names to their details or None when there is no fresh cache
+    """
+    path = _get_path(connection_string)
+
+    try:
+        cache = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        logging.debug("cache miss")
+
+        return None
+
+    if time() - cache["created"] > TTL:
+        logging.debug("cache expired")
+
+        return None
+
+    logging.debug("cache hit")
+
+    return cache["tables"]
+
+
+def set_tables(connection_string, tables):
+    """caches the tables for a connection
+    connection_string: string of the db the tables are in
+    tables: dictionary of schema.table names to their details or an iterable of schema.table names
+    returns: the tables as a dictionary
+    """
+    if not isinstance(tables, dict):
+        tables = {table: {} for table in tables}
+
+    path = _get_path(connection_string)
+
+    try:
+        CACHE_DIRECTORY.mkdir(parents=True, exist_ok=True)
+
+        #: write to a file per process and swap it in so concurrent runs never read a partial file
+        temp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        temp_path.write_text(json.dumps({"created": time(), "tables": tables}, sort_keys=True), encoding="utf-8")
+        temp_path.replace(path)
+    except OSError as error:
+        logging.warning("unable to cache tables: %s", error)
+
+    return tables
+
+
+def invalidate(connection_string):
+    """removes the cached tables for a connection after the tables in it change
+    connection_string: string of the db that changed
+    """
+    logging.debug("invalidating table cache")
+
+    _get_path(connection_string).unlink(missing_ok=True)
+
+
+def query_destination(connection, exclude_schemas):
+    """gets every table in a postgis database with a single catalog query instead of opening each layer
+    connection: dict with connection information
+    exclude_schemas: array of schemas to leave out
+    returns: dictionary of schema.table to the geometry type, estimated row count, and column names
+    """
+    sql = """SELECT
+    n.nspname,
+    c.relname,
+    g.type,
+    greatest(c.reltuples, 0)::bigint,
+    array_agg(a.attname::text ORDER BY a.attnum)
+FROM
+    pg_class c
+INNER JOIN pg_namespace n ON
+    n.oid = c.relnamespace
+INNER JOIN pg_attribute a ON
+    a.attrelid = c.oid
+    AND a.attnum > 0
+    AND NOT a.attisdropped
+LEFT JOIN geometry_columns g ON
+    g.f_table_schema = n.nspname
+    AND g.f_table_name = c.relname
+WHERE
+    c.relkind IN ('r', 'p')
+    AND n.nspname <> ALL(%s)
+    AND n.nspname !~ '^pg_'
+GROUP BY
+    n.nspname,
+    c.relname,
+    g.type,
+    c.reltuples;"""
+
+    tables = {}
+
+    with connect(connection) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(sql, (["public", "information_schema", *exclude_schemas],))
+
+            for schema_name, table_name, geometry_type, rows, columns in cursor.fetchall():
+                tables[f"{schema_name.lower()}.{table_name.lower()}"] = {
+                    "geometry_type": geometry_type,
+                    "rows": rows,
+                    "columns": columns,
+                }
+
+    logging.debug("found %s tables in the destination", len(tables))
+
+    return tables
+
+
+def query_column_types(connection, tables):
+    """gets the column types of tables with a single catalog query
+    connection: dict with connection information
+    tables: array of schema.table
+    returns: dictionary of schema.table to a dictionary of column to the formatted type
+    """
+    sql = """SELECT
+    n.nspname || '.' || c.relname,
+    a.attname,
+    format_type(a.atttypid, a.atttypmod)
+FROM
+    pg_class c
+INNER JOIN pg_namespace n ON
+    n.oid = c.relnamespace
+INNER JOIN pg_attribute a ON
+    a.attrelid = c.oid
+    AND a.attnum > 0
+    AND NOT a.attisdropped
+WHERE
+    c.relkind IN ('r', 'p')
+    AND n.nspname || '.' || c.relname = ANY(%s);"""
+
+    types = {}
+
+    with connect(connection) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(sql, (list(tables),))
+
+            for table, column, column_type in cursor.fetchall():
+                types.setdefault(table, {})[column] = column_type
+
+    return types
+
+
+def diff_column_types(desired, actual):
+    """finds the columns whose type is not the desired type so unchanged columns are not altered
+    desired: dictionary of schema.table to a dictionary of column to the type it should have
+    actual: dictionary from query_column_types
+    returns: dictionary of schema.table to a dictionary of column to the type to change it to. columns and tables
+    that are not in the destination are left out
+    """
+    changes = {}
+
+    for table, columns in desired.items():
+        existing = actual.get(table, {})
+
+        for column, column_type in columns.items():
+            if column not in existing or existing[column] == column_type:
+                continue
+
+            changes.setdefault(table, {})[column] = column_type
+
+    return changes
+
+
+def format_column_types(types):
+    """formats column types for the COLUMN_TYPES layer creation option of the gdal postgres driver so the load
+    table is created with them instead of altered after the load
+    types: dictionary of column to postgres type, e.g. from schema.get_integer_types
+    """
+    return ",".join(f"{column}={data_type}" for column, data_type in types.items())
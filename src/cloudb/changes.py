@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# * coding: utf8 *
+"""
+changes.py
+A module that builds the sql that applies the row level differences between a staging table and a destination table
+"""
+
+#: true when the key is unique and not null in both snapshots so rows can be matched on it
+UNIQUE_KEYS = """SELECT
+    (SELECT count(*) = count(DISTINCT sync_key) FROM source_rows)
+    AND (SELECT count(*) = count(DISTINCT sync_key) FROM destination_rows);"""
+
+DROP_ROWS = "DROP TABLE source_rows, destination_rows"
+
+
+def get_hash(columns):
+    """the expression that fingerprints the content of a row"""
+    return f"md5(ROW({', '.join(columns)})::text)"
+
+
+def get_row_statements(staging_table, table, columns, key=None):
+    """the statements that snapshot the key and hash of the rows of both tables in temp tables.
+    without a key rows are matched by their hash and the occurrence of that hash so duplicate rows are kept in balance
+    staging_table: string schema.table that the source was extracted into
+    table: string schema.table in the destination
+    columns: array of the quoted columns without the xid
+    key: the quoted stable unique column or None
+    returns: array of sql
+    """
+    row_hash = get_hash(columns)
+
+    if key is None:
+        select = f"xid, {row_hash} AS row_hash, row_number() OVER (PARTITION BY {row_hash}) AS occurrence"
+    else:
+        select = f"xid, {key} AS sync_key, {row_hash} AS row_hash"
+
+    return [
+        f"CREATE TEMP TABLE {name} ON COMMIT DROP AS\nSELECT {select}\nFROM {source};"
+        for name, source in (("source_rows", staging_table), ("destination_rows", table))
+    ]
+
+
+def get_change_statements(staging_table, table, columns, key=None):
+    """the statements that delete, update, and insert the rows that differ once the rows are snapshot.
+    without a key a changed row is a delete and an insert
+    staging_table: string schema.table that the source was extracted into
+    table: string schema.table in the destination
+    columns: array of the quoted columns without the xid
+    key: the quoted stable unique column or None
+    returns: dictionary of deleted, updated, and inserted to the sql for each in the order they run
+    """
+    column_list = ", ".join(columns)
+    staging_columns = ", ".join(f"st.{column}" for column in columns)
+
+    if key is None:
+        match = "s.row_hash = d.row_hash AND s.occurrence = d.occurrence"
+    else:
+        match = "s.sync_key = d.sync_key"
+
+    statements = {
+        "deleted": f"""DELETE FROM {table} t USING destination_rows d
+WHERE t.xid = d.xid
+AND NOT EXISTS (SELECT 1 FROM source_rows s WHERE {match});"""
+    }
+
+    if key is not None:
+        statements["updated"] = f"""UPDATE {table} t SET ({column_list}) = ({staging_columns})
+FROM {staging_table} st
+INNER JOIN source_rows s ON s.xid = st.xid
+INNER JOIN destination_rows d ON d.sync_key = s.sync_key
+WHERE t.xid = d.xid AND s.row_hash <> d.row_hash;"""
+
+    statements["inserted"] = f"""INSERT INTO {table} ({column_list})
+SELECT {staging_columns} FROM {staging_table} st
+INNER JOIN source_rows s ON s.xid = st.xid
+WHERE NOT EXISTS (SELECT 1 FROM destination_rows d WHERE {match});"""
+
+    return statements
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+# * coding: utf8 *
+"""
+chunks.py
+A module that splits a large table into key ranges that load at the same time and retry on their own
+"""
+
+import logging
+import math
+from concurrent.futures import ThreadPoolExecutor
+from time import sleep
+
+#: the source column the ranges are taken over
+KEY = "objectid"
+
+
+def get_ranges(low, high, count):
+    """splits the keys of a table into ranges of about the same width
+    low: the smallest key or None when the table is empty or could not be inspected
+    high: the largest key
+    count: the number of ranges
+    returns: array of tuples with 0: the first key, 1: the key after the last, or [None] to load the table at once
+    """
+    if low is None or high is None or count <= 1:
+        return [None]
+
+    low = int(low)
+    high = int(high)
+    width = max(math.ceil((high - low + 1) / count), 1)
+
+    return [(start, min(start + width, high + 1)) for start in range(low, high + 1, width)]
+
+
+def get_where(chunk):
+    """the filter for the rows of a range. a range that starts and ends on the same key has no rows"""
+    start, end = chunk
+
+    return f"{KEY} >= {start} AND {KEY} < {end}"
+
+
+def get_append_options(options, sql, chunk, table):
+    """the vector translate options that append one range of rows to a table that was already created
+    options: array of options for loading the whole table
+    sql: string select statement for the whole table
+    chunk: tuple from get_ranges
+    table: string schema.table that was created. ogr looks up the layer to append to by this name since the
+    SCHEMA layer creation option does not apply to an existing layer
+    returns: array of options
+    """
+    append_options = []
+    skip = False
+
+    for position, option in enumerate(options):
+        if skip:
+            skip = False
+
+            continue
+
+        #: layer creation options only apply when the table is created
+        if option == "-lco":
+            skip = True
+
+            continue
+
+        if option == "-nln" and position + 1 < len(options):
+            append_options += ["-nln", table]
+            skip = True
+
+            continue
+
+        append_options.append(option)
+
+    return [*append_options, "-append", "-sql", f"{sql} WHERE {get_where(chunk)}"]
+
+
+def _load(target, item, position, retries, retry_delay, loaded=None):
+    """loads one chunk and tries it again with a growing delay until it runs out of attempts
+    returns: tuple with 0: the number of retries, 1: the last error or None
+    """
+    for attempt in range(retries):
+        try:
+            logging.debug("- attempt %d/%d for chunk %d", attempt + 1, retries, position)
+            target(item)
+
+            if loaded is not None:
+                loaded(position)
+
+            return attempt, None
+        except Exception as ex:
+            logging.warning("- chunk %d attempt %d failed: %s", position, attempt + 1, ex)
+
+            if attempt == retries - 1:
+                return attempt, ex
+
+            logging.info("- retrying chunk %d in %d seconds...", position, retry_delay)
+            sleep(retry_delay)
+            retry_delay *= 2
+
+
+def load(items, target, retries=3, retry_delay=5, workers=1, loaded=None):
+    """loads the chunks of a table, up to workers at the same time. each chunk must load in its own transaction
+    so a failed one can be loaded again without duplicating rows
+    items: array of the arguments for each chunk
+    target: function that loads one chunk
+    retries: the attempts for each chunk
+    retry_delay: the seconds to wait before the first retry of a chunk. it doubles for each retry after
+    workers: the number of chunks to load at the same time
+    loaded: function called with the position of each chunk once it loads, e.g. to checkpoint it
+    returns: tuple with 0: the number of retries, 1: the error of a chunk that failed every attempt or None
+    """
+    retries = max(retries, 1)
+
+    if workers <= 1 or len(items) <= 1:
+        total = 0
+
+        for position, item in enumerate(items):
+            attempts, error = _load(target, item, position, retries, retry_delay, loaded)
+            total += attempts
+
+            if error is not None:
+                return total, error
+
+        return total, None
+
+    total = 0
+    error = None
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="cloudb-chunk") as executor:
+        futures = [
+            executor.submit(_load, target, item, position, retries, retry_delay, loaded)
+            for position, item in enumerate(items)
+        ]
+
+        for future in futures:
+            attempts, chunk_error = future.result()
+            total += attempts
+
+            if chunk_error is not None and error is None:
+                error = chunk_error
+
+                #: the table fails with the chunk so the chunks that have not started are not worth loading
+                for pending in futures:
+                    pending.cancel()
+
+    return total, error
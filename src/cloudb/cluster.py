@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+# * coding: utf8 *
+"""
+cluster.py
+A module that writes the rows of a table in space filling curve order so nearby shapes share pages
+"""
+
+import logging
+
+from . import connect
+from .index import MAX_IDENTIFIER_LENGTH, PARCEL_LAYERS
+
+#: ends like a shadow table so a leftover one is not trimmed and never matches the name of a shadow table it reads
+ORDERED_SUFFIX = "_ordered_shadow"
+
+#: orders rows by the postgis geometry sort which follows a hilbert curve
+HILBERT = "hilbert"
+#: orders rows by the geohash of a point on each shape
+GEOHASH = "geohash"
+
+COMMENT_PREFIX = "cloudb:cluster="
+
+CLUSTERS = {
+    "location.address_points": HILBERT,
+    "transportation.roads": HILBERT,
+    "cadastre.land_ownership": HILBERT,
+}
+
+for county in PARCEL_LAYERS:
+    CLUSTERS[f"cadastre.{county}_county_parcels"] = HILBERT
+
+
+def get_order(mode, column="shape"):
+    """the sort expression for a clustering mode"""
+    if mode == HILBERT:
+        return column
+
+    if mode == GEOHASH:
+        return (
+            f"CASE WHEN ST_IsEmpty({column}) THEN NULL "
+            f"ELSE ST_GeoHash(ST_Transform(ST_PointOnSurface({column}), 4326)) END"
+        )
+
+    raise ValueError(f"unknown cluster mode {mode}")
+
+
+def get_ordered_name(table):
+    """a method to get the table that the ordered rows of a table are written to before it is swapped in
+    table: string schema.table
+    returns: string schema.table
+    """
+    schema_name, table_name = table.split(".")
+
+    return f"{schema_name}.{table_name[: MAX_IDENTIFIER_LENGTH - len(ORDERED_SUFFIX)]}{ORDERED_SUFFIX}"
+
+
+def get_statements(table, target, mode, sequence=None, unlogged=False):
+    """the sql that writes the rows of a table to a new table in order. the new table has no indexes other than
+    its primary key so the rows are written once and the indexes are built after from the ordered rows
+    table: schema.table to read
+    target: schema.table to create
+    mode: HILBERT or GEOHASH
+    sequence: the sequence of the xid that moves to the new table or None if the table has no xid
+    unlogged: create the new table without the write ahead log, e.g. for a staging table
+    returns: array of sql statements
+    """
+    statements = [
+        f"DROP TABLE IF EXISTS {target}",
+        f"CREATE {'UNLOGGED ' if unlogged else ''}TABLE {target} AS "
+        f"SELECT * FROM {table} ORDER BY {get_order(mode)} NULLS LAST",
+    ]
+
+    if sequence is not None:
+        statements.append(f"ALTER TABLE {target} ADD PRIMARY KEY (xid)")
+        statements.append(f"ALTER TABLE {target} ALTER COLUMN xid SET DEFAULT nextval('{sequence}')")
+        statements.append(f"ALTER SEQUENCE {sequence} OWNED BY {target}.xid")
+
+    statements.append(f"COMMENT ON TABLE {target} IS '{COMMENT_PREFIX}{mode}'")
+    statements.append(f"ANALYZE {target}")
+
+    return statements
+
+
+def get_state(cursor, table):
+    """gets the mode a table was last clustered with
+    returns: HILBERT, GEOHASH, or None if it is not clustered or changed since
+    """
+    cursor.execute("SELECT obj_description(to_regclass(%s), 'pg_class')", (table,))
+    comment = cursor.fetchone()[0]
+
+    if comment is None or not comment.startswith(COMMENT_PREFIX):
+        return None
+
+    return comment[len(COMMENT_PREFIX) :]
+
+
+def mark_changed(cursor, table):
+    """clears the clustering state after rows are changed in place so the next cluster run orders it again"""
+    if get_state(cursor, table) is not None:
+        cursor.execute(f"COMMENT ON TABLE {table} IS NULL")
+
+
+def cluster_tables(tables, connection, settings=None, force=False, publish=None):
+    """writes the configured tables in clustered order unless they are already clustered with the same mode.
+    the ordered rows are written to a new table that readers do not see until it is published
+    tables: dictionary of the schema.table the clustering is configured for to the schema.table to rewrite
+    connection: dict with connection information
+    settings: dict of session settings, e.g. work_mem, for the sort
+    force: rewrite even if the recorded state matches, e.g. for a freshly loaded table
+    publish: function called with the configured table, the ordered table, and the table it replaces that builds
+    the indexes of the ordered table and swaps it in
+    returns: dictionary of table to clustered, current, or missing
+    """
+    results = {}
+
+    for layer, table in tables.items():
+        mode = CLUSTERS.get(layer)
+
+        if mode is None:
+            continue
+
+        target = get_ordered_name(table)
+
+        with connect(connection, settings) as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT to_regclass(%s) IS NOT NULL", (table,))
+
+                if not cursor.fetchone()[0]:
+                    logging.info("- skipping clustering %s since it does not exist", table)
+                    results[table] = "missing"
+
+                    continue
+
+                if not force and get_state(cursor, table) == mode:
+                    logging.debug("- %s is already clustered by %s", table, mode)
+                    results[table] = "current"
+
+                    continue
+
+                logging.info("- clustering %s by %s", table, mode)
+
+                cursor.execute(
+                    """SELECT
+    (SELECT pg_get_serial_sequence(%s, 'xid') WHERE EXISTS (
+        SELECT 1 FROM pg_attribute WHERE attrelid = to_regclass(%s) AND attname = 'xid' AND NOT attisdropped
+    )),
+    relpersistence = 'u'
+FROM
+    pg_class
+WHERE
+    oid = to_regclass(%s);""",
+                    (table, table, table),
+                )
+                sequence, unlogged = cursor.fetchone()
+
+                for sql in get_statements(table, target, mode, sequence, unlogged):
+                    cursor.execute(sql)
+
+        if publish is not None:
+            publish(layer, target, table)
+
+        results[table] = "clustered"
+
+    return results
@@ -6,10 +6,11 @@ A module that holds configuration items
 """
 import json
 import logging
+import os
 from pathlib import Path
 from textwrap import dedent
 
-secrets_file = Path("/secrets/db/connection")
+secrets_file = Path(os.getenv("CLOUDB_SECRETS_FILE", "/secrets/db/connection"))
 local_secrets_file = Path(__file__).parent / "secrets" / "db" / "connection"
 secrets = {}
 
@@ -50,10 +51,21 @@ SCHEMAS = [
 ]
 
 EXCLUDE_SCHEMAS = ["sde", "meta"]
+STAGING_SCHEMA = "staging"
 EXCLUDE_FIELDS = ["objectid", "fid", "gdb_geomattr_data"]
 
 DB = "opensgid"
 
+#: postgres settings for each phase of a sync. they apply to the transaction of the pooled connection
+SESSION_SETTINGS = {
+    "schema": {"statement_timeout": "1h", "lock_timeout": "1min"},
+    "cluster": {"statement_timeout": "2h", "lock_timeout": "10s", "work_mem": "256MB"},
+    "generalize": {"statement_timeout": "1h", "work_mem": "256MB"},
+    "index": {"statement_timeout": "2h", "maintenance_work_mem": "512MB", "max_parallel_maintenance_workers": 2},
+    "sync": {"statement_timeout": "1h", "work_mem": "64MB"},
+    "swap": {"statement_timeout": "1min", "lock_timeout": "10s"},
+}
+
 DBO = "postgres"
 
 ADMIN = {
@@ -124,7 +136,12 @@ def format_ogr_connection(connection):
 
 
 def get_source_connection():
-    """a method to format the sql server source data connection string"""
+    """a method to format the sql server source data connection string.
+    CLOUDB_SOURCE replaces it with any ogr source, e.g. the benchmark geopackage
+    """
+    if os.getenv("CLOUDB_SOURCE"):
+        return os.getenv("CLOUDB_SOURCE")
+
     return (
         "MSSQL:driver=ODBC Driver 17 for SQL Server;"
         f"server={SRC_CONNECTION['host']};"
@@ -133,3 +150,27 @@ def get_source_connection():
         f"PWD={SRC_CONNECTION['password']};"
         "trusted_connection=no;"
     )
+
+
+def get_loader():
+    """the engine that copies the source tables. CLOUDB_LOADER=native streams them with binary copy
+    and falls back to gdal for the tables it can not copy
+    """
+    return os.getenv("CLOUDB_LOADER", "gdal")
+
+
+def get_sinks():
+    """the file formats from sinks.SINKS that each loaded table is also published as, e.g.
+    CLOUDB_SINKS=geoparquet,flatgeobuf. none by default
+    """
+    return [sink.strip().lower() for sink in os.getenv("CLOUDB_SINKS", "").split(",") if sink.strip()]
+
+
+def get_sink_location():
+    """the local directory or gs://bucket/prefix the files are published to"""
+    return os.getenv("CLOUDB_SINK_LOCATION", "downloads")
+
+
+def is_sql_server_source():
+    """returns true when the source is the sql server sgid and can be queried with pyodbc"""
+    return get_source_connection().startswith("MSSQL:")
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# * coding: utf8 *
+"""
+generalize.py
+A module that builds simplified companion tables of heavy polygon layers for small scale maps
+"""
+
+import logging
+
+from . import connect
+from .index import MAX_IDENTIFIER_LENGTH, PARCEL_LAYERS
+
+#: the tolerances in meters for the companion tables of each layer
+GENERALIZATIONS = {
+    "cadastre.land_ownership": [10, 50, 250],
+    "boundaries.county_boundaries": [10, 100, 500],
+    "boundaries.municipal_boundaries": [10, 50, 250],
+}
+
+for county in PARCEL_LAYERS:
+    GENERALIZATIONS[f"cadastre.{county}_county_parcels"] = [5, 25]
+
+
+def get_name(layer, tolerance):
+    """a method to get the companion table of a layer at a tolerance
+    returns: string schema.table
+    """
+    schema_name, table_name = layer.split(".")
+    suffix = f"_generalized_{tolerance}m"
+
+    return f"{schema_name}.{table_name[: MAX_IDENTIFIER_LENGTH - len(suffix)]}{suffix}"
+
+
+def get_companions(layer):
+    """returns: array of the companion tables of a layer"""
+    return [get_name(layer, tolerance) for tolerance in GENERALIZATIONS.get(layer, [])]
+
+
+def is_companion(table):
+    """returns: true if the schema.table is a companion table of a configured layer"""
+    return any(table in get_companions(layer) for layer in GENERALIZATIONS)
+
+
+def get_statements(layer, tolerance, target, columns):
+    """the sql that creates a companion table with the shapes simplified without breaking their topology
+    layer: schema.table to simplify
+    tolerance: the distance in meters that vertices can move
+    target: schema.table to create
+    columns: array of tuples with 0: column name, 1: formatted type
+    returns: array of sql statements
+    """
+    select = ", ".join(
+        f'ST_SimplifyPreserveTopology("{name}", {tolerance})::{column_type} AS "{name}"'
+        if name == "shape"
+        else f'"{name}"'
+        for name, column_type in columns
+    )
+
+    statements = [
+        f"DROP TABLE IF EXISTS {target}",
+        f"CREATE TABLE {target} AS SELECT {select} FROM {layer}",
+    ]
+
+    if "xid" in [name for name, _ in columns]:
+        statements.append(f"ALTER TABLE {target} ADD PRIMARY KEY (xid)")
+
+    statements.append(f"CREATE INDEX ON {target} USING gist (shape)")
+    statements.append(f"ANALYZE {target}")
+
+    return statements
+
+
+def build(layer, tolerance, target, connection, settings=None):
+    """creates a companion table of a layer
+    layer: schema.table to simplify
+    tolerance: the distance in meters that vertices can move
+    target: schema.table to create, usually a shadow table that is swapped in after
+    connection: dict with connection information
+    settings: dict of session settings for the build
+    """
+    logging.info("- generalizing %s at %sm", layer, tolerance)
+
+    with connect(connection, settings) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                """SELECT
+    attname,
+    format_type(atttypid, atttypmod)
+FROM
+    pg_attribute
+WHERE
+    attrelid = to_regclass(%s)
+    AND attnum > 0
+    AND NOT attisdropped
+ORDER BY
+    attnum;""",
+                (layer,),
+            )
+
+            for sql in get_statements(layer, tolerance, target, cursor.fetchall()):
+                cursor.execute(sql)
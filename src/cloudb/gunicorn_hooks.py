@@ -0,0 +1,15 @@
+#!/usr/bin/env python
+# * coding: utf8 *
+"""
+gunicorn_hooks.py
+The gunicorn settings module for the server. gunicorn -c python:cloudb.gunicorn_hooks
+"""
+
+
+def post_worker_init(worker):
+    """continues an interrupted run once the single worker has loaded the app. it does not run when the
+    server module is imported so tests and the flask reloader do not start a sync
+    """
+    from .server import resume_schedule
+
+    resume_schedule()
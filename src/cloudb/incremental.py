@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+# * coding: utf8 *
+"""
+incremental.py
+A module that applies row level changes from a staging table instead of reloading the whole table
+"""
+
+import logging
+
+from . import changes, cluster, config, connect, schema
+from .index import PARCEL_LAYERS
+
+#: tables with a stable unique column. changed rows in these tables are updated in place.
+#: every other table, or a key that turns out not to be unique, is diffed on the row hash so a changed row is
+#: a delete and an insert
+KEYS = {"location.address_points": "utaddptid"}
+
+for county in PARCEL_LAYERS:
+    KEYS[f"cadastre.{county}_county_parcels"] = "parcel_id"
+
+
+def get_staging_name(schema_name, table):
+    """a method to get the staging table name for a destination table
+    returns: string table name in the staging schema
+    """
+    return f"{schema_name}_{table}"[: schema.MAX_IDENTIFIER_LENGTH]
+
+
+def create_staging_schema():
+    """creates the unlisted schema that source data is extracted into before it is diffed"""
+    with connect(config.DBO_CONNECTION) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(f"CREATE SCHEMA IF NOT EXISTS {config.STAGING_SCHEMA}")
+
+
+def table_exists(table):
+    """returns true if the schema.table exists in the destination"""
+    with connect(config.DBO_CONNECTION) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT to_regclass(%s) IS NOT NULL", (table,))
+
+            return cursor.fetchone()[0]
+
+
+def _get_columns(cursor, table):
+    """gets the column names and types of a table in ordinal order
+    returns: list of tuples with 0: column name, 1: formatted type
+    """
+    cursor.execute(
+        """SELECT
+    attname,
+    format_type(atttypid, atttypmod)
+FROM
+    pg_attribute
+WHERE
+    attrelid = to_regclass(%s)
+    AND attnum > 0
+    AND NOT attisdropped
+ORDER BY
+    attnum;""",
+        (table,),
+    )
+
+    return cursor.fetchall()
+
+
+def _apply(cursor, staging_table, table, columns, key=None):
+    """applies the difference between the staging and destination tables. a key that is not unique in both
+    tables falls back to matching the rows by their content
+    returns: dictionary of change counts
+    """
+    for statement in changes.get_row_statements(staging_table, table, columns, key):
+        cursor.execute(statement)
+
+    if key is not None:
+        cursor.execute(changes.UNIQUE_KEYS)
+
+        if not cursor.fetchone()[0]:
+            logging.info("- %s is not unique in %s, matching the rows by their content", key, table)
+            cursor.execute(changes.DROP_ROWS)
+
+            return _apply(cursor, staging_table, table, columns)
+
+    counts = {"inserted": 0, "updated": 0, "deleted": 0}
+
+    for action, statement in changes.get_change_statements(staging_table, table, columns, key).items():
+        cursor.execute(statement)
+        counts[action] = cursor.rowcount
+
+    return counts
+
+
+def apply_changes(staging_table, table, key=None):
+    """applies only the inserts, updates, and deletes from the staging table to the destination table
+    and drops the staging table in the same transaction
+    staging_table: string schema.table that the source was extracted into
+    table: string schema.table in the destination
+    key: the stable unique column or None to match rows by their content
+    returns: dictionary of change counts or None if the schemas differ and a full reload is required
+    """
+    with connect(config.DBO_CONNECTION, config.SESSION_SETTINGS["sync"]) as conn:
+        with conn.cursor() as cursor:
+            staging_columns = _get_columns(cursor, staging_table)
+
+            #: the staging table is only dropped by an apply that committed and that apply is not run again
+            if len(staging_columns) == 0:
+                raise RuntimeError(f"{staging_table} does not exist")
+
+            if staging_columns != _get_columns(cursor, table):
+                logging.info("- the schema for %s changed", table)
+
+                return None
+
+            columns = [f'"{column}"' for column, _ in staging_columns if column != "xid"]
+
+            counts = _apply(cursor, staging_table, table, columns, None if key is None else f'"{key}"')
+
+            cursor.execute(f"DROP TABLE {staging_table}")
+
+            if counts["inserted"] + counts["updated"] + counts["deleted"] > 0:
+                cluster.mark_changed(cursor, table)
+                cursor.execute(f"ANALYZE {table}")
+
+    logging.info(
+        "- %s: %s inserted, %s updated, %s deleted",
+        table,
+        counts["inserted"],
+        counts["updated"],
+        counts["deleted"],
+    )
+
+    return counts
+
+
+def promote(staging_table, table):
+    """replaces the destination table with the staging table when a full reload is required. it can be called again
+    after the staging table was moved to the shadow table and only the swap failed
+    staging_table: string schema.table that the source was extracted into
+    table: string schema.table in the destination
+    """
+    _, staging_name = staging_table.split(".")
+    schema_name, table_name = table.split(".")
+    shadow_name = schema.get_shadow_name(table_name)
+
+    with connect(config.DBO_CONNECTION, config.SESSION_SETTINGS["sync"]) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                "SELECT to_regclass(%s) IS NOT NULL, to_regclass(%s) IS NOT NULL",
+                (staging_table, f'{schema_name}."{shadow_name}"'),
+            )
+            staged, moved = cursor.fetchone()
+
+            #: a retry after the staging table was moved, e.g. when the swap timed out on a lock, only swaps
+            if staged:
+                cursor.execute(f"ALTER TABLE {staging_table} SET LOGGED")
+                cursor.execute(f'DROP TABLE IF EXISTS {schema_name}."{shadow_name}"')
+                cursor.execute(f'ALTER TABLE {staging_table} RENAME TO "{shadow_name}"')
+                cursor.execute(f'ALTER TABLE {config.STAGING_SCHEMA}."{shadow_name}" SET SCHEMA {schema_name}')
+            elif not moved:
+                raise RuntimeError(f"{staging_table} does not exist")
+
+    schema.swap_table(f"{schema_name}.{shadow_name}", table, object_prefix=staging_name)
@@ -4,8 +4,58 @@
 index - A module that creates sql indexes
 """
 
-DEFAULT = "create index if not exists idx_{2}_{0} on {1}.{2} ({0});"
-FUZZY = "create index if not exists trgm_idx_{2}_{0} on {1}.{2} using gin ({0} gin_trgm_ops);"
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from hashlib import sha256
+
+import psycopg2
+
+from . import connect
+
+#: the longest postgres identifier. the other modules import it from here
+MAX_IDENTIFIER_LENGTH = 63
+COMMENT_PREFIX = "cloudb:"
+
+
+def btree(*columns, include=None, where=None):
+    """a b-tree index for equality and range lookups
+    columns: the columns to index in order
+    include: columns to carry in the index for index only scans
+    where: a predicate for a partial index
+    """
+    return _spec("btree", columns, include=include, where=where)
+
+
+def trigram(column, where=None):
+    """a gin trigram index for fuzzy text searches"""
+    return _spec("gin", [column], opclass="gin_trgm_ops", prefix="trgm_idx", where=where)
+
+
+def spatial(column="shape", method="gist", where=None):
+    """a gist or sp-gist index for geometry columns"""
+    return _spec(method, [column], where=where)
+
+
+def brin(column, pages_per_range=None):
+    """a block range index for large tables whose rows are loaded in column order"""
+    storage = {"pages_per_range": pages_per_range} if pages_per_range else None
+
+    return _spec("brin", [column], storage=storage)
+
+
+def _spec(method, columns, opclass=None, prefix=None, include=None, where=None, storage=None):
+    """the declaration of an index that the sql and the diff are created from"""
+    return {
+        "method": method,
+        "columns": list(columns),
+        "opclass": opclass,
+        "prefix": prefix or ("idx" if method == "btree" else f"{method}_idx"),
+        "include": list(include) if include else None,
+        "where": where,
+        "storage": storage,
+    }
+
 
 PARCEL_LAYERS = [
     "beaver",
@@ -40,26 +90,216 @@ PARCEL_LAYERS = [
 ]
 INDEXES = {
     "location.address_points": [
-        DEFAULT.format("fulladd", "location", "address_points"),
-        FUZZY.format("fulladd", "location", "address_points"),
+        btree("fulladd"),
+        trigram("fulladd"),
     ],
     "location.zoom_locations": [
-        DEFAULT.format("name", "location", "zoom_locations"),
-        FUZZY.format("name", "location", "zoom_locations"),
+        btree("name"),
+        trigram("name"),
     ],
     "location.gnis_place_names": [
-        DEFAULT.format("name", "location", "gnis_place_names"),
-        FUZZY.format("name", "location", "gnis_place_names"),
+        btree("name"),
+        trigram("name"),
     ],
     "transportation.roads": [
-        DEFAULT.format("fullname", "transportation", "roads"),
-        FUZZY.format("fullname", "transportation", "roads"),
+        btree("fullname"),
+        trigram("fullname"),
     ],
     "cadastre.land_ownership": [
-        DEFAULT.format("admin", "cadastre", "land_ownership"),
-        DEFAULT.format("owner", "cadastre", "land_ownership"),
+        btree("admin"),
+        btree("owner"),
     ],
 }
 
 for county in PARCEL_LAYERS:
-    INDEXES[f"cadastre.{county}_county_parcels"] = [DEFAULT.format("parcel_id", "cadastre", f"{county}_county_parcels")]
+    INDEXES[f"cadastre.{county}_county_parcels"] = [btree("parcel_id")]
+
+
+def get_name(spec, table_name):
+    """a method to get the name of an index on a table
+    returns: string index name within the postgres identifier limit
+    """
+    return f"{spec['prefix']}_{table_name}_{'_'.join(spec['columns'])}"[:MAX_IDENTIFIER_LENGTH]
+
+
+def get_signature(spec):
+    """a fingerprint of the declaration stored as the index comment so changed declarations are rebuilt"""
+    return COMMENT_PREFIX + sha256(json.dumps(spec, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+def _get_columns(spec):
+    """the column list of an index including the operator class"""
+    return ", ".join(f"{column} {spec['opclass']}" if spec["opclass"] else column for column in spec["columns"])
+
+
+def get_statement(spec, table, concurrently=False):
+    """formats the create index sql for a declaration
+    spec: the index declaration
+    table: schema.table to create the index on
+    concurrently: build without blocking writes. this cannot run inside a transaction
+    returns: string sql statement
+    """
+    schema_name, table_name = table.split(".")
+    using = "" if spec["method"] == "btree" else f" using {spec['method']}"
+    sql = (
+        f"create index{' concurrently' if concurrently else ''} if not exists {get_name(spec, table_name)} "
+        f"on {schema_name}.{table_name}{using} ({_get_columns(spec)})"
+    )
+
+    if spec["include"]:
+        sql += f" include ({', '.join(spec['include'])})"
+
+    if spec["storage"]:
+        sql += f" with ({', '.join(f'{key} = {value}' for key, value in spec['storage'].items())})"
+
+    if spec["where"]:
+        sql += f" where {spec['where']}"
+
+    return sql + ";"
+
+
+def get_statements(layer, table=None, concurrently=False):
+    """formats the index sql for a layer
+    layer: schema.table the indexes are configured for
+    table: schema.table to create the indexes on. defaults to the layer
+    concurrently: build without blocking writes
+    returns: array of sql statements
+    """
+    return [get_statement(spec, table or layer, concurrently) for spec in INDEXES[layer]]
+
+
+def _matches_definition(spec, definition):
+    """true if an index created before declarations were fingerprinted matches the declaration"""
+    if spec["include"] or spec["where"] or spec["storage"]:
+        return False
+
+    return definition.endswith(f"USING {spec['method']} ({_get_columns(spec)})")
+
+
+def diff(cursor, layer, table=None):
+    """compares the declared indexes of a layer with the indexes in the database
+    cursor: a cursor on the destination database
+    layer: schema.table the indexes are configured for
+    table: schema.table the indexes are on. defaults to the layer
+    returns: array of tuples with 0: create or replace, 1: index name, 2: spec or None if the table does not exist
+    """
+    table = table or layer
+    _, table_name = table.split(".")
+
+    cursor.execute("SELECT to_regclass(%s) IS NOT NULL", (table,))
+
+    if not cursor.fetchone()[0]:
+        return None
+
+    cursor.execute(
+        """SELECT
+    c.relname,
+    i.indisvalid,
+    obj_description(c.oid, 'pg_class'),
+    pg_get_indexdef(c.oid)
+FROM
+    pg_index i
+INNER JOIN pg_class c ON
+    c.oid = i.indexrelid
+WHERE
+    i.indrelid = to_regclass(%s);""",
+        (table,),
+    )
+
+    existing = {name: (valid, comment, definition) for name, valid, comment, definition in cursor.fetchall()}
+    changes = []
+
+    for spec in INDEXES[layer]:
+        name = get_name(spec, table_name)
+
+        if name not in existing:
+            changes.append(("create", name, spec))
+
+            continue
+
+        valid, comment, definition = existing[name]
+
+        if not valid:
+            #: a concurrent build that failed leaves an invalid index behind
+            changes.append(("replace", name, spec))
+        elif comment == get_signature(spec):
+            continue
+        elif comment is None and _matches_definition(spec, definition):
+            continue
+        else:
+            changes.append(("replace", name, spec))
+
+    return changes
+
+
+def _build_table(layer, table, connection, settings, concurrently):
+    """creates the missing and changed indexes on one table one at a time since
+    concurrent builds on the same table wait on each other
+    returns: dictionary of index name to created, replaced, or failed
+    """
+    schema_name, _ = table.split(".")
+
+    with connect(connection) as conn:
+        with conn.cursor() as cursor:
+            changes = diff(cursor, layer, table)
+
+    if changes is None:
+        logging.info("- skipping indexes for %s since it does not exist", table)
+
+        return {}
+
+    results = {}
+    keyword = " concurrently" if concurrently else ""
+
+    for action, name, spec in changes:
+        logging.debug("- %s index %s", action, name)
+
+        try:
+            with connect(connection, settings, autocommit=concurrently) as conn:
+                with conn.cursor() as cursor:
+                    if action == "replace":
+                        cursor.execute(f"DROP INDEX{keyword} IF EXISTS {schema_name}.{name}")
+
+                    cursor.execute(get_statement(spec, table, concurrently))
+                    cursor.execute(f"COMMENT ON INDEX {schema_name}.{name} IS %s", (get_signature(spec),))
+
+            results[name] = f"{action}d"
+        except psycopg2.Error as ex:
+            logging.warning("- failed creating index %s: %s", name, ex)
+
+            results[name] = "failed"
+
+    return results
+
+
+def sync_indexes(tables, connection, settings=None, workers=1, concurrently=False):
+    """creates the declared indexes that are missing or changed. tables are built in parallel and
+    the indexes on a table are built in order
+    tables: dictionary of the schema.table the indexes are configured for to the schema.table to create them on
+    connection: dict with connection information
+    settings: dict of session settings, e.g. maintenance_work_mem, for the builds
+    workers: the number of tables to build at the same time
+    concurrently: build without blocking writes for tables that are live
+    returns: dictionary of table to a dictionary of index name to created, replaced, or failed
+    """
+    tables = {layer: table for layer, table in tables.items() if layer in INDEXES}
+    results = {}
+
+    if len(tables) == 0:
+        return results
+
+    with ThreadPoolExecutor(max_workers=max(min(workers, len(tables)), 1)) as executor:
+        futures = {
+            executor.submit(_build_table, layer, table, connection, settings, concurrently): table
+            for layer, table in tables.items()
+        }
+
+        for future in as_completed(futures):
+            results[futures[future]] = future.result()
+
+    built = sum(len(indexes) for indexes in results.values())
+    failed = sum(status == "failed" for indexes in results.values() for status in indexes.values())
+
+    logging.info("built %s indexes on %s tables with %s failures", built - failed, len(tables), failed)
+
+    return results
@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+# * coding: utf8 *
+"""
+jobs.py
+A module that runs syncs in the background one at a time and tracks their progress
+"""
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from copy import deepcopy
+from datetime import datetime, timezone
+from uuid import uuid4
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+#: the finished jobs to keep for polling
+HISTORY = 20
+
+_executor = None
+_jobs = {}
+_active = None
+_lock = threading.Lock()
+_current = threading.local()
+
+
+def _now():
+    """the current time for the job timestamps"""
+    return datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+
+def _get_executor():
+    """gets the single worker executor so only one sync runs at a time"""
+    global _executor
+
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="cloudb-job")
+
+    return _executor
+
+
+def submit(name, target, *args):
+    """queues a job unless one is already queued or running
+    name: string name of the job
+    target: the function to run. it returns a list of errors
+    args: the arguments for the function
+    returns: tuple with 0: the job, 1: true if the job was created or false if the trigger was coalesced
+    """
+    global _active
+
+    with _lock:
+        if _active is not None and _jobs[_active]["status"] in (QUEUED, RUNNING):
+            logging.info("job %s is already %s", _active, _jobs[_active]["status"])
+
+            return deepcopy(_jobs[_active]), False
+
+        job = {
+            "id": uuid4().hex,
+            "name": name,
+            "status": QUEUED,
+            "created": _now(),
+            "started": None,
+            "finished": None,
+            "phase": None,
+            "current": [],
+            "tables": {"total": 0, "done": 0, "remaining": 0, "failed": 0},
+            "errors": [],
+        }
+
+        _jobs[job["id"]] = job
+        _active = job["id"]
+
+        finished = [key for key, value in _jobs.items() if value["status"] in (SUCCEEDED, FAILED)]
+        for key in finished[: max(len(finished) - HISTORY, 0)]:
+            del _jobs[key]
+
+        _get_executor().submit(_run, job["id"], target, args)
+
+        return deepcopy(job), True
+
+
+def _run(job_id, target, args):
+    """runs a job and records the outcome"""
+    _current.job_id = job_id
+    _update(status=RUNNING, started=_now())
+
+    try:
+        errors = target(*args) or []
+    except Exception as error:
+        logging.error("job %s failed %s", job_id, error, exc_info=True)
+        errors = [error]
+    finally:
+        _current.job_id = None
+
+    with _lock:
+        job = _jobs[job_id]
+        job["errors"] = [str(error) for error in errors]
+        job["status"] = FAILED if errors else SUCCEEDED
+        job["finished"] = _now()
+        job["phase"] = None
+        job["current"] = []
+
+
+def get(job_id):
+    """gets a copy of a job
+    returns: dictionary or None if the job is unknown
+    """
+    with _lock:
+        job = _jobs.get(job_id)
+
+        return deepcopy(job) if job is not None else None
+
+
+@contextmanager
+def _current_job():
+    """locks the jobs and gets the job running on this thread or None outside of a job, e.g. from the cli"""
+    job_id = getattr(_current, "job_id", None)
+
+    with _lock:
+        yield _jobs.get(job_id) if job_id is not None else None
+
+
+def _update(**values):
+    """changes the job running on this thread"""
+    with _current_job() as job:
+        if job is not None:
+            job.update(values)
+
+
+def set_phase(phase):
+    """records the step the job is on, e.g. trim, import, or update"""
+    _update(phase=phase, current=[])
+
+
+def start_tables(tables):
+    """adds the tables a step is about to sync to the total
+    tables: list of schema.table names
+    """
+    with _current_job() as job:
+        if job is not None:
+            job["tables"]["total"] += len(tables)
+            job["tables"]["remaining"] += len(tables)
+
+
+def start_table(table):
+    """records a table as in progress"""
+    with _current_job() as job:
+        if job is not None:
+            job["current"].append(table)
+
+
+def finish_table(table, failed=False):
+    """records a table as done"""
+    with _current_job() as job:
+        if job is None:
+            return
+
+        if table in job["current"]:
+            job["current"].remove(table)
+
+        job["tables"]["done"] += 1
+        job["tables"]["remaining"] = max(job["tables"]["remaining"] - 1, 0)
+
+        if failed:
+            job["tables"]["failed"] += 1
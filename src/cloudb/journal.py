@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# * coding: utf8 *
+"""
+journal.py
+A module that checkpoints a run in the state store so a run that was interrupted continues with the work that is left
+"""
+
+import json
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+from uuid import uuid4
+
+RUNS = "journal.json"
+#: a run older than this is not continued. an interrupted run is continued when the service starts again, so a run
+#: that could not be continued before the next nightly trigger starts over instead of skipping a day of changes
+MAX_AGE = timedelta(hours=20)
+
+_chunk_lock = threading.Lock()
+
+
+def _now():
+    """the current time for the journal"""
+    return datetime.now(timezone.utc)
+
+
+class Journal:
+    """the steps and tables a run finished"""
+
+    def __init__(self, store, run):
+        self.store = store
+        self.run = run
+
+    @property
+    def id(self):
+        """the id of the run"""
+        return self.run["id"]
+
+    def _save(self):
+        """writes the run to the store"""
+        self.store.write(RUNS, json.dumps(self.run, indent=2))
+
+    def _get_step(self, step):
+        """gets the checkpoints of a step"""
+        return self.run["steps"].setdefault(step, {"done": False, "tables": []})
+
+    def is_done(self, step, table=None):
+        """returns: true if the step or a table of the step finished"""
+        if table is None:
+            return self._get_step(step)["done"]
+
+        return table in self._get_step(step)["tables"]
+
+    def get_tables(self, step):
+        """returns: array of the tables the step finished"""
+        return list(self._get_step(step)["tables"])
+
+    def complete(self, step, table=None):
+        """checkpoints a step or a table of a step"""
+        checkpoint = self._get_step(step)
+
+        if table is None:
+            checkpoint["done"] = True
+        elif table not in checkpoint["tables"]:
+            checkpoint["tables"].append(table)
+
+        self._save()
+
+    def finish(self, failed=False):
+        """marks the run ended so the next one starts over. only a run that was interrupted is continued
+        failed: true when the run ended with errors
+        """
+        self.run["finished"] = _now().isoformat(timespec="seconds")
+        self.run["failed"] = failed
+        self._save()
+
+
+def _is_resumable(run, name):
+    """returns: true if the run has the name, has not finished, and is young enough to continue"""
+    return (
+        run is not None
+        and run["name"] == name
+        and run["finished"] is None
+        and _now() - datetime.fromisoformat(run["started"]) < MAX_AGE
+    )
+
+
+def get_unfinished(store, name):
+    """gets the run with the name that was interrupted and can be continued
+    store: state.FileStore or state.GcsStore
+    name: string name of the run, e.g. scheduled
+    returns: dictionary run or None
+    """
+    text = store.read(RUNS)
+    run = json.loads(text) if text else None
+
+    return run if _is_resumable(run, name) else None
+
+
+def start(store, name):
+    """continues the unfinished run with the same name or starts a new one
+    store: state.FileStore or state.GcsStore
+    name: string name of the run, e.g. scheduled
+    returns: Journal
+    """
+    run = get_unfinished(store, name)
+
+    if run is not None:
+        run["resumed"] += 1
+        logging.info("continuing run %s from %s", run["id"], run["started"])
+    else:
+        run = {
+            "id": uuid4().hex,
+            "name": name,
+            "started": _now().isoformat(timespec="seconds"),
+            "finished": None,
+            "resumed": 0,
+            "steps": {},
+        }
+
+    journal = Journal(store, run)
+    journal._save()
+
+    return journal
+
+
+def _get_chunk_name(table):
+    """the name of the chunk checkpoints of a table in the store"""
+    return f"chunks.{table}.json"
+
+
+def read_chunks(store, run_id, table):
+    """gets the chunks of a table that loaded in a run
+    returns: array of tuples from chunks.get_ranges
+    """
+    text = store.read(_get_chunk_name(table))
+    checkpoint = json.loads(text) if text else None
+
+    if checkpoint is None or checkpoint["run"] != run_id:
+        return []
+
+    return [tuple(chunk) for chunk in checkpoint["chunks"]]
+
+
+def complete_chunk(store, run_id, table, chunk):
+    """checkpoints a chunk of a table. chunks of one table load on threads of one process so they share the lock"""
+    with _chunk_lock:
+        chunks = read_chunks(store, run_id, table)
+        chunks.append(tuple(chunk))
+
+        store.write(_get_chunk_name(table), json.dumps({"run": run_id, "chunks": chunks}))
+
+
+def clear_chunks(store, run_id, table):
+    """forgets the chunks of a table before it loads from the start"""
+    with _chunk_lock:
+        store.write(_get_chunk_name(table), json.dumps({"run": run_id, "chunks": []}))
@@ -8,33 +8,74 @@ Usage:
   cloudb create schema [--schemas=<name>]
   cloudb create admin-user
   cloudb create read-only-user
-  cloudb create indexes
+  cloudb create indexes [--workers=<n>]
+  cloudb cluster [--table=<tables>... --force]
   cloudb drop schema [--schemas=<name>]
-  cloudb import [--missing --dry-run --skip-if-exists]
-  cloudb trim [--dry-run]
-  cloudb update [--table=<tables>... --dry-run --from-change-detection]
-  cloudb update-schema [--table=<tables>... --dry-run]
+  cloudb import [--missing --dry-run --skip-if-exists --workers=<n> --report=<path>]
+  cloudb trim [--dry-run --report=<path>]
+  cloudb update [--table=<tables>... --dry-run --from-change-detection --workers=<n> --incremental --report=<path>]
+  cloudb update-schema [--table=<tables>... --dry-run --workers=<n>]
 """
 
+import atexit
 import logging
 import sys
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+from functools import partial
+from multiprocessing import get_context
 from time import perf_counter, sleep
 
 import psycopg2
 import pyodbc
 from docopt import docopt
-from google.cloud import storage
 from osgeo import gdal, ogr
 
-from . import CONNECTION_TABLE_CACHE, config, execute_sql, roles, schema, utils
-from .index import INDEXES
+from . import (
+    POOL_SIZE,
+    catalog,
+    chunks,
+    close_pools,
+    cluster,
+    config,
+    connect,
+    execute_sql,
+    generalize,
+    incremental,
+    index,
+    jobs,
+    journal,
+    meta,
+    native,
+    outcome,
+    planner,
+    profiles,
+    renames,
+    report,
+    roles,
+    schema,
+    sinks,
+    state,
+    utils,
+)
+from .outcome import FAILED, SKIPPED, SUCCESS
+
+#: the shapes to sample for the average vertices of a table
+VERTEX_SAMPLE = 1000
+
+
+def _configure_gdal():
+    """sets the gdal configuration for the current process. this is also the initializer for sync workers
+    so every process gets its own gdal state
+    """
+    gdal.SetConfigOption("MSSQLSPATIAL_LIST_ALL_TABLES", "YES")
+    gdal.SetConfigOption("PG_LIST_ALL_TABLES", "YES")
+    gdal.SetConfigOption("PG_USE_POSTGIS", "YES")
+    gdal.SetConfigOption("PG_USE_COPY", "YES")
+    ogr.UseExceptions()
+
 
-gdal.SetConfigOption("MSSQLSPATIAL_LIST_ALL_TABLES", "YES")
-gdal.SetConfigOption("PG_LIST_ALL_TABLES", "YES")
-gdal.SetConfigOption("PG_USE_POSTGIS", "YES")
-gdal.SetConfigOption("PG_USE_COPY", "YES")
-ogr.UseExceptions()
+_configure_gdal()
 
 
 def enable_extensions():
@@ -47,58 +88,64 @@ def enable_extensions():
 
 
 def _get_tables_with_fields(connection_string, specific_tables):
-    """creates a list of tables with fields from the connection string
+    """creates a list of tables with fields from the connection string with a single information schema query
     connection_string: string to connect to db
     specific_tables: array of tables to get in schema.table format
     returns: array of tuples with 0: schema, 1: table name: 2: array of field names
     """
-    layer_schema_map = []
-    filter_tables = False
+    #: the geometry type comes from meta.agolitems so only the attribute fields are needed. the columns are
+    #: left joined so a table with only an objectid and a shape is still loaded
+    sql = """SELECT
+    LOWER(t.TABLE_SCHEMA),
+    LOWER(t.TABLE_NAME),
+    LOWER(c.COLUMN_NAME)
+FROM
+    INFORMATION_SCHEMA.TABLES t
+LEFT JOIN INFORMATION_SCHEMA.COLUMNS c ON
+    c.TABLE_SCHEMA = t.TABLE_SCHEMA
+    AND c.TABLE_NAME = t.TABLE_NAME
+    AND LOWER(c.COLUMN_NAME) NOT IN (SELECT value FROM STRING_SPLIT(?, ','))
+    AND c.DATA_TYPE NOT IN ('geometry', 'geography')
+WHERE
+    t.TABLE_TYPE = 'BASE TABLE'
+    AND LOWER(t.TABLE_SCHEMA) NOT IN (SELECT value FROM STRING_SPLIT(?, ','))
+    AND (
+        ? = ''
+        OR CONCAT(LOWER(t.TABLE_SCHEMA), '.', LOWER(t.TABLE_NAME)) IN (SELECT value FROM STRING_SPLIT(?, ','))
+    )
+ORDER BY
+    t.TABLE_SCHEMA,
+    t.TABLE_NAME,
+    c.ORDINAL_POSITION;"""
+
+    filter_tables = ""
 
     if specific_tables and len(specific_tables) > 0:
         logging.debug("filtering for specific tables")
 
-        filter_tables = True
-
-    logging.debug("connecting to database")
-    connection = gdal.OpenEx(connection_string)
-
-    logging.debug("getting layer count")
-    table_count = connection.GetLayerCount()
-
-    logging.info("discovered %s tables", table_count)
+        filter_tables = ",".join(table.lower() for table in specific_tables)
 
-    for table_index in range(table_count):
-        qualified_layer = connection.GetLayerByIndex(table_index)
-        schema_name, layer = qualified_layer.GetName().split(".")
-        schema_name = schema_name.lower()
-        layer = layer.lower()
+    tables = {}
 
-        logging.debug("- %s.%s", schema_name, layer)
-
-        if schema_name in config.EXCLUDE_SCHEMAS or filter_tables and f"{schema_name}.{layer}" not in specific_tables:
-            logging.debug(" - skipping: %s", schema_name)
-
-            continue
-
-        definition = qualified_layer.GetLayerDefn()
-
-        fields = []
-        for field_index in range(definition.GetFieldCount()):
-            field = definition.GetFieldDefn(field_index)
-
-            field_name = field.GetName().lower()
+    logging.debug("connecting to database")
+    if not config.is_sql_server_source():
+        tables = _get_ogr_tables_with_fields(connection_string, filter_tables)
+    else:
+        with pyodbc.connect(connection_string[6:]) as connection:
+            cursor = connection.cursor()
+            cursor.execute(
+                sql, ",".join(config.EXCLUDE_FIELDS), ",".join(config.EXCLUDE_SCHEMAS), filter_tables, filter_tables
+            )
 
-            if field_name in config.EXCLUDE_FIELDS:
-                logging.debug("  - skipping: %s", field_name)
+            for schema_name, layer, field in cursor.fetchall():
+                fields = tables.setdefault((schema_name, layer), [])
 
-                continue
+                if field is not None:
+                    fields.append(field)
 
-            fields.append(field_name)
+    logging.info("discovered %s tables", len(tables))
 
-        layer_schema_map.append((schema_name, layer, fields))
-
-        del qualified_layer
+    layer_schema_map = [(schema_name, layer, fields) for (schema_name, layer), fields in tables.items()]
 
     schema_map_count = len(layer_schema_map)
     noun = "tables"
@@ -108,66 +155,69 @@ def _get_tables_with_fields(connection_string, specific_tables):
     logging.info("planning to import %s %s", schema_map_count, noun)
     layer_schema_map.sort(key=lambda items: items[0])
 
-    connection = None
-
     return layer_schema_map
 
 
-def _get_schema_table_name_map(table_name):
-    """a method to split a qualified table into it's parts"""
-    parts = table_name.split(".")
+def _get_ogr_tables_with_fields(connection_string, filter_tables):
+    """the ogr version of the information schema query for a source that is not sql server, e.g. a geopackage
+    connection_string: the ogr source
+    filter_tables: comma separated schema.table names to keep or an empty string for every table
+    returns: dictionary of tuples with 0: schema, 1: table name to an array of field names
+    """
+    keep = set(filter_tables.split(",")) if filter_tables else None
+    tables = {}
 
-    schema_index = 1
-    table_index = 2
+    try:
+        source = ogr.Open(connection_string)
 
-    if len(parts) == 2:
-        schema_index = 0
-        table_index = 1
+        for layer in source:
+            name = layer.GetName().lower()
 
-    return {"schema": parts[schema_index].lower(), "table_name": parts[table_index].lower()}
+            if "." not in name:
+                continue
 
+            schema_name, table = name.split(".", 1)
+
+            if schema_name in config.EXCLUDE_SCHEMAS or (keep is not None and name not in keep):
+                continue
 
-def _format_title_for_pg(title):
-    if title is None:
-        return title
+            definition = layer.GetLayerDefn()
+            fields = [definition.GetFieldDefn(i).GetName().lower() for i in range(definition.GetFieldCount())]
 
-    new_title = title.lower()
-    new_title = new_title.replace("utah ", "", 1).replace(" ", "_")
+            tables[(schema_name, table)] = [field for field in fields if field not in config.EXCLUDE_FIELDS]
+    except RuntimeError as ex:
+        logging.warning("unable to read the source tables: %s", ex)
 
-    logging.debug("updating %s to %s", title, new_title)
+    return tables
 
-    return new_title
 
+def get_table_meta():
+    """gets the meta data about fields from meta.agolitems
+    returns: meta.Snapshot to share with every step of a run
+    """
+    if not config.is_sql_server_source():
+        source = ogr.Open(config.get_source_connection())
+        result = source.ExecuteSQL('SELECT TABLENAME, AGOL_PUBLISHED_NAME, GEOMETRY_TYPE FROM "meta.agolitems"')
+        rows = [(feature.GetField(0), feature.GetField(1), feature.GetField(2)) for feature in result]
+        source.ReleaseResultSet(result)
 
-def _get_table_meta():
-    """gets the meta data about fields from meta.agolitems"""
-    mapping = {}
+        return meta.create_snapshot(rows)
 
     with pyodbc.connect(config.get_source_connection()[6:]) as connection:
         cursor = connection.cursor()
 
         cursor.execute("SELECT [TABLENAME],[AGOL_PUBLISHED_NAME],[GEOMETRY_TYPE] FROM [SGID].[META].[AGOLITEMS]")
-        rows = cursor.fetchall()
-
-        #: table: SGID.ENVIRONMENT.DAQPermitCompApproval
-        #: title: Utah Retail Culinary Water Service Areas
-        #: geometry_type: POINT POLYGON POLYLINE
-        for table, title, geometry_type in rows:
-            table_parts = _get_schema_table_name_map(table)
-            pg_title = _format_title_for_pg(title)
-
-            schema_name = mapping.setdefault(table_parts["schema"], {})
-            schema_name[table_parts["table_name"]] = {"title": pg_title, "geometry_type": geometry_type}
 
-        return mapping
+        return meta.create_snapshot(cursor.fetchall())
 
 
 def _populate_table_cache(connection_string, pgify=False, name_map=None):
-    """adds all the table from a connection string to a dictionary for caching purposes
+    """adds all the table from a connection string to the catalog cache
     pgify: lowercases and adds underscores
     name_map: is a dictionary to replace names from the meta table
+    returns: dictionary of schema.table names
     """
-    skip_schema = ["meta", "sde"]
+    skip_schema = ["meta", "sde", config.STAGING_SCHEMA]
     logging.debug("connecting to database")
     #: gdal.open gave a 0 table count
     connection = ogr.Open(connection_string)
@@ -176,7 +226,7 @@ def _populate_table_cache(connection_string, pgify=False, name_map=None):
     table_count = connection.GetLayerCount()
 
     logging.debug("found %s total tables for cache", table_count)
-    CONNECTION_TABLE_CACHE.setdefault(connection_string, [])
+    tables = set()
 
     for table_index in range(table_count):
         qualified_layer = connection.GetLayerByIndex(table_index)
@@ -189,14 +239,14 @@ def _populate_table_cache(connection_string, pgify=False, name_map=None):
             if "." not in name:
                 continue
 
-            table_parts = _get_schema_table_name_map(name)
+            table_parts = utils.get_schema_table_name_map(name)
             name = f"{table_parts['schema']}.{table_parts['table_name']}"
 
             if table_parts["schema"] in skip_schema:
                 continue
 
             if pgify:
-                pg_title = _format_title_for_pg(table_parts["table_name"])
+                pg_title = utils.format_title_for_pg(table_parts["table_name"])
                 schema_name = table_parts["schema"]
 
                 if schema_name in name_map and pg_title in name_map[schema_name]:
@@ -208,41 +258,52 @@ def _populate_table_cache(connection_string, pgify=False, name_map=None):
 
             logging.debug("found layer: %s", name)
 
-            CONNECTION_TABLE_CACHE[connection_string].append(name)
+            tables.add(name)
 
     del qualified_layer
     connection = None
 
+    return catalog.set_tables(connection_string, tables)
 
-def _check_if_exists(connection_string, schema_name, table, agol_meta_map):
-    """returns true or false if a table exists in the connections_string db
-    connection_string: string of db to check
+
+def _get_destination_catalog():
+    """gets the tables in the destination from the catalog cache or a single pg_catalog query
+    returns: dictionary of schema.table to the geometry type, estimated row count, and column names
+    """
+    cloud_db = config.format_ogr_connection(config.DBO_CONNECTION)
+    tables = catalog.get_tables(cloud_db)
+
+    if tables is None:
+        logging.debug("populating postgres table cache")
+        tables = catalog.set_tables(
+            cloud_db, catalog.query_destination(config.DBO_CONNECTION, [*config.EXCLUDE_SCHEMAS, config.STAGING_SCHEMA])
+        )
+
+    return tables
+
+
+def _check_if_exists(schema_name, table, agol_meta_map, existing):
+    """returns true or false if a table exists in the destination
     schema_name: string schema name
     table: string table name
+    existing: set of the schema.table names in the destination, read from the catalog once per run
     returns: bool
     """
-    logging.debug("checking cache")
-
     if schema_name in agol_meta_map and table in agol_meta_map[schema_name]:
         table, _ = agol_meta_map[schema_name][table].values()
 
-    if connection_string in CONNECTION_TABLE_CACHE and len(CONNECTION_TABLE_CACHE[connection_string]) > 0:
-        logging.debug("cache hit")
-
-        return f"{schema_name}.{table}" in CONNECTION_TABLE_CACHE[connection_string]
+    return f"{schema_name}.{table}" in existing
 
-    logging.debug("cache miss")
-    _populate_table_cache(connection_string)
 
-    found = False
-    if f"{schema}.{table}" in CONNECTION_TABLE_CACHE[connection_string]:
-        found = True
+def _replace_data(schema_name, layer, fields, agol_meta_map, dry_run, incremental_sync=False, run_id=None):
+    """the insert logging for writing to the destination
+    incremental_sync: extract into the staging schema and apply only the changed rows
+    run_id: the id of the journaled run so a chunked load continues where an interrupted run stopped
+    returns: dictionary describing the outcome for the table
 
-    return found
-
-
-def _replace_data(schema_name, layer, fields, agol_meta_map, dry_run):
-    """the insert logging for writing to the destination"""
+    new data is loaded, repaired, and indexed in a shadow table that is then swapped in
+    so readers never see a missing or partially loaded table
+    """
     cloud_db = config.format_ogr_connection(config.DBO_CONNECTION)
     internal_sgid = config.get_source_connection()
 
@@ -252,21 +313,17 @@ def _replace_data(schema_name, layer, fields, agol_meta_map, dry_run):
 
     if len(fields) > 0:
         #: escape reserved words?
-        fields = [f'"{field}"' for field in fields]
-        sql = f'SELECT {",".join(fields)} FROM "{schema_name}.{layer}"'
+        quoted_fields = [f'"{field}"' for field in fields]
+        sql = f'SELECT {",".join(quoted_fields)} FROM "{schema_name}.{layer}"'
 
     options = [
         "-f",
         "PostgreSQL",
         "-dialect",
         "OGRSQL",
-        "-sql",
-        sql,
         "-lco",
         "FID=xid",
         "-lco",
-        f"SCHEMA={schema_name}",
-        "-lco",
         "OVERWRITE=YES",
         "-lco",
         "GEOMETRY_NAME=shape",
@@ -282,6 +339,10 @@ def _replace_data(schema_name, layer, fields, agol_meta_map, dry_run):
         if new_name:
             layer = new_name
 
+        if geometry_type != "STAND ALONE":
+            #: repair invalid shapes as they are written instead of updating the table after the load
+            options.append("-makevalid")
+
         if geometry_type == "POLYGON":
             options.append("-nlt")
             options.append("MULTIPOLYGON")
@@ -297,78 +358,525 @@ def _replace_data(schema_name, layer, fields, agol_meta_map, dry_run):
     else:
         logging.info("- skipping %s since it is no longer in the meta table", layer)
 
-        return
+        return outcome.create(internal_name, SKIPPED, "not in the meta table")
+
+    qualified_layer = f"{schema_name}.{layer}"
+    load_schema = schema_name
+    load_table = schema.get_shadow_name(layer)
+
+    if incremental_sync and not dry_run and incremental.table_exists(qualified_layer):
+        load_schema = config.STAGING_SCHEMA
+        load_table = incremental.get_staging_name(schema_name, layer)
+
+        options.append("-lco")
+        options.append("UNLOGGED=ON")
+    else:
+        incremental_sync = False
+
+    timings = {}
+
+    key_range = (None, None)
+
+    with utils.timer(timings, "inspect"):
+        source_rows, vertices = _get_source_size(*internal_name.split("."))
+        profile = profiles.select(qualified_layer, source_rows, vertices)
 
+        if profile["chunks"] > 1:
+            key_range = _get_key_range(*internal_name.split("."))
+
+        columns = None
+        if config.get_loader() == "native":
+            columns = native.get_columns(internal_sgid, *internal_name.split("."), fields, geometry_type)
+
+            if columns is None:
+                logging.info("- loading %s with gdal since the native loader can not copy it", internal_name)
+
+        #: the native loader creates the source integer types from the source columns
+        integer_types = {} if columns is not None else schema.get_integer_types(internal_name)
+
+    ranges = chunks.get_ranges(*key_range, profile["chunks"])
+
+    logging.debug(
+        "- using the %s load profile with %s chunks and the %s loader",
+        profile["name"],
+        len(ranges),
+        "gdal" if columns is None else "native",
+    )
+
+    options.append("-gt")
+
+    if len(ranges) > 1:
+        #: each chunk commits once so a failed chunk can be loaded again without duplicating rows
+        options.append("unlimited")
+    else:
+        options.append(str(profile["group_transactions"]))
+
+    #: a clustered table is rewritten in order after the load so its spatial index is built from the ordered rows
+    defer_spatial_index = (
+        profile["defer_spatial_index"] or len(ranges) > 1 or columns is not None or qualified_layer in cluster.CLUSTERS
+    ) and geometry_type != "STAND ALONE"
+    if defer_spatial_index:
+        options.append("-lco")
+        options.append("SPATIAL_INDEX=NONE")
+
+    if integer_types:
+        #: the table is created with the source integer types so it is not rewritten after the load to change them
+        options.append("-lco")
+        options.append(f"COLUMN_TYPES={catalog.format_column_types(integer_types)}")
+
+    options.append("-lco")
+    options.append(f"SCHEMA={load_schema}")
     options.append("-nln")
-    options.append(f"{layer}")
+    options.append(f"{load_table}")
+
+    #: a chunked table is created empty and the chunks are appended to it at the same time
+    create_sql = sql if len(ranges) == 1 else f"{sql} WHERE {chunks.get_where((ranges[0][0], ranges[0][0]))}"
+    chunk_options = (
+        []
+        if len(ranges) == 1
+        else [chunks.get_append_options(options, sql, chunk, f"{load_schema}.{load_table}") for chunk in ranges]
+    )
 
-    pg_options = None
     try:
-        pg_options = gdal.VectorTranslateOptions(options=options)
+        pg_options = gdal.VectorTranslateOptions(options=[*options, "-sql", create_sql])
+        chunk_options = [gdal.VectorTranslateOptions(options=chunk) for chunk in chunk_options]
     except Exception:
         logging.fatal("- invalid options for %s", layer)
-        return
+
+        return outcome.create(internal_name, FAILED, "invalid vector translate options")
 
     logging.info("- inserting %s into %s as %s", layer, schema_name, geometry_type)
     logging.debug("with %s", sql)
 
-    if not dry_run:
-        start_seconds = perf_counter()
+    if dry_run:
+        return outcome.create(internal_name, SKIPPED, "dry run")
 
-        # Retry logic for GDAL VectorTranslate operation
-        max_retries = 3
-        retry_delay = 5  # seconds
-        result = None
+    start_seconds = perf_counter()
 
-        for attempt in range(max_retries):
-            try:
-                logging.debug("- attempt %d/%d for vector translate", attempt + 1, max_retries)
-                result = gdal.VectorTranslate(cloud_db, internal_sgid, options=pg_options)
-                logging.debug("- completed in %s", utils.format_time(perf_counter() - start_seconds))
-                break
-            except Exception as ex:
-                logging.warning("- vector translate attempt %d failed: %s", attempt + 1, str(ex))
-                if attempt < max_retries - 1:
-                    logging.info("- retrying in %d seconds...", retry_delay)
-                    sleep(retry_delay)
-                    retry_delay *= 2  # exponential backoff
-                else:
-                    logging.error("- all vector translate attempts failed for %s.%s", schema_name, layer)
-                    return
+    # Retry logic for GDAL VectorTranslate operation
+    max_retries = profile["retries"]
+    retry_delay = profile["retry_delay"]  # seconds
+    load_layer = f"{load_schema}.{load_table}"
 
-        if result is None:
-            logging.error("- vector translate failed for %s.%s after %d attempts", schema_name, layer, max_retries)
-            return
+    #: the shapes sql server repaired in each chunk the native loader copied. gdal does not count them
+    repairs = []
+
+    if columns is not None:
+        create = (
+            partial(native.create_table, load_layer, connection=config.DBO_CONNECTION, unlogged=incremental_sync),
+            columns,
+        )
+        append = partial(
+            native.copy,
+            internal_sgid,
+            *internal_name.split("."),
+            columns,
+            geometry_type,
+            load_layer,
+            config.DBO_CONNECTION,
+            repaired=repairs.append,
+        )
+        items = [None if chunk is None else chunks.get_where(chunk) for chunk in ranges]
+    else:
+        translate = partial(_translate, cloud_db, internal_sgid)
+        create = (translate, pg_options)
+        append = translate
+        items = chunk_options
+
+    with utils.timer(timings, "transfer"):
+        retries, error = _transfer(
+            internal_name, load_layer, create, append, items, ranges, profile, run_id, source_rows
+        )
 
-        del result
+    if error is not None:
+        logging.error("- all vector translate attempts failed for %s.%s", schema_name, layer)
 
-        logging.debug("make valid")
-        qualified_layer = f"{schema_name}.{layer}"
+        return outcome.create(internal_name, FAILED, str(error), retries=retries, timings=timings)
 
-        # Retry logic for database operations
-        for attempt in range(max_retries):
-            try:
-                logging.debug("- attempt %d/%d for post-processing operations", attempt + 1, max_retries)
-                make_valid(qualified_layer)
-                schema.update_schema_for(internal_name, qualified_layer)
+    logging.debug("- completed in %s", utils.format_time(perf_counter() - start_seconds))
+
+    repaired = sum(repairs) if repairs else None
+
+    if repaired:
+        logging.info("- repaired %s invalid shapes in %s", repaired, internal_name)
+
+    #: a chunked load was counted when it was checked against the source
+    rows, size = _measure_table(load_layer, source_rows if len(ranges) > 1 else None)
+
+    #: the loaded table is gone once it is swapped in or its changes are applied
+    published = False
+    changes = None
+    #: a table whose schema changed is promoted on every retry instead of applying its changes again
+    full_reload = not incremental_sync
+
+    # Retry logic for database operations
+    for attempt in range(max_retries):
+        try:
+            logging.debug("- attempt %d/%d for post-processing operations", attempt + 1, max_retries)
+
+            if not published:
+                if not full_reload:
+                    with utils.timer(timings, "apply"):
+                        changes = incremental.apply_changes(
+                            load_layer, qualified_layer, incremental.KEYS.get(qualified_layer)
+                        )
+
+                    full_reload = changes is None
+
+                if changes is None:
+                    with utils.timer(timings, "cluster"):
+                        cluster_data(qualified_layer, load_layer)
+
+                if changes is None and defer_spatial_index:
+                    with utils.timer(timings, "spatial_index"):
+                        _create_spatial_index(load_schema, load_table)
+
+                if changes is None:
+                    with utils.timer(timings, "index"):
+                        create_index(qualified_layer, load_layer)
+
+                with utils.timer(timings, "swap"):
+                    if changes is None and incremental_sync:
+                        incremental.promote(load_layer, qualified_layer)
+                    elif changes is None:
+                        schema.swap_table(load_layer, qualified_layer)
+
+                published = True
+
+            with utils.timer(timings, "index"):
                 create_index(qualified_layer)
-                logging.debug("- post-processing completed successfully")
-                break
-            except Exception as ex:
-                logging.warning("- post-processing attempt %d failed: %s", attempt + 1, str(ex))
-                if attempt < max_retries - 1:
-                    logging.info("- retrying post-processing in %d seconds...", retry_delay // (2 ** attempt))
-                    sleep(retry_delay // (2 ** attempt))
-                else:
-                    logging.error("- all post-processing attempts failed for %s.%s", schema_name, layer)
-                    # Don't return here - the data was already imported, just post-processing failed
 
+            if changes is None or sum(changes.values()) > 0:
+                with utils.timer(timings, "generalize"):
+                    generalize_data(qualified_layer)
+
+            logging.debug("- post-processing completed successfully")
+            break
+        except Exception as ex:
+            logging.warning("- post-processing attempt %d failed: %s", attempt + 1, str(ex))
+            if attempt < max_retries - 1:
+                logging.info("- retrying post-processing in %d seconds...", retry_delay // (2 ** attempt))
+                retries += 1
+                sleep(retry_delay // (2 ** attempt))
+            else:
+                logging.error("- all post-processing attempts failed for %s.%s", schema_name, layer)
+                #: the data was already imported, just post-processing failed
+
+                return outcome.create(
+                    internal_name,
+                    FAILED,
+                    f"post-processing failed: {ex}",
+                    rows=rows,
+                    bytes=size,
+                    retries=retries,
+                    timings=timings,
+                )
+
+    files = None
+    if config.get_sinks():
+        #: the files are written from the table that was just loaded so the source is read once
+        with utils.timer(timings, "publish"):
+            files = _publish_files(qualified_layer)
+
+    return outcome.create(
+        internal_name,
+        SUCCESS,
+        loader="gdal" if columns is None else "native",
+        profile=profile["name"],
+        weight=profile["weight"],
+        rows=rows,
+        bytes=size,
+        repaired=repaired,
+        retries=retries,
+        changes=changes,
+        files=files,
+        timings=timings,
+    )
+
+
+def _transfer(table, load_layer, create, append, items, ranges, profile, run_id=None, source_rows=None):
+    """creates the load table and appends the chunks to it. the chunks of a journaled run are checkpointed
+    so the same run continues an interrupted load with the chunks that are left
+    table: string schema.table in the source
+    load_layer: string schema.table to load
+    create: tuple with 0: function that creates the load table, 1: its argument
+    append: function that loads a chunk
+    items: array of the argument of append for each chunk
+    ranges: array from chunks.get_ranges in the same order as items
+    profile: dictionary from profiles.select
+    run_id: the id of the journaled run or None
+    source_rows: the rows in the source. a chunked load is only published when it ends with the same number
+    returns: tuple with 0: the number of retries, 1: the error of a step that failed every attempt or None
+    """
+    store = None
+    done = []
+
+    if run_id is not None and len(ranges) > 1 and source_rows is not None:
+        store = state.get_store()
+        done = journal.read_chunks(store, run_id, table)
+
+        if done and not incremental.table_exists(load_layer):
+            done = []
+
+        if done:
+            logging.info("- continuing %s with %s of %s chunks loaded", table, len(done), len(ranges))
+        else:
+            journal.clear_chunks(store, run_id, table)
+
+    retries = 0
+
+    if not done:
+        retries, error = chunks.load([create[1]], create[0], profile["retries"], profile["retry_delay"])
+
+        if error is not None:
+            return retries, error
+
+    pending = [(item, chunk) for item, chunk in zip(items, ranges, strict=False) if chunk not in done]
+
+    if len(ranges) > 1:
+        logging.info("- loading %s chunks", len(pending))
+
+    def checkpoint(position):
+        journal.complete_chunk(store, run_id, table, pending[position][1])
+
+    chunk_retries, error = chunks.load(
+        [item for item, _ in pending],
+        append,
+        profile["retries"],
+        profile["retry_delay"],
+        len(pending),
+        checkpoint if store is not None else None,
+    )
+    retries += chunk_retries
+
+    if error is None and len(ranges) > 1 and source_rows is not None:
+        rows = _count_rows(load_layer)
+
+        if rows != source_rows and done:
+            logging.warning("- %s has %s rows but the source has %s, loading it again", load_layer, rows, source_rows)
+
+            again_retries, error = _transfer(table, load_layer, create, append, items, ranges, profile)
+
+            return retries + again_retries, error
 
-def import_data(if_not_exists, missing_only, dry_run):
+        if rows != source_rows:
+            #: a chunk that landed somewhere else leaves the load table short so it must not be swapped in
+            error = RuntimeError(f"{load_layer} has {rows} rows but the source has {source_rows}")
+
+    return retries, error
+
+
+def _count_rows(table):
+    """counts the rows of a chunked load table to make sure every chunk landed in it
+    table: string schema.table
+    returns: the number of rows or None when it could not be counted
+    """
+    try:
+        with connect(config.DBO_CONNECTION) as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(f"SELECT count(*) FROM {table}")
+
+                return cursor.fetchone()[0]
+    except psycopg2.Error as ex:
+        logging.warning("- unable to count %s: %s", table, ex)
+
+        return None
+
+
+def _translate(destination, source, options):
+    """runs one vector translate
+    destination: the ogr connection to the destination
+    source: the ogr connection to the source
+    options: gdal.VectorTranslateOptions
+    """
+    result = gdal.VectorTranslate(destination, source, options=options)
+
+    if result is None:
+        raise RuntimeError("vector translate returned no result")
+
+    del result
+
+
+def _export(table, path, sink):
+    """writes a destination table to a file for a sink
+    table: schema.table in the destination
+    path: the file to write
+    sink: the name of the file format in sinks.SINKS
+    """
+    cloud_db = config.format_ogr_connection(config.DBO_CONNECTION)
+
+    if gdal.GetDriverByName(sinks.SINKS[sink]["driver"]) is None:
+        raise RuntimeError(f"gdal was built without the {sinks.SINKS[sink]['driver']} driver")
+
+    options = gdal.VectorTranslateOptions(options=sinks.get_options(sink, table))
+    _translate(path, cloud_db, options)
+
+
+def _publish_files(table):
+    """publishes a destination table as each configured file format
+    table: schema.table in the destination
+    returns: dictionary of sink to the file that was written or failed
+    """
+    unknown = [sink for sink in config.get_sinks() if sink not in sinks.SINKS]
+
+    if unknown:
+        logging.warning("- skipping the unknown file formats %s", ", ".join(unknown))
+
+    files = sinks.publish(
+        lambda path, sink: _export(table, path, sink),
+        [sink for sink in config.get_sinks() if sink in sinks.SINKS],
+        table,
+        config.get_sink_location(),
+    )
+
+    logging.info("- published %s", ", ".join(files.values()))
+
+    return files
+
+
+def _create_spatial_index(schema_name, table):
+    """builds the spatial index gdal would have created once the rows are loaded
+    schema_name: string schema name
+    table: string table name
+    """
+    name = f"{table}_shape_geom_idx"[: schema.MAX_IDENTIFIER_LENGTH]
+
+    execute_sql(
+        f'CREATE INDEX IF NOT EXISTS "{name}" ON {schema_name}."{table}" USING gist (shape)',
+        config.DBO_CONNECTION,
+        config.SESSION_SETTINGS["index"],
+    )
+
+
+def _measure_table(table, rows=None):
+    """measures the rows and bytes of a loaded table for the run report without scanning it. the rows are the
+    planner estimate after the table is analyzed, which is exact for small tables
+    table: string schema.table
+    rows: the exact rows when they are already known, e.g. a chunked load that was checked against the source
+    returns: tuple with 0: rows, 1: bytes or None for both when it could not be measured
+    """
+    try:
+        with connect(config.DBO_CONNECTION) as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(f"ANALYZE {table}")
+                cursor.execute(
+                    "SELECT reltuples::bigint, pg_total_relation_size(oid) FROM pg_class WHERE oid = to_regclass(%s)",
+                    (table,),
+                )
+                estimate, size = cursor.fetchone()
+
+                return (estimate if rows is None else rows), size
+    except psycopg2.Error as ex:
+        logging.warning("- unable to measure %s: %s", table, ex)
+
+        return None, None
+
+
+def _sync_tables(
+    layer_schema_map, agol_meta_map, dry_run, workers=1, incremental_sync=False, run_journal=None, step=None
+):
+    """replaces the data for each table serially or with a bounded pool of worker processes
+    layer_schema_map: array of tuples from _get_tables_with_fields
+    workers: the maximum number of tables to sync at the same time
+    incremental_sync: apply only the changed rows to existing tables
+    run_journal: the journal.Journal of the run. tables the step finished before a restart are not synced again
+    step: the name of the step in the journal, e.g. import or update
+    returns: the summary from outcome.summarize
+    """
+    results = []
+    store = state.LazyStore()
+    run_id = None
+
+    if run_journal is not None:
+        run_id = run_journal.id
+        results, left = outcome.split_finished(
+            [f"{schema_name}.{layer}" for schema_name, layer, _ in layer_schema_map], partial(run_journal.is_done, step)
+        )
+        layer_schema_map = [items for items in layer_schema_map if f"{items[0]}.{items[1]}" in left]
+
+    steps = _plan_tables(layer_schema_map, agol_meta_map, store)
+    projected_seconds = planner.project(steps, workers)
+
+    if dry_run:
+        logging.info("%s", planner.format_plan(steps, workers))
+    else:
+        logging.info("projected %s for %s tables", utils.format_time(projected_seconds), len(steps))
+
+    #: the largest tables start first so the workers finish together
+    order = {step["table"]: position for position, step in enumerate(steps)}
+    layer_schema_map = sorted(layer_schema_map, key=lambda items: order[f"{items[0]}.{items[1]}"])
+
+    jobs.start_tables([f"{schema_name}.{layer}" for schema_name, layer, _ in layer_schema_map])
+
+    tables = [
+        (f"{schema_name}.{layer}", (schema_name, layer, fields, agol_meta_map, dry_run, incremental_sync, run_id))
+        for schema_name, layer, fields in layer_schema_map
+    ]
+
+    def finished(result):
+        _checkpoint_table(run_journal, step, result)
+        jobs.finish_table(result["table"], result["status"] == FAILED)
+
+    if workers <= 1 or len(tables) <= 1:
+        results += outcome.run_tables(tables, _replace_data, started=jobs.start_table, finished=finished)
+    else:
+        workers = min(workers, len(tables))
+        logging.info("syncing %s tables with %s workers", len(tables), workers)
+
+        #: spawn a fresh interpreter for each worker so no gdal or connection state is shared
+        context = get_context("spawn")
+
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_configure_gdal) as executor:
+            results += outcome.run_tables(
+                tables, _replace_data, workers, executor, started=jobs.start_table, finished=finished
+            )
+
+    summary = outcome.summarize(results)
+    summary["projected_seconds"] = projected_seconds
+
+    if not dry_run:
+        planner.record(store, summary)
+
+    return summary
+
+
+def _checkpoint_table(run_journal, step, result):
+    """records a table that synced in the journal of the run"""
+    if run_journal is not None and result["status"] == SUCCESS:
+        run_journal.complete(step, result["table"])
+
+
+def _plan_tables(layer_schema_map, agol_meta_map, store):
+    """builds the sync plan for the tables with estimates from the source sizes and past runs
+    layer_schema_map: array of tuples from _get_tables_with_fields
+    store: the state store with the history of past runs
+    returns: array from planner.create_plan
+    """
+    actions = {}
+    existing = set(_get_destination_catalog())
+
+    for schema_name, layer, _ in layer_schema_map:
+        table = f"{schema_name}.{layer}"
+
+        if schema_name not in agol_meta_map or layer not in agol_meta_map[schema_name]:
+            actions[table] = planner.SKIP
+        elif _check_if_exists(schema_name, layer, agol_meta_map, existing):
+            actions[table] = planner.RELOAD
+        else:
+            actions[table] = planner.CREATE
+
+    return planner.create_plan(actions, _get_source_sizes(), planner.read_history(store))
+
+
+def import_data(if_not_exists, missing_only, dry_run, workers=1, snapshot=None, run_journal=None):
     """imports data from sql to postgis
     if_not_exists: create new tables if the destination does not have it
     dry_run: do not modify the destination
     missing_only: only import missing tables
+    workers: the number of tables to import at the same time
+    snapshot: the meta.Snapshot for the run. it is loaded when not provided
+    run_journal: the journal.Journal of the run to checkpoint the tables in
+    returns: the summary from outcome.summarize or None when there is nothing to import
     """
     logging.info("importing tables missing from the source")
 
@@ -377,8 +885,10 @@ def import_data(if_not_exists, missing_only, dry_run):
 
     tables = []
     if missing_only:
-        source, destination = _get_table_sets()
-        tables = destination - source
+        snapshot = snapshot or get_table_meta()
+        source, destination = _get_table_sets(snapshot)
+        renamed = _rename_tables(source, destination, snapshot, dry_run)
+        tables = destination - source - set(renamed.values())
 
         table_count = len(tables)
 
@@ -394,70 +904,132 @@ def import_data(if_not_exists, missing_only, dry_run):
         if table_count == 0:
             return
 
-    agol_meta_map = _get_table_meta()
+    snapshot = snapshot or get_table_meta()
+    agol_meta_map = snapshot.tables
 
     if missing_only:
-        origin_table_name = []
-
         #: reverse lookup the table names
-        for table in tables:
-            schema_name, table_name = table.split(".")
-            schema_name = schema_name.lower()
-            table_name = table_name.lower()
-
-            schema_items = agol_meta_map[schema_name]
-            for origin_name in schema_items:
-                if schema_items[origin_name]["title"] == table_name:
-                    origin_table_name.append(f"{schema_name}.{origin_name}")
-                    break
+        origin_table_name = [snapshot.get_source_table(table) for table in tables]
+        origin_table_name = [table for table in origin_table_name if table is not None]
 
         if len(origin_table_name) > 0:
             tables = origin_table_name
 
     layer_schema_map = _get_tables_with_fields(internal_sgid, tables)
 
-    for schema_name, layer, fields in layer_schema_map:
-        if if_not_exists and _check_if_exists(cloud_db, schema_name, layer, agol_meta_map):
-            logging.info("- skipping %s.%s already exists", schema_name, layer)
+    if if_not_exists:
+        missing_layers = []
+        existing = set(_get_destination_catalog())
 
-            continue
+        for schema_name, layer, fields in layer_schema_map:
+            if _check_if_exists(schema_name, layer, agol_meta_map, existing):
+                logging.info("- skipping %s.%s already exists", schema_name, layer)
 
-        _replace_data(schema_name, layer, fields, agol_meta_map, dry_run)
+                continue
 
+            missing_layers.append((schema_name, layer, fields))
+
+        layer_schema_map = missing_layers
+
+    summary = _sync_tables(layer_schema_map, agol_meta_map, dry_run, workers, run_journal=run_journal, step="import")
+
+    if not dry_run:
+        catalog.invalidate(cloud_db)
 
-def _get_table_sets():
+    return summary
+
+
+def _get_table_sets(snapshot=None):
     """gets a set of each schema.tablename from the source and destination database to
     help figure out what is different between them
+    snapshot: the meta.Snapshot for the run. it is only loaded when the source is not cached
     """
-    cloud_db = config.format_ogr_connection(config.DBO_CONNECTION)
     internal_sgid = config.get_source_connection()
 
-    if cloud_db not in CONNECTION_TABLE_CACHE:
-        logging.debug("populating postgres table cache")
-        _populate_table_cache(cloud_db)
-        logging.debug("finished populating postgres table cache")
+    #: companion tables are not in the source. they are trimmed with their layer. shadow and staging tables
+    #: belong to a load that is running or can be continued so they are left alone
+    source = [
+        table
+        for table in _get_destination_catalog()
+        if not generalize.is_companion(table)
+        and not schema.is_shadow(table)
+        and table.split(".")[0] != config.STAGING_SCHEMA
+    ]
+    destination = catalog.get_tables(internal_sgid)
 
-    if internal_sgid not in CONNECTION_TABLE_CACHE:
+    if destination is None:
         logging.debug("populating mssql table cache")
-        _populate_table_cache(internal_sgid, pgify=True, name_map=_get_table_meta())
+        destination = _populate_table_cache(internal_sgid, pgify=True, name_map=(snapshot or get_table_meta()).tables)
         logging.debug("finished populating mssql table cache")
 
-    source = set(CONNECTION_TABLE_CACHE[cloud_db])
-    destination = set(CONNECTION_TABLE_CACHE[internal_sgid])
+    return set(source), set(destination)
+
+
+def _rename_tables(source, destination, snapshot, dry_run):
+    """renames the destination tables whose published name changed instead of dropping and loading them again
+    and remembers the source table of each destination table for the next run
+    source: set of schema.table in the destination from _get_table_sets
+    destination: set of schema.title from the source from _get_table_sets
+    snapshot: the meta.Snapshot for the run
+    dry_run: do not modify the destination
+    returns: dictionary of the schema.table that was renamed to its new schema.table
+    """
+    store = state.LazyStore()
+    pairs = renames.find_renames(source - destination, destination - source, renames.read_names(store), snapshot)
+    renamed = {}
+
+    for table, new_table in pairs.items():
+        logging.info("renaming %s to %s", table, new_table)
+
+        if dry_run:
+            renamed[table] = new_table
+
+            continue
+
+        try:
+            schema.rename_table(table, new_table)
+        except psycopg2.Error as error:
+            logging.warning("unable to rename %s, it will be dropped and loaded again: %s", table, error)
+
+            continue
+
+        renamed[table] = new_table
 
-    return source, destination
+        #: companions follow their layer when the new name is generalized at the same tolerance
+        for tolerance in generalize.GENERALIZATIONS.get(table, []):
+            companion = generalize.get_name(table, tolerance)
 
+            try:
+                if tolerance in generalize.GENERALIZATIONS.get(new_table, []):
+                    schema.rename_table(companion, generalize.get_name(new_table, tolerance))
+                else:
+                    schema_part, companion_name = companion.split(".")
+                    execute_sql(f'DROP TABLE IF EXISTS {schema_part}."{companion_name}"', config.DBO_CONNECTION)
+            except psycopg2.Error as error:
+                logging.warning("unable to move the companion %s, it is built with the next load: %s", companion, error)
+
+    if not dry_run:
+        if renamed:
+            catalog.invalidate(config.format_ogr_connection(config.DBO_CONNECTION))
+
+        renames.record_names(store, (source - set(renamed)) | set(renamed.values()), snapshot)
 
-def trim(dry_run):
+    return renamed
+
+
+def trim(dry_run, snapshot=None):
     """get source tables with updated names
     get destination tables with original names
-    drop the tables in the destination found in the difference between the two sets
+    rename the tables whose published name changed and drop the rest of the difference between the two sets
+    snapshot: the meta.Snapshot for the run. it is loaded when not provided
     """
 
     logging.info("trimming tables that do not exist in the source")
 
-    source, destination = _get_table_sets()
-    items_to_trim = source - destination
+    snapshot = snapshot or get_table_meta()
+    source, destination = _get_table_sets(snapshot)
+    renamed = _rename_tables(source, destination, snapshot, dry_run)
+    items_to_trim = source - destination - set(renamed)
     items_to_trim_count = len(items_to_trim)
 
     verb = "are"
@@ -472,24 +1044,35 @@ def trim(dry_run):
     if items_to_trim_count == 0:
         return
 
+    if dry_run:
+        logging.info("%s", planner.format_plan(planner.create_plan(dict.fromkeys(items_to_trim, planner.DROP))))
+
+    companions = [companion for item in items_to_trim for companion in generalize.get_companions(item)]
+
     clean_items = []
-    for item in items_to_trim:
+    for item in [*items_to_trim, *companions]:
         schema_part, table = item.split(".")
         clean_items.append(f'{schema_part}."{table}"')
 
-    sql = f'DROP TABLE {",".join(clean_items)}'
+    sql = f'DROP TABLE IF EXISTS {",".join(clean_items)}'
     logging.info("dropping %s", clean_items)
 
     if not dry_run:
         execute_sql(sql, config.DBO_CONNECTION)
+        catalog.invalidate(config.format_ogr_connection(config.DBO_CONNECTION))
 
     logging.info("finished")
 
 
-def update(specific_tables, dry_run):
+def update(specific_tables, dry_run, workers=1, incremental_sync=False, snapshot=None, run_journal=None):
     """update specific tables in the destination
     specific_tables: a list of tables from the source without the schema
     dry_run: bool if insertion should actually happen
+    workers: the number of tables to update at the same time
+    incremental_sync: apply only the inserted, updated, and deleted rows unless the schema changed
+    snapshot: the meta.Snapshot for the run. it is loaded when not provided
+    run_journal: the journal.Journal of the run to checkpoint the tables in
+    returns: the summary from outcome.summarize or None when there is nothing to update
     """
     logging.info("updating tables %s", ",".join(specific_tables))
 
@@ -507,122 +1090,330 @@ def update(specific_tables, dry_run):
 
         return
 
-    agol_meta_map = _get_table_meta()
+    agol_meta_map = (snapshot or get_table_meta()).tables
 
     if len(specific_tables) != len(layer_schema_map):
         logging.warning(
             "input %s tables but only %s found. check your spelling", len(specific_tables), len(layer_schema_map)
         )
 
-    for schema_name, layer, fields in layer_schema_map:
-        _replace_data(schema_name, layer, fields, agol_meta_map, dry_run)
+    if incremental_sync and not dry_run:
+        incremental.create_staging_schema()
 
+    summary = _sync_tables(layer_schema_map, agol_meta_map, dry_run, workers, incremental_sync, run_journal, "update")
 
-def read_last_check_date(gcp_bucket):
-    """reads the last check date from the config file
-    gcp_bucket: the bucket to find the file in
+    if not dry_run:
+        catalog.invalidate(config.format_ogr_connection(config.DBO_CONNECTION))
+
+    return summary
+
+
+def _get_ogr_changes(since):
+    """the ogr version of the change detection query for a source that is not sql server, e.g. a geopackage
+    since: the time the tables must be modified after
+    returns: array of tuples with 0: the source table name, 1: the time it was modified
     """
-    last_date_string = None
-    last_checked = gcp_bucket.get_blob(".last_checked")
+    source = ogr.Open(config.get_source_connection())
+    layer = source.GetLayerByName("meta.changedetection")
+    rows = []
 
+    for feature in layer or []:
+        year, month, day, hour, minute, second, _ = feature.GetFieldAsDateTime("LAST_MODIFIED")
+        last_modified = datetime(year, month, day, hour, minute, int(second))
 
-    if last_checked is None:
-        return None
+        if last_modified > since:
+            rows.append((feature.GetField("TABLE_NAME"), last_modified))
 
-    last_date_string = last_checked.download_as_text().strip()
+    return rows
 
-    logging.info("reading last check date from .last_checked: %s", last_date_string)
 
-    if last_date_string is None or len(last_date_string) < 1:
-        return None
+def get_tables_from_change_detection(store):
+    """get changes from cambiador managed table that are newer than the watermark of each table
+    store: the state.FileStore or state.GcsStore with the watermarks
+    returns: dictionary of schema.table to the time it was modified
+    """
+    watermarks = state.read_watermarks(store)
+    since = state.get_since(watermarks)
 
-    return last_date_string
+    logging.info("Checking for changes since %s", since)
+
+    if not config.is_sql_server_source():
+        source_rows = _get_ogr_changes(since)
+    else:
+        with pyodbc.connect(config.get_source_connection()[6:]) as connection:
+            cursor = connection.cursor()
 
+            cursor.execute(
+                "SELECT [TABLE_NAME], [LAST_MODIFIED] FROM [SGID].[META].[CHANGEDETECTION] WHERE [LAST_MODIFIED] > ?",
+                since,
+            )
+            source_rows = cursor.fetchall()
 
-def update_last_check_date(gcp_bucket):
-    """updates the last check date in the config file
-    gcp_bucket: the bucket to find the file in
+    rows = []
+
+    #: table: SGID.ENVIRONMENT.DAQPermitCompApproval
+    for table, last_modified in source_rows:
+        table_parts = utils.get_schema_table_name_map(table)
+
+        rows.append((f"{table_parts['schema']}.{table_parts['table_name']}", last_modified))
+
+    changes = state.get_changed_tables(rows, watermarks)
+
+    logging.info("%s tables changed", len(changes))
+
+    return changes
+
+
+def update_from_change_detection(
+    dry_run, workers=1, incremental_sync=False, snapshot=None, store=None, run_journal=None
+):
+    """updates the tables that changed and advances the watermarks of the tables that did not fail
+    store: the state store with the watermarks. defaults to state.get_store()
+    run_journal: the journal.Journal of the run. tables that synced before a restart count as synced
+    returns: the summary from update or None when there is nothing to update
     """
-    blob = gcp_bucket.get_blob(".last_checked")
+    store = store or state.get_store()
+    changes = get_tables_from_change_detection(store)
+
+    summary = update(list(changes), dry_run, workers, incremental_sync, snapshot, run_journal)
+
+    if not dry_run:
+        #: tables that are skipped, e.g. not in the meta table, or not found are done with their change
+        failed = summary["failed"] if summary is not None else {}
+        state.advance_watermarks(store, changes, [table for table in changes if table not in failed])
 
-    if blob is None:
-        blob = storage.Blob(".last_checked", gcp_bucket)
+    return summary
 
-    blob.upload_from_string(datetime.today().strftime("%Y-%m-%d"))
 
+def _get_source_sizes():
+    """gets the rows and bytes of every source table with one query for planning a sync
+    returns: dictionary of schema.table to a tuple with 0: rows, 1: bytes or None for bytes if unknown
+    """
+    if not config.is_sql_server_source():
+        try:
+            source = ogr.Open(config.get_source_connection())
 
-def get_tables_from_change_detection():
-    """get changes from cambiador managed table"""
-    client = storage.Client()
-    bucket = client.get_bucket("ut-dts-agrc-open-sgid-prod-data")
+            return {layer.GetName().lower(): (layer.GetFeatureCount(), None) for layer in source}
+        except RuntimeError as ex:
+            logging.warning("unable to count the source tables: %s", ex)
 
-    last_checked = read_last_check_date(bucket)
+            return {}
 
-    if last_checked is None:
-        last_checked = datetime.today()
-    else:
+    try:
+        with pyodbc.connect(config.get_source_connection()[6:]) as connection:
+            cursor = connection.cursor()
+            cursor.execute(
+                """SELECT
+    LOWER(s.name),
+    LOWER(t.name),
+    SUM(CASE WHEN p.index_id IN (0, 1) AND a.type = 1 THEN p.rows ELSE 0 END),
+    SUM(a.used_pages) * 8192
+FROM
+    sys.tables t
+INNER JOIN sys.schemas s ON
+    s.schema_id = t.schema_id
+INNER JOIN sys.partitions p ON
+    p.object_id = t.object_id
+INNER JOIN sys.allocation_units a ON
+    a.container_id = p.partition_id
+GROUP BY
+    s.name,
+    t.name;"""
+            )
+
+            return {f"{schema_name}.{table}": (rows, size) for schema_name, table, rows, size in cursor.fetchall()}
+    except pyodbc.Error as ex:
+        logging.warning("unable to size the source tables: %s", ex)
+
+        return {}
+
+
+def _get_source_size(schema_name, layer):
+    """estimates the size of a source table for picking a load profile without scanning it
+    schema_name: string schema name in the source
+    layer: string table name in the source
+    returns: tuple with 0: rows, 1: the average vertices of a sample of the shapes or None for either if unknown
+    """
+    if not config.is_sql_server_source():
         try:
-            last_checked = datetime.strptime(last_checked, "%Y-%m-%d")
-        except ValueError:
-            logging.error("invalid date format in .last_checked: %s", last_checked, exc_info=True)
-            last_checked = last_checked
+            source = ogr.Open(config.get_source_connection())
+            source_layer = source.GetLayerByName(f"{schema_name}.{layer}")
 
-    logging.info("Checking for changes since %s", last_checked)
+            return (source_layer.GetFeatureCount() if source_layer else None), None
+        except RuntimeError as ex:
+            logging.warning("- unable to count %s.%s: %s", schema_name, layer, ex)
 
-    updated_tables = []
-    with pyodbc.connect(config.get_source_connection()[6:]) as connection:
-        cursor = connection.cursor()
+            return None, None
 
-        cursor.execute(
-            "SELECT [TABLE_NAME] FROM [SGID].[META].[CHANGEDETECTION] WHERE [LAST_MODIFIED] >= ?", last_checked
-        )
-        rows = cursor.fetchall()
+    try:
+        with pyodbc.connect(config.get_source_connection()[6:]) as connection:
+            cursor = connection.cursor()
+            cursor.execute(
+                "SELECT SUM(rows) FROM sys.partitions WHERE object_id = OBJECT_ID(?) AND index_id IN (0, 1)",
+                f"{schema_name}.{layer}",
+            )
+            rows = cursor.fetchone()[0]
 
-        #: table: SGID.ENVIRONMENT.DAQPermitCompApproval
-        for (table,) in rows:
-            table_parts = _get_schema_table_name_map(table)
+            column = _get_geometry_column(cursor, schema_name, layer)
 
-            table_schema = table_parts["schema"]
-            table_name = table_parts["table_name"]
-            updated_tables.append(f"{table_schema}.{table_name}")
+            if column is None:
+                return rows, None
 
-    update_last_check_date(bucket)
+            cursor.execute(
+                f"SELECT AVG(CAST([{column}].STNumPoints() AS float)) FROM "
+                f"(SELECT TOP {VERTEX_SAMPLE} [{column}] FROM [{schema_name}].[{layer}]) sample"
+            )
 
-    return updated_tables
+            return rows, cursor.fetchone()[0]
+    except pyodbc.Error as ex:
+        logging.warning("- unable to size %s.%s: %s", schema_name, layer, ex)
 
+        return None, None
 
-def make_valid(layer):
-    """update invalid shapes in postgres"""
-    sql = f"UPDATE {layer} SET shape = ST_MakeValid(shape) WHERE ST_IsValid(shape) = false;"
 
-    unfixable_layers = ["utilities.broadband_service"]
-    if layer in unfixable_layers:
-        return
+def _get_key_range(schema_name, layer):
+    """finds the smallest and largest objectid of a source table to split it into chunks
+    schema_name: string schema name in the source
+    layer: string table name in the source
+    returns: tuple with 0: the smallest, 1: the largest objectid or None for both if it is empty or unknown
+    """
+    if not config.is_sql_server_source():
+        try:
+            source = ogr.Open(config.get_source_connection())
+            result = source.ExecuteSQL(f'SELECT MIN({chunks.KEY}), MAX({chunks.KEY}) FROM "{schema_name}.{layer}"')
+            feature = result.GetNextFeature() if result else None
+            key_range = (feature.GetField(0), feature.GetField(1)) if feature else (None, None)
+
+            if result:
+                source.ReleaseResultSet(result)
+
+            return key_range
+        except RuntimeError as ex:
+            logging.warning("- unable to find the key range of %s.%s: %s", schema_name, layer, ex)
+
+            return None, None
 
     try:
-        execute_sql(sql, config.DBO_CONNECTION)
-    except psycopg2.errors.UndefinedColumn:
-        #: table doesn't have shape field
-        pass
+        with pyodbc.connect(config.get_source_connection()[6:]) as connection:
+            cursor = connection.cursor()
+            cursor.execute(f"SELECT MIN([{chunks.KEY}]), MAX([{chunks.KEY}]) FROM [{schema_name}].[{layer}]")
+
+            return tuple(cursor.fetchone())
+    except pyodbc.Error as ex:
+        logging.warning("- unable to find the key range of %s.%s: %s", schema_name, layer, ex)
 
+        return None, None
 
-def create_index(layer):
-    """creates an index if available in the index map"""
-    if layer.lower() not in INDEXES:
+
+def _get_geometry_column(cursor, schema_name, layer):
+    """finds the shape column of a source table
+    returns: string column name or None when the table is not spatial
+    """
+    cursor.execute(
+        """SELECT TOP 1
+    COLUMN_NAME
+FROM
+    INFORMATION_SCHEMA.COLUMNS
+WHERE
+    LOWER(TABLE_SCHEMA) = ?
+    AND LOWER(TABLE_NAME) = ?
+    AND DATA_TYPE = 'geometry';""",
+        schema_name,
+        layer,
+    )
+    row = cursor.fetchone()
+
+    return row[0] if row else None
+
+
+def create_index(layer, table=None):
+    """creates the missing indexes if available in the index map
+    layer: schema.table the indexes are configured for
+    table: schema.table to create the indexes on when it is not the layer, e.g. a shadow table
+    """
+    layer = layer.lower()
+
+    if layer not in index.INDEXES:
         return
 
     logging.debug("- adding index")
-    for sql in INDEXES[layer]:
-        try:
-            execute_sql(sql, config.DBO_CONNECTION)
-        except Exception as ex:
-            logging.warning("- failed running: %s%s", sql, ex)
+
+    #: a table that is not the layer has not been published yet so it can be locked while it builds
+    index.sync_indexes(
+        {layer: table or layer},
+        config.DBO_CONNECTION,
+        config.SESSION_SETTINGS["index"],
+        concurrently=table is None,
+    )
+
+
+def generalize_data(layer):
+    """rebuilds the simplified companion tables of a layer if available in the generalization map.
+    each companion is built in a shadow table and swapped in so it carries over its privileges
+    layer: schema.table that was reloaded
+    """
+    layer = layer.lower()
+
+    for tolerance in generalize.GENERALIZATIONS.get(layer, []):
+        companion = generalize.get_name(layer, tolerance)
+        schema_name, companion_name = companion.split(".")
+        shadow_table = f"{schema_name}.{schema.get_shadow_name(companion_name)}"
+
+        generalize.build(layer, tolerance, shadow_table, config.DBO_CONNECTION, config.SESSION_SETTINGS["generalize"])
+        schema.swap_table(shadow_table, companion)
+
+
+def cluster_data(layer, table=None, force=False):
+    """writes the rows in clustered order if available in the cluster map. the ordered rows are written to a new
+    table and swapped in so readers of a published table are not blocked while it is written
+    layer: schema.table the clustering is configured for
+    table: schema.table to rewrite when it is not the layer, e.g. a freshly loaded shadow table that is indexed after
+    force: rewrite even if the table is already clustered. a table that is not the layer is always rewritten
+    """
+    layer = layer.lower()
+
+    if layer not in cluster.CLUSTERS:
+        return
+
+    def publish(_, ordered_table, replaced_table):
+        if table is None:
+            schema_name, ordered_name = ordered_table.split(".")
+
+            _create_spatial_index(schema_name, ordered_name)
+            create_index(layer, ordered_table)
+
+        schema.swap_table(ordered_table, replaced_table)
+
+    cluster.cluster_tables(
+        {layer: table or layer},
+        config.DBO_CONNECTION,
+        config.SESSION_SETTINGS["cluster"],
+        force=force or table is not None,
+        publish=publish,
+    )
+
+
+def _get_workers(args):
+    """parses the --workers option into a positive number"""
+    workers = args["--workers"]
+
+    if workers is None:
+        return 1
+
+    try:
+        return max(int(workers), 1)
+    except ValueError:
+        logging.warning("invalid --workers value %s, using 1", workers)
+
+        return 1
 
 
 def main():
     """Main entry point for program. Parse arguments and pass to sweeper modules."""
     args = docopt(__doc__, version="1.1.0")
 
+    atexit.register(close_pools)
+
     start_seconds = perf_counter()
 
     if args["enable"]:
@@ -661,8 +1452,29 @@ def main():
             sys.exit()
 
         if args["indexes"]:
-            for key, _ in INDEXES.items():
-                create_index(key)
+            workers = _get_workers(args) if args["--workers"] else POOL_SIZE
+
+            index.sync_indexes(
+                {layer: layer for layer in index.INDEXES},
+                config.DBO_CONNECTION,
+                config.SESSION_SETTINGS["index"],
+                workers=workers,
+                concurrently=True,
+            )
+
+            logging.info("completed in %s", utils.format_time(perf_counter() - start_seconds))
+
+            sys.exit()
+
+    if args["cluster"]:
+        layers = [table.lower() for table in args["--table"]] or list(cluster.CLUSTERS)
+
+        for layer in layers:
+            cluster_data(layer, force=args["--force"])
+
+        logging.info("completed in %s", utils.format_time(perf_counter() - start_seconds))
+
+        sys.exit()
 
     if args["drop"]:
         if args["schema"]:
@@ -685,26 +1497,37 @@ def main():
                 sys.exit()
 
     if args["import"]:
-        import_data(args["--skip-if-exists"], args["--missing"], args["--dry-run"])
+        run_report = report.create("import")
+        summary = import_data(args["--skip-if-exists"], args["--missing"], args["--dry-run"], _get_workers(args))
+
+        report.add_step(run_report, "import", perf_counter() - start_seconds, summary)
+        report.finish(run_report, perf_counter() - start_seconds, args["--report"])
 
         logging.info("completed in %s", utils.format_time(perf_counter() - start_seconds))
 
         sys.exit()
 
     if args["trim"]:
+        run_report = report.create("trim")
         trim(args["--dry-run"])
 
+        report.add_step(run_report, "trim", perf_counter() - start_seconds)
+        report.finish(run_report, perf_counter() - start_seconds, args["--report"])
+
         logging.info("completed in %s", utils.format_time(perf_counter() - start_seconds))
 
         sys.exit()
 
     if args["update"]:
-        tables = args["--table"]
+        run_report = report.create("update")
 
         if args["--from-change-detection"]:
-            tables = get_tables_from_change_detection()
+            summary = update_from_change_detection(args["--dry-run"], _get_workers(args), args["--incremental"])
+        else:
+            summary = update(args["--table"], args["--dry-run"], _get_workers(args), args["--incremental"])
 
-        update(tables, args["--dry-run"])
+        report.add_step(run_report, "update", perf_counter() - start_seconds, summary)
+        report.finish(run_report, perf_counter() - start_seconds, args["--report"])
 
         logging.info("completed in %s", utils.format_time(perf_counter() - start_seconds))
 
@@ -713,11 +1536,11 @@ def main():
     if args["update-schema"]:
         tables = args["--table"]
 
+        agol_meta_map = get_table_meta().tables
+
         if len(tables) == 0:
-            schema.update_schemas(_get_table_meta(), args["--dry-run"])
+            schema.update_schemas(agol_meta_map, args["--dry-run"], _get_workers(args))
         else:
-            agol_meta_map = _get_table_meta()
-
             for sgid_table in tables:
                 schema_name, table_name = sgid_table.lower().split(".")
                 pg_table = f'{schema_name}.{agol_meta_map[schema_name][table_name]["title"]}'
@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+# * coding: utf8 *
+"""
+meta.py
+A module that holds a snapshot of the meta.agolitems table for a run
+"""
+
+from typing import NamedTuple
+
+from . import utils
+
+
+class Snapshot(NamedTuple):
+    """the meta.agolitems table loaded once and shared by every step of a run
+    tables: dictionary of schema to source table to the destination title and geometry type
+    sources: dictionary of schema.title in the destination to schema.table in the source
+    """
+
+    tables: dict
+    sources: dict
+
+    def get_source_table(self, table):
+        """reverse looks up the source table for a destination table
+        table: string schema.title in the destination
+        returns: string schema.table in the source or None
+        """
+        return self.sources.get(table.lower())
+
+
+def create_snapshot(rows):
+    """builds the forward and reverse indexes for the meta table rows
+    rows: iterable of tuples with 0: qualified source table, 1: published name, 2: geometry type
+    returns: Snapshot
+    """
+    tables = {}
+    sources = {}
+
+    #: table: SGID.ENVIRONMENT.DAQPermitCompApproval
+    #: title: Utah Retail Culinary Water Service Areas
+    #: geometry_type: POINT POLYGON POLYLINE
+    for table, title, geometry_type in rows:
+        table_parts = utils.get_schema_table_name_map(table)
+        pg_title = utils.format_title_for_pg(title)
+
+        schema_name = tables.setdefault(table_parts["schema"], {})
+        schema_name[table_parts["table_name"]] = {"title": pg_title, "geometry_type": geometry_type}
+
+        if pg_title is not None:
+            source_table = f"{table_parts['schema']}.{table_parts['table_name']}"
+            sources.setdefault(f"{table_parts['schema']}.{pg_title}", source_table)
+
+    return Snapshot(tables, sources)
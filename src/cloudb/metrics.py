@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# * coding: utf8 *
+"""
+metrics.py
+A module that keeps histograms and counters for the process and renders them for prometheus
+"""
+
+from threading import Lock
+
+#: seconds. from single statements up to the largest tables
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+ROW_BUCKETS = (100, 1000, 10000, 100000, 1000000, 10000000)
+
+HELP = {
+    "cloudb_execute_sql_seconds": "The time to run a statement with execute_sql",
+    "cloudb_table_phase_seconds": "The time each phase of a table sync takes",
+    "cloudb_step_seconds": "The time each step of a run takes",
+    "cloudb_table_rows": "The rows loaded into a table",
+    "cloudb_table_retries_total": "The retried transfers and post-processing attempts",
+    "cloudb_tables_total": "The tables synced by status",
+}
+
+_histograms = {}
+_counters = {}
+_lock = Lock()
+
+
+def _get_key(labels):
+    """a hashable and ordered version of the labels"""
+    return tuple(sorted(labels.items()))
+
+
+def observe(name, value, buckets=BUCKETS, **labels):
+    """adds a value to a histogram
+    name: the metric name
+    value: the number to record, usually seconds
+    buckets: the upper bounds of the buckets
+    labels: the label names and values for the series
+    """
+    with _lock:
+        series = _histograms.setdefault(name, {"buckets": buckets, "series": {}})["series"]
+        counts, total, observations = series.get(_get_key(labels), ([0] * len(buckets), 0, 0))
+
+        counts = [count + 1 if value <= bound else count for count, bound in zip(counts, buckets, strict=True)]
+        series[_get_key(labels)] = (counts, total + value, observations + 1)
+
+
+def increment(name, value=1, **labels):
+    """adds to a counter
+    name: the metric name
+    value: the amount to add
+    labels: the label names and values for the series
+    """
+    with _lock:
+        series = _counters.setdefault(name, {})
+        series[_get_key(labels)] = series.get(_get_key(labels), 0) + value
+
+
+def _format_labels(key, **extra):
+    """formats the labels of a series"""
+    labels = [*key, *extra.items()]
+
+    if len(labels) == 0:
+        return ""
+
+    escaped = [(name, str(value).replace("\\", "\\\\").replace('"', '\\"')) for name, value in labels]
+
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+def render():
+    """formats every metric in the prometheus text format
+    returns: string
+    """
+    lines = []
+
+    with _lock:
+        for name, histogram in sorted(_histograms.items()):
+            lines.append(f"# HELP {name} {HELP.get(name, name)}")
+            lines.append(f"# TYPE {name} histogram")
+
+            for key, (counts, total, observations) in sorted(histogram["series"].items()):
+                for count, bound in zip(counts, histogram["buckets"], strict=True):
+                    lines.append(f"{name}_bucket{_format_labels(key, le=bound)} {count}")
+
+                lines.append(f"{name}_bucket{_format_labels(key, le='+Inf')} {observations}")
+                lines.append(f"{name}_sum{_format_labels(key)} {total}")
+                lines.append(f"{name}_count{_format_labels(key)} {observations}")
+
+        for name, series in sorted(_counters.items()):
+            lines.append(f"# HELP {name} {HELP.get(name, name)}")
+            lines.append(f"# TYPE {name} counter")
+
+            for key, value in sorted(series.items()):
+                lines.append(f"{name}{_format_labels(key)} {value}")
+
+    return "\n".join(lines) + "\n"
+
+
+def reset():
+    """clears every metric"""
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
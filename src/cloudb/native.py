@@ -0,0 +1,301 @@
+#!/usr/bin/env python
+# * coding: utf8 *
+"""
+native.py
+A module that streams rows from the source into postgis with binary copy instead of translating them with gdal
+"""
+
+import logging
+import sqlite3
+
+import pyodbc
+
+from . import binary, connect
+
+#: the srid of config.UTM
+SRID = 26912
+
+#: the shape column for each meta geometry type with 0: the postgis type, 1: the wkb type single parts are promoted to
+#: and the parts of a repaired shape are extracted to
+GEOMETRY_TYPES = {
+    "POINT": ("Point", None),
+    "MULTIPOINT": ("MultiPoint", 4),
+    "POLYLINE": ("MultiLineString", 5),
+    "POLYGON": ("MultiPolygon", 6),
+}
+
+#: the postgres type gdal creates for each sql server type. sized types add their length or precision and scale
+SQL_SERVER_TYPES = {
+    "bit": "boolean",
+    "tinyint": "smallint",
+    "smallint": "smallint",
+    "int": "integer",
+    "bigint": "bigint",
+    "real": "real",
+    "float": "double precision",
+    "decimal": "numeric",
+    "numeric": "numeric",
+    "char": "varchar",
+    "varchar": "varchar",
+    "nchar": "varchar",
+    "nvarchar": "varchar",
+    "text": "varchar",
+    "ntext": "varchar",
+    "date": "date",
+    "datetime": "timestamp with time zone",
+    "datetime2": "timestamp with time zone",
+    "smalldatetime": "timestamp with time zone",
+}
+
+#: the postgres type gdal creates for each geopackage type
+GEOPACKAGE_TYPES = {
+    "boolean": "boolean",
+    "tinyint": "smallint",
+    "smallint": "smallint",
+    "mediumint": "integer",
+    "integer": "bigint",
+    "float": "real",
+    "real": "double precision",
+    "double": "double precision",
+    "text": "varchar",
+    "date": "date",
+    "datetime": "timestamp with time zone",
+}
+
+
+def _is_geopackage(source):
+    """returns: true when the source is a geopackage, e.g. the benchmark source"""
+    return source.lower().endswith(".gpkg")
+
+
+def _get_sql_server_columns(source, schema_name, layer, fields, geometry_type):
+    """reads the column types of a sql server table
+    returns: array of tuples with 0: the source column, 1: the source type, 2: the postgres type
+    """
+    with pyodbc.connect(source[6:]) as connection:
+        cursor = connection.cursor()
+        cursor.execute(
+            """SELECT
+    COLUMN_NAME,
+    DATA_TYPE,
+    CHARACTER_MAXIMUM_LENGTH,
+    NUMERIC_PRECISION,
+    NUMERIC_SCALE
+FROM
+    INFORMATION_SCHEMA.COLUMNS
+WHERE
+    LOWER(TABLE_SCHEMA) = ?
+    AND LOWER(TABLE_NAME) = ?
+ORDER BY
+    ORDINAL_POSITION;""",
+            schema_name,
+            layer,
+        )
+
+        columns = []
+
+        for name, data_type, length, precision, scale in cursor.fetchall():
+            if data_type == "geometry" and geometry_type != "STAND ALONE":
+                columns.append((name, data_type, None))
+
+                continue
+
+            if name.lower() not in fields:
+                continue
+
+            column_type = SQL_SERVER_TYPES.get(data_type)
+
+            if column_type == "varchar" and length and length > 0:
+                column_type = f"varchar({length})"
+            elif column_type == "numeric" and precision:
+                column_type = f"numeric({precision},{scale or 0})"
+
+            columns.append((name, data_type, column_type))
+
+        return columns
+
+
+def _get_geopackage_columns(source, schema_name, layer, fields, geometry_type):
+    """reads the column types of a geopackage table
+    returns: array of tuples with 0: the source column, 1: the source type, 2: the postgres type
+    """
+    with sqlite3.connect(source) as connection:
+        shape = connection.execute(
+            "SELECT column_name FROM gpkg_geometry_columns WHERE lower(table_name) = ?", (f"{schema_name}.{layer}",)
+        ).fetchone()
+
+        columns = []
+
+        if shape and geometry_type != "STAND ALONE":
+            columns.append((shape[0], "geometry", None))
+
+        for _, name, data_type, *_ in connection.execute(f'PRAGMA table_info("{schema_name}.{layer}")'):
+            if name.lower() not in fields:
+                continue
+
+            base_type, _, length = data_type.lower().rstrip(")").partition("(")
+            column_type = GEOPACKAGE_TYPES.get(base_type)
+
+            if column_type == "varchar" and length:
+                column_type = f"varchar({length})"
+
+            columns.append((name, data_type, column_type))
+
+        return columns
+
+
+def get_columns(source, schema_name, layer, fields, geometry_type):
+    """finds the destination columns of a table when the native loader can copy every one of them
+    source: the source connection from config.get_source_connection
+    schema_name: string schema name in the source
+    layer: string table name in the source
+    fields: array of the lower case fields to load
+    geometry_type: the meta geometry type
+    returns: array of tuples with 0: the source column, 1: the destination column, 2: the postgres type
+    or None when the table needs gdal
+    """
+    if geometry_type != "STAND ALONE" and geometry_type not in GEOMETRY_TYPES:
+        logging.debug("- the native loader does not handle %s shapes", geometry_type)
+
+        return None
+
+    try:
+        if source.startswith("MSSQL:"):
+            columns = _get_sql_server_columns(source, schema_name, layer, fields, geometry_type)
+        elif _is_geopackage(source):
+            columns = _get_geopackage_columns(source, schema_name, layer, fields, geometry_type)
+        else:
+            return None
+    except (pyodbc.Error, sqlite3.Error) as ex:
+        logging.warning("- unable to read the columns of %s.%s: %s", schema_name, layer, ex)
+
+        return None
+
+    if not columns:
+        return None
+
+    unsupported = [
+        f"{name} {data_type}"
+        for name, data_type, column_type in columns
+        if data_type != "geometry" and (column_type is None or binary.get_encoder(column_type) is None)
+    ]
+
+    if unsupported:
+        logging.debug("- the native loader does not handle %s", ", ".join(unsupported))
+
+        return None
+
+    if len([column for column in columns if column[1] != "geometry"]) != len(fields):
+        logging.debug("- the native loader did not find every field")
+
+        return None
+
+    if geometry_type != "STAND ALONE" and "geometry" not in [data_type for _, data_type, _ in columns]:
+        logging.debug("- the native loader did not find the shape column")
+
+        return None
+
+    destination = []
+
+    for name, data_type, column_type in columns:
+        if data_type == "geometry":
+            destination.append((name, "shape", f"geometry({GEOMETRY_TYPES[geometry_type][0]}, {SRID})"))
+        else:
+            #: gdal launders the names the same way
+            destination.append((name, name.lower().replace("-", "_").replace("#", "_").replace("'", "_"), column_type))
+
+    #: gdal creates the shape before the fields
+    destination.sort(key=lambda column: column[1] != "shape")
+
+    return destination
+
+
+def create_table(table, columns, connection, unlogged=False):
+    """replaces the load table with an empty table shaped like the one gdal creates
+    table: schema.table to create
+    columns: array from get_columns
+    connection: dict with connection information
+    unlogged: create an unlogged table, e.g. for the staging schema
+    """
+    definitions = ", ".join(f'"{column}" {column_type}' for _, column, column_type in columns)
+
+    with connect(connection) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {table}")
+            cursor.execute(
+                f"CREATE {'UNLOGGED ' if unlogged else ''}TABLE {table} (xid serial PRIMARY KEY, {definitions})"
+            )
+
+
+def _get_select(source, schema_name, layer, columns, where=None):
+    """the source query with the shape as wkb, curves made linear, and invalid shapes repaired as they are read
+    the way gdal -makevalid repairs them while it writes. from sql server the last column flags the repaired shapes
+    """
+    if source.startswith("MSSQL:"):
+        select = ", ".join(
+            f"CASE WHEN [{name}].STIsValid() = 0 THEN [{name}].MakeValid().STCurveToLine().STAsBinary() "
+            f"ELSE [{name}].STCurveToLine().STAsBinary() END"
+            if column == "shape"
+            else f"[{name}]"
+            for name, column, _ in columns
+        )
+        shape = next((name for name, column, _ in columns if column == "shape"), None)
+        flag = "0" if shape is None else f"CASE WHEN [{shape}].STIsValid() = 0 THEN 1 ELSE 0 END"
+        sql = f"SELECT {select}, {flag} FROM [{schema_name}].[{layer}]"
+    else:
+        select = ", ".join(f'"{name}"' for name, _, _ in columns)
+        sql = f'SELECT {select} FROM "{schema_name}.{layer}"'
+
+    if where is not None:
+        sql = f"{sql} WHERE {where}"
+
+    return sql
+
+
+def copy(source, schema_name, layer, columns, geometry_type, table, connection, where=None, repaired=None):
+    """streams the rows of a source table into the load table in one transaction
+    source: the source connection from config.get_source_connection
+    schema_name: string schema name in the source
+    layer: string table name in the source
+    columns: array from get_columns
+    geometry_type: the meta geometry type
+    table: schema.table from create_table
+    connection: dict with connection information
+    where: a filter for the rows to copy, e.g. a chunk
+    repaired: function called with the number of shapes sql server repaired once the rows commit
+    returns: the number of rows
+    """
+    geopackage = _is_geopackage(source)
+    encoders = [
+        binary.get_geometry_encoder(SRID, GEOMETRY_TYPES[geometry_type][1], geopackage)
+        if column == "shape"
+        else binary.get_encoder(column_type)
+        for _, column, column_type in columns
+    ]
+    sql = _get_select(source, schema_name, layer, columns, where)
+    names = ", ".join(f'"{column}"' for _, column, _ in columns)
+
+    if geopackage:
+        source_connection = sqlite3.connect(source)
+    else:
+        source_connection = pyodbc.connect(source[6:])
+
+    try:
+        cursor = source_connection.cursor()
+        cursor.execute(sql)
+        stream = binary.CopyStream(cursor, encoders, flagged=not geopackage)
+
+        with connect(connection) as conn:
+            with conn.cursor() as destination:
+                destination.copy_expert(
+                    f"COPY {table} ({names}) FROM STDIN WITH (FORMAT binary)", stream, binary.READ_SIZE
+                )
+
+        logging.debug("- copied %s rows into %s", stream.rows, table)
+
+        if repaired is not None and not geopackage:
+            repaired(stream.repaired)
+
+        return stream.rows
+    finally:
+        source_connection.close()
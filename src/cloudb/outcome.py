@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# * coding: utf8 *
+"""
+outcome.py
+A module that runs the tables of a sync and aggregates the outcome of each table into a summary
+"""
+
+import logging
+from concurrent.futures import FIRST_COMPLETED, wait
+from itertools import islice
+
+SUCCESS = "success"
+FAILED = "failed"
+SKIPPED = "skipped"
+
+
+def create(table, status, error=None, **details):
+    """a method to describe the outcome of syncing a table
+    table: string schema.table from the source
+    status: string success, failed, or skipped
+    error: string reason for a failure or skip
+    details: other measurements for the table, e.g. the number of rows
+    """
+    return {"table": table, "status": status, "error": error, **details}
+
+
+def split_finished(tables, is_done):
+    """separates the tables a continued run finished before a restart from the ones that are left
+    tables: array of schema.table names
+    is_done: function that returns true for a table that finished
+    returns: tuple with 0: array of the resumed results of the finished tables, 1: array of the tables left
+    """
+    finished = [table for table in tables if is_done(table)]
+
+    if finished:
+        logging.info("skipping %s tables that synced before the restart", len(finished))
+
+    return [create(table, SUCCESS, resumed=True) for table in finished], [
+        table for table in tables if table not in finished
+    ]
+
+
+def _run_one(target, table, args):
+    """runs a table in this process so an error fails the table instead of the step"""
+    try:
+        return target(*args)
+    except Exception as ex:
+        logging.error("- sync failed for %s: %s", table, ex)
+
+        return create(table, FAILED, str(ex))
+
+
+def run_tables(tables, target, workers=1, executor=None, started=None, finished=None):
+    """syncs the tables in order, one at a time or on an executor with a table submitted only when a worker is free
+    so the tables that are started are the ones running
+    tables: array of tuples with 0: schema.table, 1: tuple of the arguments for target
+    target: function that syncs a table and returns the result from create
+    workers: the number of tables to sync at the same time
+    executor: the concurrent.futures executor for more than one worker
+    started: function called with each table as it starts
+    finished: function called with each result as it finishes
+    returns: array of results in the order they finished. an error in a worker is a failed result
+    """
+    started = started or (lambda _: None)
+    finished = finished or (lambda _: None)
+    results = []
+
+    if executor is None or workers <= 1 or len(tables) <= 1:
+        for table, args in tables:
+            started(table)
+            results.append(_run_one(target, table, args))
+            finished(results[-1])
+
+        return results
+
+    pending = iter(tables)
+    futures = {}
+
+    while True:
+        for table, args in islice(pending, workers - len(futures)):
+            started(table)
+            futures[executor.submit(target, *args)] = table
+
+        if not futures:
+            break
+
+        done, _ = wait(futures, return_when=FIRST_COMPLETED)
+
+        for future in done:
+            table = futures.pop(future)
+
+            try:
+                results.append(future.result())
+            except Exception as ex:
+                logging.error("- worker failed for %s: %s", table, ex)
+                results.append(create(table, FAILED, str(ex)))
+
+            finished(results[-1])
+
+    return results
+
+
+def summarize(results):
+    """aggregates the per table results into one summary
+    results: list of dictionaries from create
+    returns: dictionary with succeeded, skipped, and failed tables and the result for each table
+    """
+    summary = {"succeeded": [], "skipped": [], "failed": {}, "tables": {}}
+
+    for result in results:
+        summary["tables"][result["table"]] = result
+
+        if result["status"] == SUCCESS:
+            summary["succeeded"].append(result["table"])
+        elif result["status"] == SKIPPED:
+            summary["skipped"].append(result["table"])
+        else:
+            summary["failed"][result["table"]] = result["error"]
+
+    logging.info(
+        "%s succeeded, %s skipped, %s failed",
+        len(summary["succeeded"]),
+        len(summary["skipped"]),
+        len(summary["failed"]),
+    )
+
+    for table, error in summary["failed"].items():
+        logging.error("- %s: %s", table, error)
+
+    return summary
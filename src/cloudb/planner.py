@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+# * coding: utf8 *
+"""
+planner.py
+A module that plans a sync before it runs with the action for each table, estimates from past runs, and the order
+"""
+
+import json
+import logging
+
+from . import utils
+
+CREATE = "create"
+RELOAD = "reload"
+DROP = "drop"
+SKIP = "skip"
+
+#: the actions that load a table and take a worker
+LOADS = [CREATE, RELOAD]
+
+HISTORY = "history.json"
+#: the throughput for a table that has not synced before
+DEFAULT_ROWS_PER_SECOND = 5000
+#: the seconds a table without history takes beyond its rows, e.g. for the indexes and the swap
+OVERHEAD_SECONDS = 2
+#: the weight of the newest run in the average seconds of a table
+SMOOTHING = 0.5
+
+
+def read_history(store):
+    """reads the measurements of past runs
+    store: state.FileStore or state.GcsStore
+    returns: dictionary of schema.table to rows, bytes, and seconds
+    """
+    try:
+        text = store.read(HISTORY)
+    except Exception as error:
+        logging.warning("unable to read the sync history: %s", error)
+
+        return {}
+
+    return json.loads(text) if text else {}
+
+
+def record(store, summary):
+    """adds the tables that synced to the history
+    store: state.FileStore or state.GcsStore
+    summary: the summary from outcome.summarize
+    """
+    history = read_history(store)
+
+    for table, result in summary["tables"].items():
+        if table not in summary["succeeded"] or not result.get("timings"):
+            continue
+
+        seconds = sum(result["timings"].values())
+        past = history.get(table)
+
+        if past is not None:
+            seconds = SMOOTHING * seconds + (1 - SMOOTHING) * past["seconds"]
+
+        history[table] = {
+            "rows": result.get("rows") or (past or {}).get("rows"),
+            "bytes": result.get("bytes") or (past or {}).get("bytes"),
+            "seconds": round(seconds, 3),
+        }
+
+    try:
+        store.write(HISTORY, json.dumps(history, indent=2, sort_keys=True))
+    except Exception as error:
+        logging.warning("unable to write the sync history: %s", error)
+
+
+def estimate(table, rows=None, size=None, history=None):
+    """estimates a load from the source size and the last runs of the table
+    table: schema.table in the source
+    rows: the rows in the source or None if unknown
+    size: the bytes in the source or None if unknown
+    history: dictionary from read_history
+    returns: dictionary with rows, bytes, and seconds
+    """
+    past = (history or {}).get(table)
+
+    if past is None:
+        seconds = OVERHEAD_SECONDS + (rows or 0) / DEFAULT_ROWS_PER_SECOND
+    elif rows and past.get("rows"):
+        seconds = past["seconds"] * rows / past["rows"]
+    else:
+        seconds = past["seconds"]
+
+    return {
+        "rows": rows if rows is not None else (past or {}).get("rows"),
+        "bytes": size if size is not None else (past or {}).get("bytes"),
+        "seconds": seconds,
+    }
+
+
+def create_plan(actions, sizes=None, history=None):
+    """builds the steps of a sync with the largest loads first so the workers finish together
+    actions: dictionary of schema.table to CREATE, RELOAD, DROP, or SKIP
+    sizes: dictionary of schema.table to a tuple with 0: rows, 1: bytes in the source
+    history: dictionary from read_history
+    returns: array of dictionaries with table, action, rows, bytes, and seconds
+    """
+    steps = []
+
+    for table, action in actions.items():
+        step = {"table": table, "action": action, **estimate(table, *(sizes or {}).get(table, (None, None)), history)}
+
+        if action not in LOADS:
+            step["seconds"] = 0
+
+        steps.append(step)
+
+    steps.sort(key=lambda step: (-step["seconds"], step["table"]))
+
+    return steps
+
+
+def project(steps, workers=1):
+    """the wall clock seconds of a plan when each load goes to the worker that frees up first
+    steps: array from create_plan
+    workers: the number of tables that sync at the same time
+    """
+    loads = [0] * max(workers, 1)
+
+    for step in steps:
+        if step["action"] not in LOADS:
+            continue
+
+        position = loads.index(min(loads))
+        loads[position] += step["seconds"]
+
+    return max(loads)
+
+
+def format_plan(steps, workers=1):
+    """describes a plan for the dry run output
+    returns: string with a line for each step and the projected time
+    """
+    loads = [step for step in steps if step["action"] in LOADS]
+    lines = [
+        f"plan for {len(steps)} tables, {len(loads)} to load with {workers} workers, "
+        f"projected {utils.format_time(project(steps, workers))}",
+        f"{'action':<8}{'table':<64}{'rows':>12}{'MB':>10}{'seconds':>10}",
+    ]
+
+    for step in steps:
+        rows = "" if step["rows"] is None else step["rows"]
+        megabytes = "" if step["bytes"] is None else round(step["bytes"] / 10**6, 1)
+
+        lines.append(f"{step['action']:<8}{step['table']:<64}{rows:>12}{megabytes:>10}{round(step['seconds'], 1):>10}")
+
+    return "\n".join(lines)
@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+# * coding: utf8 *
+"""
+profiles.py
+A module that picks the gdal load settings for a table from its size
+"""
+
+import json
+import logging
+import os
+from pathlib import Path
+
+#: the load profiles from the smallest to the largest tables. a table uses the first profile its weight,
+#: the rows times the average vertices per shape, fits in
+#: group_transactions: the features in each transaction. with copy enabled this is also the copy batch
+#: defer_spatial_index: load without the spatial index and build it once the rows are in
+#: retries: the transfer attempts
+#: retry_delay: the seconds to wait before the first retry. it doubles for each retry after
+#: chunks: the objectid ranges that load at the same time, each in one transaction that retries on its own
+PROFILES = [
+    {
+        "name": "small",
+        "max_weight": 100000,
+        "group_transactions": "unlimited",
+        "defer_spatial_index": False,
+        "retries": 3,
+        "retry_delay": 5,
+        "chunks": 1,
+    },
+    {
+        "name": "medium",
+        "max_weight": 10000000,
+        "group_transactions": 100000,
+        "defer_spatial_index": True,
+        "retries": 3,
+        "retry_delay": 5,
+        "chunks": 1,
+    },
+    {
+        "name": "large",
+        "max_weight": None,
+        "group_transactions": 500000,
+        "defer_spatial_index": True,
+        "retries": 2,
+        "retry_delay": 30,
+        "chunks": 4,
+    },
+]
+
+#: profile values for a destination schema.table. name picks a whole profile and the other keys replace its values
+OVERRIDES = {}
+
+
+def get_profiles():
+    """gets the profiles from the CLOUDB_LOAD_PROFILES file written by the benchmark calibration or the defaults"""
+    path = os.getenv("CLOUDB_LOAD_PROFILES")
+
+    if not path:
+        return PROFILES
+
+    try:
+        return json.loads(Path(path).read_text(encoding="utf-8"))
+    except (OSError, ValueError) as error:
+        logging.warning("unable to read load profiles from %s: %s", path, error)
+
+        return PROFILES
+
+
+def get_weight(rows, vertices=None):
+    """the size of a table for picking a profile
+    rows: the number of rows or None if it is unknown
+    vertices: the average vertices per shape or None for tables without shapes
+    """
+    if rows is None:
+        return None
+
+    return rows * max(vertices or 1, 1)
+
+
+def _get_profile(profiles, name):
+    """finds a profile by name"""
+    for profile in profiles:
+        if profile["name"] == name:
+            return profile
+
+    raise ValueError(f"unknown load profile {name}")
+
+
+def select(table, rows=None, vertices=None):
+    """picks the load profile for a table. CLOUDB_LOAD_PROFILE forces one profile for every table
+    table: the destination schema.table for the overrides
+    rows: the number of rows in the source or None if it is unknown
+    vertices: the average vertices per shape
+    returns: dictionary of profile values
+    """
+    profiles = get_profiles()
+    weight = get_weight(rows, vertices)
+    override = OVERRIDES.get(table, {})
+    name = override.get("name") or os.getenv("CLOUDB_LOAD_PROFILE")
+
+    if name:
+        profile = _get_profile(profiles, name)
+    elif weight is None:
+        profile = profiles[len(profiles) // 2]
+    else:
+        profile = next(
+            profile for profile in profiles if profile["max_weight"] is None or weight <= profile["max_weight"]
+        )
+
+    return {**profile, **{key: value for key, value in override.items() if key != "name"}, "weight": weight}
+
+
+def calibrate(measurements, profiles=None):
+    """moves the profile boundaries to where each profile loaded fastest in the benchmark
+    measurements: iterable of tuples with 0: table weight, 1: profile name, 2: rows per second
+    profiles: the profiles to adjust. defaults to get_profiles
+    returns: array of profiles
+    """
+    profiles = [dict(profile) for profile in (profiles or get_profiles())]
+    order = [profile["name"] for profile in profiles]
+    best = {}
+
+    for weight, name, rows_per_second in measurements:
+        if rows_per_second is None:
+            continue
+
+        if weight not in best or rows_per_second > best[weight][1]:
+            best[weight] = (name, rows_per_second)
+
+    lower_bound = 0
+
+    for position, profile in enumerate(profiles[:-1]):
+        fits = [weight for weight, (name, _) in best.items() if order.index(name) <= position]
+
+        if fits:
+            profile["max_weight"] = max(max(fits), lower_bound)
+
+        lower_bound = profile["max_weight"]
+
+    return profiles
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# * coding: utf8 *
+"""
+renames.py
+A module that remembers the source table of each destination table so a table whose published name changed is
+renamed in place instead of dropped and loaded again
+"""
+
+import json
+import logging
+
+NAMES = "names.json"
+
+
+def read_names(store):
+    """reads the source table of each destination table from the last run
+    store: state.FileStore or state.GcsStore
+    returns: dictionary of schema.title in the destination to schema.table in the source
+    """
+    try:
+        text = store.read(NAMES)
+    except Exception as error:
+        logging.warning("unable to read the table names: %s", error)
+
+        return {}
+
+    return json.loads(text) if text else {}
+
+
+def record_names(store, tables, snapshot):
+    """replaces the names with the destination tables that are current in the source
+    store: state.FileStore or state.GcsStore
+    tables: the schema.title tables in the destination
+    snapshot: the meta.Snapshot for the run
+    """
+    names = {}
+
+    for table in tables:
+        source_table = snapshot.get_source_table(table)
+
+        if source_table is not None:
+            names[table] = source_table
+
+    try:
+        store.write(NAMES, json.dumps(names, indent=2, sort_keys=True))
+    except Exception as error:
+        logging.warning("unable to write the table names: %s", error)
+
+
+def find_renames(extra, missing, names, snapshot):
+    """pairs the destination tables that are not in the source with the source tables that are not in the destination
+    when they share a source table
+    extra: the schema.title tables in the destination but not the source
+    missing: the schema.title tables in the source but not the destination
+    names: dictionary from read_names
+    snapshot: the meta.Snapshot for the run
+    returns: dictionary of the schema.title to rename to the schema.title to rename it to
+    """
+    missing_by_source = {}
+
+    for table in missing:
+        source_table = snapshot.get_source_table(table)
+
+        if source_table is not None:
+            missing_by_source[source_table] = table
+
+    renames = {}
+
+    for table in sorted(extra):
+        new_table = missing_by_source.pop(names.get(table), None)
+
+        #: the schema of a destination table is the schema of its source table so it does not move
+        if new_table is None or new_table.split(".")[0] != table.split(".")[0]:
+            continue
+
+        renames[table] = new_table
+
+    return renames
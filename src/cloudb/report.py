@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# * coding: utf8 *
+"""
+report.py
+A module that builds the structured report for a run and records it in the metrics
+"""
+
+import json
+import logging
+from datetime import datetime, timezone
+from pathlib import Path
+
+from . import metrics
+
+#: the details of a table result that are not measurements
+TABLE_KEYS = [
+    "status",
+    "error",
+    "loader",
+    "profile",
+    "weight",
+    "rows",
+    "bytes",
+    "repaired",
+    "retries",
+    "changes",
+    "resumed",
+    "files",
+    "timings",
+]
+SLOWEST = 10
+
+
+def create(command):
+    """starts the report for a run
+    command: the cli command or server route that started the run
+    returns: dictionary report
+    """
+    return {
+        "command": command,
+        "started": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "seconds": None,
+        "steps": {},
+        "tables": {},
+    }
+
+
+def add_step(report, step, seconds, summary=None):
+    """adds a step of the run, e.g. trim, import, or update, and the tables it synced
+    report: the report from create
+    step: string name of the step
+    seconds: the time the step took
+    summary: the summary from import or update, None if the step does not sync tables
+    """
+    report["steps"][step] = seconds
+    metrics.observe("cloudb_step_seconds", seconds, step=step)
+
+    if summary is None:
+        return
+
+    if summary.get("projected_seconds") is not None:
+        report.setdefault("projected", {})[step] = summary["projected_seconds"]
+
+    for table, result in summary["tables"].items():
+        details = {key: result[key] for key in TABLE_KEYS if result.get(key) is not None}
+        details["step"] = step
+        report["tables"][table] = details
+
+        metrics.increment("cloudb_tables_total", status=result["status"])
+
+        for phase, phase_seconds in result.get("timings", {}).items():
+            metrics.observe("cloudb_table_phase_seconds", phase_seconds, phase=phase)
+
+        if result.get("rows") is not None:
+            metrics.observe("cloudb_table_rows", result["rows"], buckets=metrics.ROW_BUCKETS)
+
+        if result.get("retries"):
+            metrics.increment("cloudb_table_retries_total", result["retries"])
+
+
+def finish(report, seconds, path=None):
+    """completes the report and writes it to the log as a single json line
+    report: the report from create
+    seconds: the time the run took
+    path: a file to also write the report to
+    returns: the report
+    """
+    report["seconds"] = seconds
+
+    statuses = [table["status"] for table in report["tables"].values()]
+    report["totals"] = {
+        "tables": len(statuses),
+        "failed": statuses.count("failed"),
+        "rows": sum(table.get("rows", 0) for table in report["tables"].values()),
+        "bytes": sum(table.get("bytes", 0) for table in report["tables"].values()),
+    }
+
+    #: the tables that dominate the run
+    report["slowest"] = sorted(
+        report["tables"], key=lambda table: sum(report["tables"][table].get("timings", {}).values()), reverse=True
+    )[:SLOWEST]
+
+    logging.info("report %s", json.dumps(report, sort_keys=True))
+
+    if path:
+        Path(path).write_text(json.dumps(report, indent=2, sort_keys=True), encoding="utf-8")
+
+    return report
@@ -8,9 +8,7 @@ A module that allows for role modifications
 import logging
 from textwrap import dedent
 
-import psycopg2
-
-from . import config, execute_sql
+from . import config, connect, execute_sql
 
 
 def create_read_only_user(schemas):
@@ -18,7 +16,7 @@ def create_read_only_user(schemas):
 
     logging.info("creating read only role")
 
-    with psycopg2.connect(**config.DBO_CONNECTION) as conn:
+    with connect(config.DBO_CONNECTION) as conn:
         with conn.cursor() as cursor:
             cursor.execute("SELECT 1 FROM pg_roles WHERE rolname='read_only'")
             role = cursor.fetchone()
@@ -43,9 +41,7 @@ def create_read_only_user(schemas):
                         """
                 )
 
-                execute_sql(sql, config.DBO_CONNECTION)
-
-            conn.commit()
+                cursor.execute(sql)
 
     sql = []
 
@@ -100,3 +96,30 @@ def create_admin_user(props):
     )
 
     execute_sql(sql, config.DBO_CONNECTION)
+
+
+def copy_grants(cursor, table, target_table):
+    """re-creates the privileges on a table for another table and makes sure the read only role can select it
+    cursor: an open cursor so the grants are part of the callers transaction
+    table: string schema.table to copy the privileges from
+    target_table: string schema.table to grant the privileges on
+    """
+    schema_name, table_name = table.split(".")
+    target_schema, target_name = target_table.split(".")
+    target = f'{target_schema}."{target_name}"'
+
+    cursor.execute(
+        "SELECT grantee, privilege_type FROM information_schema.role_table_grants WHERE table_schema = %s AND table_name = %s",
+        (schema_name, table_name),
+    )
+    grants = cursor.fetchall()
+
+    cursor.execute("SELECT 1 FROM pg_roles WHERE rolname='read_only'")
+    if cursor.fetchone() is not None:
+        grants.append(("read_only", "SELECT"))
+
+    for grantee, privilege in grants:
+        if grantee != "PUBLIC":
+            grantee = f'"{grantee}"'
+
+        cursor.execute(f"GRANT {privilege} ON {target} TO {grantee}")
@@ -6,18 +6,25 @@ A module that modifies schemas
 """
 
 import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import psycopg2
 import pyodbc
 
-from . import config
+from . import catalog, config, connect, roles
+from .index import MAX_IDENTIFIER_LENGTH
+
+SHADOW_SUFFIX = "_shadow"
+
+#: the postgres type for each sql server integer type
+INTEGER_TYPES = {"smallint": "smallint", "int": "integer", "bigint": "bigint"}
 
 
 def drop_schemas(schemas):
     """drops the schemas and all tables within
     schemas: array of schemas to create
     """
-    with psycopg2.connect(**config.DBO_CONNECTION) as conn:
+    with connect(config.DBO_CONNECTION) as conn:
         sql = []
 
         for name in schemas:
@@ -27,14 +34,12 @@ def drop_schemas(schemas):
         with conn.cursor() as cursor:
             cursor.execute(";".join(sql))
 
-        conn.commit()
-
 
 def create_schemas(schemas):
     """creates the schemas to match our ISO categories
     schemas: array of schemas to create
     """
-    with psycopg2.connect(**config.DBO_CONNECTION) as conn:
+    with connect(config.DBO_CONNECTION) as conn:
         sql = []
 
         for name in schemas:
@@ -46,12 +51,17 @@ def create_schemas(schemas):
         with conn.cursor() as cursor:
             cursor.execute(";".join(sql))
 
-        conn.commit()
 
+def get_integer_types(sql_table):
+    """gets the integer columns of a source table so the load creates them with their source type
+    sql_table: string schema.table in the source
+    returns: dictionary of the lower case column to the postgres type. empty for sources that keep their types
+    """
+    if not config.is_sql_server_source():
+        #: other ogr sources keep their integer types through the transfer
+        return {}
 
-def update_schema_for(sql_table, pg_table, dry_run=False):
-    """updates the schema for a specific table"""
-    statements = []
+    types = {}
     with pyodbc.connect(config.get_source_connection()[6:]) as conn:
         sql = """SELECT
     LOWER(column_name) as column_name, data_type
@@ -68,29 +78,78 @@ WHERE
             result = cursor.execute(sql, table_name, schema_name)
 
             for column, data_type in result:
-                statements.append(f"ALTER COLUMN {column} TYPE {data_type} USING {column}::{data_type}")
+                types[column] = INTEGER_TYPES[data_type]
 
-    if len(statements) < 1:
-        logging.debug("skipping %s", pg_table)
+    return types
 
-        return
 
-    with psycopg2.connect(**config.DBO_CONNECTION) as conn:
-        with conn.cursor() as cursor:
-            sql = f'ALTER TABLE {pg_table} {", ".join(statements)};'
-            logging.debug("updating schema for %s with %s", pg_table, sql)
+def _alter_table(table, types, dry_run):
+    """changes the column types of one table in its own transaction so its locks are held only while it is rewritten
+    table: string schema.table
+    types: dictionary of column to the type to change it to
+    returns: altered, failed, or skipped for a dry run
+    """
+    statements = [
+        f"ALTER COLUMN {column} TYPE {data_type} USING {column}::{data_type}" for column, data_type in types.items()
+    ]
+    sql = f'ALTER TABLE {table} {", ".join(statements)};'
+
+    logging.debug("updating schema for %s with %s", table, sql)
+
+    if dry_run:
+        return "skipped"
+
+    try:
+        with connect(config.DBO_CONNECTION, config.SESSION_SETTINGS["schema"]) as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(sql)
+    except psycopg2.Error as ex:
+        logging.warning("- failed updating schema for %s: %s", table, ex)
 
-            if not dry_run:
-                result = cursor.execute(sql)
-                logging.debug("result: %s", result)
+        return "failed"
 
-        if not dry_run:
-            conn.commit()
+    return "altered"
+
+
+def _update_types(desired, dry_run=False, workers=1):
+    """alters the columns whose type in the destination is not the desired type. tables are altered in parallel
+    desired: dictionary of schema.table to a dictionary of column to the type it should have
+    dry_run: log the changes without making them
+    workers: the number of tables to alter at the same time
+    returns: dictionary of schema.table to altered, failed, or skipped
+    """
+    actual = catalog.query_column_types(config.DBO_CONNECTION, desired)
+    changes = catalog.diff_column_types(desired, actual)
+    results = {}
 
+    logging.info("%s of %s tables have columns to update", len(changes), len(desired))
 
-def update_schemas(agol_meta_map, dry_run=False):
-    """updates the schemas for all tables in the agol items table"""
-    alter_statements = {}
+    if len(changes) == 0:
+        return results
+
+    with ThreadPoolExecutor(max_workers=max(min(workers, len(changes)), 1)) as executor:
+        futures = {executor.submit(_alter_table, table, types, dry_run): table for table, types in changes.items()}
+
+        for future in as_completed(futures):
+            results[futures[future]] = future.result()
+
+    failed = sum(status == "failed" for status in results.values())
+
+    logging.info("updated the schema of %s tables with %s failures", len(results) - failed, failed)
+
+    return results
+
+
+def update_schema_for(sql_table, pg_table, dry_run=False):
+    """updates the schema for a specific table"""
+    return _update_types({pg_table: get_integer_types(sql_table)}, dry_run)
+
+
+def update_schemas(agol_meta_map, dry_run=False, workers=1):
+    """updates the schemas for all tables in the agol items table
+    workers: the number of tables to alter at the same time
+    """
+    desired = {}
 
     with pyodbc.connect(config.get_source_connection()[6:]) as conn:
         sql = """SELECT
@@ -119,20 +178,110 @@ ORDER BY
                 pg_table = agol_meta_map[schema_name][table_name]["title"]
                 pg_table = f"{schema_name}.{pg_table}"
 
-                alter_statements.setdefault(pg_table, []).append(
-                    f"ALTER COLUMN {column} TYPE {data_type} USING {column}::{data_type}"
-                )
+                desired.setdefault(pg_table, {})[column] = INTEGER_TYPES[data_type]
+
+    return _update_types(desired, dry_run, workers)
 
-    with psycopg2.connect(**config.DBO_CONNECTION) as conn:
+
+def get_shadow_name(table_name):
+    """a method to get the name of the table that a refresh is loaded into before it is swapped in
+    table_name: string table name without the schema
+    """
+    return f"{table_name[: MAX_IDENTIFIER_LENGTH - len(SHADOW_SUFFIX)]}{SHADOW_SUFFIX}"
+
+
+def is_shadow(table):
+    """returns: true if the schema.table is the shadow table of a load"""
+    return table.endswith(SHADOW_SUFFIX)
+
+
+def _get_objects(cursor, table):
+    """gets the indexes and sequences of a table that are named after it
+    table: string schema.table
+    returns: array of tuples with 0: the name, 1: INDEX or SEQUENCE
+    """
+    schema_name, table_name = table.split(".")
+
+    cursor.execute(
+        """SELECT
+    c.relname,
+    'INDEX'
+FROM
+    pg_index i
+INNER JOIN pg_class c ON
+    c.oid = i.indexrelid
+WHERE
+    i.indrelid = to_regclass(%s)
+UNION ALL
+SELECT
+    c.relname,
+    'SEQUENCE'
+FROM
+    pg_depend d
+INNER JOIN pg_class c ON
+    c.oid = d.objid
+WHERE
+    d.refobjid = to_regclass(%s)
+    AND c.relkind = 'S';""",
+        (f'{schema_name}."{table_name}"', f'{schema_name}."{table_name}"'),
+    )
+
+    return cursor.fetchall()
+
+
+def _rename_objects(cursor, schema_name, objects, old_prefix, new_prefix):
+    """renames the indexes and sequences that carry the old table name so they match the new one"""
+    for name, kind in objects:
+        if old_prefix not in name:
+            continue
+
+        new_name = name.replace(old_prefix, new_prefix, 1)[:MAX_IDENTIFIER_LENGTH]
+        cursor.execute(f'ALTER {kind} {schema_name}."{name}" RENAME TO "{new_name}"')
+
+
+def swap_table(shadow_table, table, object_prefix=None):
+    """replaces a table with a fully loaded and indexed shadow table from the same schema in one short transaction.
+    the privileges on the table are carried over and the shadow indexes and sequences are renamed to match
+    shadow_table: string schema.table to swap in
+    table: string schema.table to replace
+    object_prefix: the table name the shadow indexes were created with. defaults to the shadow table name
+    """
+    schema_name, shadow_name = shadow_table.split(".")
+    _, table_name = table.split(".")
+    object_prefix = object_prefix or shadow_name
+
+    #: the lock timeout makes the swap fail fast and retry instead of queueing readers behind it
+    with connect(config.DBO_CONNECTION, config.SESSION_SETTINGS["swap"]) as conn:
         with conn.cursor() as cursor:
-            for table, alter_column_statements in alter_statements.items():
-                sql = f'ALTER TABLE {table} {", ".join(alter_column_statements)};'
+            objects = _get_objects(cursor, shadow_table)
+
+            cursor.execute("SELECT to_regclass(%s) IS NOT NULL", (f'{schema_name}."{table_name}"',))
+            if cursor.fetchone()[0]:
+                roles.copy_grants(cursor, table, shadow_table)
+                cursor.execute(f'DROP TABLE {schema_name}."{table_name}"')
+            else:
+                roles.copy_grants(cursor, shadow_table, shadow_table)
 
-                logging.debug("updating schema for %s with %s", table, sql)
+            cursor.execute(f'ALTER TABLE {schema_name}."{shadow_name}" RENAME TO "{table_name}"')
+            _rename_objects(cursor, schema_name, objects, object_prefix, table_name)
+
+    logging.info("- swapped %s into %s", shadow_table, table)
+
+
+def rename_table(table, new_table):
+    """renames a table in place with its indexes and sequences in one short transaction so a table that only
+    changed its title is not dropped and loaded again. the privileges, comments, and rows stay with the table
+    table: string schema.table to rename
+    new_table: string schema.table from the same schema
+    """
+    schema_name, table_name = table.split(".")
+    _, new_name = new_table.split(".")
+
+    with connect(config.DBO_CONNECTION, config.SESSION_SETTINGS["swap"]) as conn:
+        with conn.cursor() as cursor:
+            objects = _get_objects(cursor, table)
 
-                if not dry_run:
-                    result = cursor.execute(sql)
-                    logging.debug("result: %s", result)
+            cursor.execute(f'ALTER TABLE {schema_name}."{table_name}" RENAME TO "{new_name}"')
+            _rename_objects(cursor, schema_name, objects, table_name, new_name)
 
-            if not dry_run:
-                conn.commit()
+    logging.info("- renamed %s to %s", table, new_table)
@@ -6,35 +6,72 @@ a module that can receive web requests. this will be google cloud pub sub and
 possibly github web hooks
 """
 
+import atexit
 import logging
 import os
 from time import perf_counter
 
 from flask import Flask
 
-from . import utils
-from .main import get_tables_from_change_detection, import_data, trim, update
+from . import close_pools, jobs, journal, metrics, report, state, utils
+from .main import get_table_meta, import_data, trim, update_from_change_detection
 
 app = Flask(__name__)
 
+#: gunicorn workers keep their pooled connections between requests and close them on shutdown
+atexit.register(close_pools)
 
-@app.route("/scheduled", methods=["POST"])
-def schedule():
-    """schedule: the post route that gcp scheduler sends when it is time to execute"""
-    logging.debug("request accepted")
 
-    dry_run = False
-    if "IS_DEVELOPMENT" in os.environ:
-        dry_run = True
+def _append_failures(summary, errors):
+    """adds the tables that failed to sync to the list of errors
+    summary: the summary from import or update, None if there was nothing to do
+    errors: list of errors for the run
+    """
+    if summary is None:
+        return
 
-    logging.info("dry run: %s", dry_run)
+    for table, error in summary["failed"].items():
+        errors.append(f"{table}: {error}")
+
+
+def _run_schedule(dry_run, workers, incremental_sync):
+    """runs trim, import, and update in the background job. the steps and tables are checkpointed so a run
+    that was interrupted, e.g. by a container restart, continues with the work that is left when the service starts
+    returns: list of errors for the run
+    """
     has_errors = list([])
     total_seconds = perf_counter()
+    run_report = report.create("scheduled")
+
+    run_journal = None
+    if not dry_run:
+        try:
+            run_journal = journal.start(state.get_store(), "scheduled")
+        except Exception as error:
+            logging.error("unable to read the run journal %s", error, exc_info=True)
+
+    #: every step shares one snapshot of the meta table. if it fails to load, each step tries again
+    snapshot = None
+    try:
+        jobs.set_phase("meta")
+        snapshot = get_table_meta()
+    except Exception as error:
+        logging.error("meta failure %s", error, exc_info=True)
+        has_errors.append(error)
 
     try:
+        jobs.set_phase("trim")
         trim_seconds = perf_counter()
 
-        trim(dry_run)
+        if run_journal is not None and run_journal.is_done("trim"):
+            logging.info("skipping trim since it finished before the restart")
+        else:
+            trim(dry_run, snapshot)
+
+            if run_journal is not None:
+                run_journal.complete("trim")
+
+        report.add_step(run_report, "trim", perf_counter() - trim_seconds)
 
         logging.info("completed in %s", utils.format_time(perf_counter() - trim_seconds))
     except Exception as error:
@@ -42,11 +79,14 @@ def schedule():
         has_errors.append(error)
 
     try:
+        jobs.set_phase("import")
         skip_if_missing = False
         missing = True
         import_seconds = perf_counter()
 
-        import_data(skip_if_missing, missing, dry_run)
+        summary = import_data(skip_if_missing, missing, dry_run, workers, snapshot, run_journal)
+        _append_failures(summary, has_errors)
+        report.add_step(run_report, "import", perf_counter() - import_seconds, summary)
 
         logging.info("completed in %s", utils.format_time(perf_counter() - import_seconds))
 
@@ -55,25 +95,101 @@ def schedule():
         has_errors.append(error)
 
     try:
+        jobs.set_phase("update")
         update_seconds = perf_counter()
 
-        tables = get_tables_from_change_detection()
-        update(tables, dry_run)
+        summary = update_from_change_detection(dry_run, workers, incremental_sync, snapshot, run_journal=run_journal)
+        _append_failures(summary, has_errors)
+        report.add_step(run_report, "update", perf_counter() - update_seconds, summary)
 
         logging.info("completed in %s", utils.format_time(perf_counter() - update_seconds))
     except Exception as error:
         logging.error("app failure %s", error, exc_info=True)
         has_errors.append(error)
 
+    report.finish(run_report, perf_counter() - total_seconds)
+
+    #: a run that ended with errors ended, so the next trigger starts over instead of skipping the steps it finished
+    if run_journal is not None:
+        run_journal.finish(failed=len(has_errors) > 0)
+
     if len(has_errors) > 0:
-        errors = "||".join([str(error) for error in has_errors])
-        logging.error(errors)
+        logging.error("||".join([str(error) for error in has_errors]))
 
-        return errors
+        return has_errors
 
     logging.info("successful run completed in %s", utils.format_time(perf_counter() - total_seconds))
 
-    return ("", 204)
+    return has_errors
+
+
+def _get_schedule_settings():
+    """returns: tuple with 0: dry run, 1: workers, 2: incremental sync from the environment"""
+    dry_run = False
+    if "IS_DEVELOPMENT" in os.environ:
+        dry_run = True
+
+    workers = int(os.getenv("SYNC_WORKERS", "1"))
+    incremental_sync = "INCREMENTAL_SYNC" in os.environ
+
+    return dry_run, workers, incremental_sync
+
+
+def resume_schedule():
+    """continues a scheduled run that was interrupted, e.g. by a container restart, when the gunicorn worker starts.
+    the scheduler does not retry a trigger that was accepted so nothing else would continue it
+    """
+    dry_run, workers, incremental_sync = _get_schedule_settings()
+
+    if dry_run:
+        return
+
+    try:
+        run = journal.get_unfinished(state.get_store(), "scheduled")
+    except Exception as error:
+        logging.warning("unable to read the run journal %s", error)
+
+        return
+
+    if run is None:
+        return
+
+    logging.info("continuing the interrupted run %s from %s", run["id"], run["started"])
+
+    jobs.submit("scheduled", _run_schedule, dry_run, workers, incremental_sync)
+
+
+@app.route("/scheduled", methods=["POST"])
+def schedule():
+    """schedule: the post route that gcp scheduler sends when it is time to execute.
+    the sync runs in the background and a trigger while one is queued or running joins it
+    """
+    logging.debug("request accepted")
+
+    dry_run, workers, incremental_sync = _get_schedule_settings()
+
+    logging.info("dry run: %s", dry_run)
+
+    job, created = jobs.submit("scheduled", _run_schedule, dry_run, workers, incremental_sync)
+
+    return ({"id": job["id"], "status": job["status"], "coalesced": not created}, 202)
+
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def get_job(job_id):
+    """jobs: the progress of a scheduled run"""
+    job = jobs.get(job_id)
+
+    if job is None:
+        return ({"error": f"{job_id} not found"}, 404)
+
+    return job
+
+
+@app.route("/metrics", methods=["GET"])
+def get_metrics():
+    """metrics: the histograms and counters of this process for prometheus to scrape"""
+    return (metrics.render(), 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
 
 
 if __name__ == "__main__":
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# * coding: utf8 *
+"""
+sinks.py
+A module that publishes file downloads of the tables that were loaded, e.g. geoparquet and flatgeobuf
+"""
+
+import logging
+import os
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+#: the gdal driver, file extension, and layer creation options for each file format
+SINKS = {
+    "geoparquet": {
+        "driver": "Parquet",
+        "extension": "parquet",
+        "options": ["-lco", "COMPRESSION=ZSTD", "-lco", "GEOMETRY_ENCODING=WKB", "-lco", "ROW_GROUP_SIZE=65536"],
+    },
+    #: the packed hilbert r-tree lets clients read the features in a bounding box with range requests
+    "flatgeobuf": {
+        "driver": "FlatGeobuf",
+        "extension": "fgb",
+        "options": ["-lco", "SPATIAL_INDEX=YES"],
+    },
+}
+
+
+def get_name(table, sink):
+    """a method to get the file of a table for a sink
+    table: schema.table
+    returns: string schema/table.extension
+    """
+    schema_name, table_name = table.split(".")
+
+    return f"{schema_name}/{table_name}.{SINKS[sink]['extension']}"
+
+
+def get_options(sink, table):
+    """the vector translate options that write a table to a file. the xid is the feature id so it is not a column
+    sink: the name of the file format in SINKS
+    table: schema.table in the destination
+    returns: array of options
+    """
+    spec = SINKS[sink]
+    _, table_name = table.split(".")
+
+    return ["-f", spec["driver"], *spec["options"], "-nln", table_name, table]
+
+
+def _write(translate, sink, table, directory):
+    """writes the file next to the last one and replaces it so a reader never sees a partial file
+    returns: the path of the file
+    """
+    path = Path(directory) / get_name(table, sink)
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    #: flatgeobuf writes a directory when the path does not end with its extension
+    temp_path = path.with_name(f"{path.stem}.{os.getpid()}.tmp{path.suffix}")
+    temp_path.unlink(missing_ok=True)
+
+    translate(str(temp_path), sink)
+    temp_path.replace(path)
+
+    return path
+
+
+def publish(translate, sinks, table, location):
+    """writes a table to each sink in a local directory or a bucket
+    translate: function that writes the table to a path for a sink
+    sinks: array of the names of the file formats in SINKS
+    table: schema.table in the destination
+    location: gs://bucket/prefix or a local directory
+    returns: dictionary of sink to the file that was written or failed
+    """
+    files = {}
+
+    if not location.startswith("gs://"):
+        for sink in sinks:
+            try:
+                files[sink] = str(_write(translate, sink, table, location))
+            except Exception as ex:
+                logging.warning("- failed writing %s for %s: %s", sink, table, ex)
+
+                files[sink] = "failed"
+
+        return files
+
+    from google.cloud import storage
+
+    bucket_name, _, prefix = location[5:].partition("/")
+    prefix = f"{prefix.rstrip('/')}/" if prefix else ""
+    bucket = storage.Client().bucket(bucket_name)
+
+    with TemporaryDirectory(prefix="cloudb-") as directory:
+        for sink in sinks:
+            try:
+                path = _write(translate, sink, table, directory)
+                name = f"{prefix}{get_name(table, sink)}"
+
+                bucket.blob(name).upload_from_filename(str(path))
+                files[sink] = f"gs://{bucket_name}/{name}"
+            except Exception as ex:
+                logging.warning("- failed writing %s for %s: %s", sink, table, ex)
+
+                files[sink] = "failed"
+
+    return files
@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+# * coding: utf8 *
+"""
+state.py
+A module that keeps the state between runs, e.g. the change detection watermarks, in a bucket or a local directory
+"""
+
+import json
+import logging
+import os
+from datetime import datetime
+from pathlib import Path
+from zoneinfo import ZoneInfo
+
+#: gs://bucket/prefix or a local directory
+DEFAULT_LOCATION = "gs://ut-dts-agrc-open-sgid-prod-data"
+WATERMARKS = "watermarks.json"
+LEGACY_LAST_CHECKED = ".last_checked"
+#: the change detection LAST_MODIFIED times are local to the source, not the utc of the container
+SOURCE_TIMEZONE = ZoneInfo("America/Denver")
+
+
+class FileStore:
+    """keeps the state in files in a local directory"""
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+
+    def read(self, name):
+        """returns: the text of the file or None if it does not exist"""
+        try:
+            return (self.directory / name).read_text(encoding="utf-8")
+        except FileNotFoundError:
+            return None
+
+    def write(self, name, text):
+        """replaces the file so a reader never sees a partial write"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+        temp_path = self.directory / f"{name}.{os.getpid()}.tmp"
+        temp_path.write_text(text, encoding="utf-8")
+        temp_path.replace(self.directory / name)
+
+
+class GcsStore:
+    """keeps the state in blobs in a google cloud storage bucket"""
+
+    def __init__(self, bucket, prefix=""):
+        from google.cloud import storage
+
+        self.bucket = storage.Client().bucket(bucket)
+        self.prefix = prefix
+
+    def read(self, name):
+        """returns: the text of the blob or None if it does not exist"""
+        blob = self.bucket.get_blob(f"{self.prefix}{name}")
+
+        if blob is None:
+            return None
+
+        return blob.download_as_text()
+
+    def write(self, name, text):
+        """replaces the blob"""
+        self.bucket.blob(f"{self.prefix}{name}").upload_from_string(text, content_type="application/json")
+
+
+class LazyStore:
+    """opens the store for a location the first time it is read or written so a run that never uses the state,
+    or a machine without bucket credentials, fails inside the guarded read or write instead of up front
+    """
+
+    def __init__(self, location=None):
+        self.location = location
+        self.store = None
+
+    def _get_store(self):
+        """returns: the FileStore or GcsStore for the location"""
+        if self.store is None:
+            self.store = get_store(self.location)
+
+        return self.store
+
+    def read(self, name):
+        """returns: the text of the file or None if it does not exist"""
+        return self._get_store().read(name)
+
+    def write(self, name, text):
+        """replaces the file"""
+        self._get_store().write(name, text)
+
+
+def get_store(location=None):
+    """gets the store for a location
+    location: gs://bucket/prefix or a local directory. defaults to CLOUDB_STATE or the production bucket
+    returns: FileStore or GcsStore
+    """
+    location = location or os.getenv("CLOUDB_STATE", DEFAULT_LOCATION)
+
+    if location.startswith("gs://"):
+        bucket, _, prefix = location[5:].partition("/")
+
+        return GcsStore(bucket, f"{prefix.rstrip('/')}/" if prefix else "")
+
+    return FileStore(location)
+
+
+def read_watermarks(store):
+    """reads the time each table was last synced up to. the first read starts from the legacy .last_checked date
+    store: FileStore or GcsStore
+    returns: dictionary with default: the watermark for tables that have not synced, tables: table to watermark
+    """
+    text = store.read(WATERMARKS)
+
+    if text is not None:
+        watermarks = json.loads(text)
+
+        return {
+            "default": datetime.fromisoformat(watermarks["default"]),
+            "tables": {table: datetime.fromisoformat(value) for table, value in watermarks["tables"].items()},
+        }
+
+    default = datetime.now(SOURCE_TIMEZONE).replace(tzinfo=None)
+    last_checked = (store.read(LEGACY_LAST_CHECKED) or "").strip()
+
+    if last_checked:
+        try:
+            default = datetime.strptime(last_checked, "%Y-%m-%d")
+        except ValueError:
+            logging.error("invalid date format in .last_checked: %s", last_checked, exc_info=True)
+
+    logging.info("starting watermarks from %s", default)
+
+    watermarks = {"default": default, "tables": {}}
+    write_watermarks(store, watermarks)
+
+    return watermarks
+
+
+def write_watermarks(store, watermarks):
+    """saves the watermarks
+    store: FileStore or GcsStore
+    watermarks: dictionary from read_watermarks
+    """
+    store.write(
+        WATERMARKS,
+        json.dumps(
+            {
+                "default": watermarks["default"].isoformat(),
+                "tables": {table: value.isoformat() for table, value in sorted(watermarks["tables"].items())},
+            },
+            indent=2,
+        ),
+    )
+
+
+def get_since(watermarks):
+    """the oldest watermark so the change detection query only returns rows that could be newer"""
+    return min([watermarks["default"], *watermarks["tables"].values()])
+
+
+def get_changed_tables(rows, watermarks):
+    """finds the tables that changed after their watermark
+    rows: iterable of tuples with 0: schema.table, 1: the time it was modified
+    watermarks: dictionary from read_watermarks
+    returns: dictionary of schema.table to the newest modified time
+    """
+    changes = {}
+
+    for table, last_modified in rows:
+        if last_modified <= watermarks["tables"].get(table, watermarks["default"]):
+            continue
+
+        changes[table] = max(last_modified, changes.get(table, last_modified))
+
+    return changes
+
+
+def advance_watermarks(store, changes, synced):
+    """moves the watermarks past the changes that were detected. the tables that synced move to their modified time
+    and the default moves to the newest change so the next detection does not start from an old date. a table that
+    did not sync keeps the watermark it was detected against so it is synced again next time
+    store: FileStore or GcsStore
+    changes: dictionary from get_changed_tables
+    synced: list of schema.table that are done with their change, e.g. they synced or are not published
+    returns: the number of watermarks that moved
+    """
+    watermarks = read_watermarks(store)
+    default = watermarks["default"]
+    pending = {table: watermarks["tables"].get(table, default) for table in changes if table not in synced}
+    advanced = len(changes) - len(pending)
+
+    if len(changes) == 0:
+        return 0
+
+    watermarks["default"] = max(default, *changes.values())
+
+    #: a table caught up to the default is covered by it so only the tables ahead of it or behind it are kept
+    watermarks["tables"] = {
+        **{table: value for table, value in watermarks["tables"].items() if value > watermarks["default"]},
+        **pending,
+    }
+
+    write_watermarks(store, watermarks)
+
+    logging.info("advanced %s of %s watermarks", advanced, len(changes))
+
+    return advanced
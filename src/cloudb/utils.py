@@ -5,6 +5,10 @@ utils.py
 A module that helps out
 """
 
+import logging
+from contextlib import contextmanager
+from time import perf_counter
+
 
 def format_time(seconds):
     """seconds: number
@@ -23,3 +27,44 @@ def format_time(seconds):
         return f"{round(seconds / minute, 2)} minutes"
 
     return f"{round(seconds / hour, 2)} hours"
+
+
+@contextmanager
+def timer(timings, phase):
+    """adds the seconds the block takes to a phase. a phase that runs more than once is added up
+    timings: dictionary of phase to seconds
+    phase: string name of the phase
+    """
+    start_seconds = perf_counter()
+
+    try:
+        yield
+    finally:
+        timings[phase] = timings.get(phase, 0) + perf_counter() - start_seconds
+
+
+def get_schema_table_name_map(table_name):
+    """a method to split a qualified table into it's parts"""
+    parts = table_name.split(".")
+
+    schema_index = 1
+    table_index = 2
+
+    if len(parts) == 2:
+        schema_index = 0
+        table_index = 1
+
+    return {"schema": parts[schema_index].lower(), "table_name": parts[table_index].lower()}
+
+
+def format_title_for_pg(title):
+    """a method to convert a published name into a postgres table name"""
+    if title is None:
+        return title
+
+    new_title = title.lower()
+    new_title = new_title.replace("utah ", "", 1).replace(" ", "_")
+
+    logging.debug("updating %s to %s", title, new_title)
+
+    return new_title
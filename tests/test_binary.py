@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# * coding: utf8 *
+"""
+test_binary - A script that tests the binary.py file
+"""
+
+import struct
+from datetime import date, datetime
+from decimal import Decimal
+
+from cloudb import binary
+
+
+def test_encoders_match_the_postgres_binary_format():
+    """
+    Tests numbers, dates, and times are encoded the way postgres receives them
+    """
+    numeric = binary.get_encoder("numeric(38,8)")
+
+    assert numeric(Decimal("12345.678")) == struct.pack(">hhHh3h", 3, 1, 0, 3, 1, 2345, 6780)
+    assert numeric(Decimal("-0.001")) == struct.pack(">hhHh1h", 1, -1, 0x4000, 3, 10)
+    assert numeric(Decimal("0.00")) == struct.pack(">hhHh", 0, 0, 0, 2)
+    assert numeric(120000) == struct.pack(">hhHh1h", 1, 1, 0, 0, 12)
+
+    assert binary.get_encoder("integer")(7) == struct.pack(">i", 7)
+    assert binary.get_encoder("varchar(10)")("café") == "café".encode("utf-8")
+    assert binary.get_encoder("date")(date(2000, 1, 2)) == struct.pack(">i", 1)
+    assert binary.get_encoder("timestamp with time zone")(datetime(2000, 1, 1, 0, 0, 1)) == struct.pack(">q", 10**6)
+    assert binary.get_encoder("uuid") is None
+
+
+def test_shapes_get_an_srid_and_are_promoted_to_multi():
+    """
+    Tests wkb and geopackage shapes become ewkb for a column with an srid and a multi type
+    """
+    point = b"\x01" + struct.pack("<Idd", 1, 1.0, 2.0)
+    assert binary.to_ewkb(point, 26912) == b"\x01" + struct.pack("<IIdd", 0x20000001, 26912, 1.0, 2.0)
+
+    line = b"\x00" + struct.pack(">II4d", 2, 2, 0.0, 0.0, 1.0, 1.0)
+    assert (
+        binary.to_ewkb(line, 26912, 5) == b"\x00" + struct.pack(">II", 0x20000005, 26912) + struct.pack(">I", 1) + line
+    )
+
+    blob = b"GP\x00\x03" + struct.pack("<i4d", 26912, 1.0, 1.0, 2.0, 2.0) + point
+    assert binary.from_geopackage(blob) == point
+
+
+def test_copy_stream_reads_in_any_size():
+    """
+    Tests the stream yields the header, rows, and trailer the same way whatever size is read
+    """
+
+    class Cursor:
+        def __init__(self, rows):
+            self.rows = list(rows)
+
+        def fetchmany(self, size):
+            batch, self.rows = self.rows[:size], self.rows[size:]
+
+            return batch
+
+    rows = [(1, "a"), (None, "bc")] * 5
+    encoders = [binary.get_encoder("integer"), binary.get_encoder("varchar")]
+
+    expected = bytearray(binary.HEADER)
+    for row in rows:
+        binary.encode_row(expected, row, encoders)
+    expected += binary.TRAILER
+
+    stream = binary.CopyStream(Cursor(rows), encoders, batch_size=3)
+    assert stream.read() == expected
+    assert stream.read(10) == b""
+
+    stream = binary.CopyStream(Cursor(rows), encoders, batch_size=3)
+    chunks = iter(lambda: stream.read(7), b"")
+    assert b"".join(chunks) == expected
+    assert stream.rows == 10
+    assert expected[19:21] == struct.pack(">h", 2)
+
+    stream = binary.CopyStream(
+        Cursor([(*row, position % 3 == 0) for position, row in enumerate(rows)]), encoders, 3, True
+    )
+    assert stream.read() == expected
+    assert stream.repaired == 4
+
+
+def test_repaired_collections_keep_the_parts_of_the_column_type():
+    """
+    Tests the lines and points a repaired polygon collapsed to are dropped and its polygons become a multipolygon
+    """
+    polygon = b"\x01" + struct.pack("<III8d", 3, 1, 4, 0.0, 0.0, 1.0, 0.0, 1.0, 1.0, 0.0, 0.0)
+    other = b"\x00" + struct.pack(">III6d", 3, 1, 3, 5.0, 5.0, 6.0, 5.0, 5.0, 5.0)
+    multi = b"\x00" + struct.pack(">II", 6, 1) + other
+    line = b"\x01" + struct.pack("<II4d", 2, 2, 0.0, 0.0, 2.0, 2.0)
+    point = b"\x01" + struct.pack("<Idd", 1, 3.0, 3.0)
+    collection = b"\x01" + struct.pack("<II", 7, 4) + polygon + line + point + multi
+
+    assert binary.extract(collection, 6) == b"\x01" + struct.pack("<II", 6, 2) + polygon + other
+    assert binary.to_ewkb(collection, 26912, 6) == (
+        b"\x01" + struct.pack("<II", 0x20000006, 26912) + struct.pack("<I", 2) + polygon + other
+    )
+
+
+def test_collapsed_shapes_are_empty_multi_parts():
+    """
+    Tests a repaired polygon that collapsed to a line or a point is an empty shape of the column type
+    """
+    line = b"\x01" + struct.pack("<II4d", 2, 2, 0.0, 0.0, 2.0, 2.0)
+    point = b"\x00" + struct.pack(">Idd", 1, 3.0, 3.0)
+
+    assert binary.to_ewkb(line, 26912, 6) == b"\x01" + struct.pack("<III", 0x20000006, 26912, 0)
+    assert binary.to_ewkb(point, 26912, 5) == b"\x00" + struct.pack(">III", 0x20000005, 26912, 0)
+    assert binary.to_ewkb(point, 26912, 4) == (
+        b"\x00" + struct.pack(">II", 0x20000004, 26912) + struct.pack(">I", 1) + point
+    )
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# * coding: utf8 *
+"""
+test_catalog - A script that tests the catalog.py file
+"""
+
+from cloudb import catalog
+
+CONNECTION = "PG:host=localhost user='postgres' password='secret' dbname='opensgid'"
+
+
+def test_tables_are_cached_without_credentials(tmp_path, monkeypatch):
+    """
+    Tests the tables round trip through the cache and the password is not in the file name
+    """
+    monkeypatch.setattr(catalog, "CACHE_DIRECTORY", tmp_path)
+
+    assert catalog.get_tables(CONNECTION) is None
+
+    catalog.set_tables(CONNECTION, ["location.address_points", "cadastre.land_ownership"])
+
+    assert catalog.get_tables(CONNECTION).keys() == {"location.address_points", "cadastre.land_ownership"}
+    assert all("secret" not in path.name for path in tmp_path.iterdir())
+
+
+def test_expired_and_invalidated_caches_miss(tmp_path, monkeypatch):
+    """
+    Tests a cache older than the ttl or invalidated is not used
+    """
+    monkeypatch.setattr(catalog, "CACHE_DIRECTORY", tmp_path)
+    catalog.set_tables(CONNECTION, {"location.address_points": {"geometry_type": "POINT", "rows": 10, "columns": []}})
+
+    monkeypatch.setattr(catalog, "TTL", -1)
+    assert catalog.get_tables(CONNECTION) is None
+
+    monkeypatch.setattr(catalog, "TTL", 3600)
+    assert catalog.get_tables(CONNECTION) == {
+        "location.address_points": {"geometry_type": "POINT", "rows": 10, "columns": []}
+    }
+
+    catalog.invalidate(CONNECTION)
+    assert catalog.get_tables(CONNECTION) is None
+
+
+def test_diff_column_types_leaves_out_columns_that_already_match():
+    """
+    Tests only the columns with a different type are altered and missing tables and columns are left out
+    """
+    desired = {
+        "water.lakes": {"gnis_id": "integer", "elevation": "smallint", "missing": "bigint"},
+        "water.streams": {"reach": "bigint"},
+        "water.dropped": {"id": "integer"},
+    }
+    actual = {
+        "water.lakes": {"gnis_id": "integer", "elevation": "integer", "shape": "geometry(MultiPolygon,26912)"},
+        "water.streams": {"reach": "bigint"},
+    }
+
+    assert catalog.diff_column_types(desired, actual) == {"water.lakes": {"elevation": "smallint"}}
+
+
+def test_format_column_types_for_the_layer_creation_option():
+    """
+    Tests the source integer types are formatted for the COLUMN_TYPES layer creation option
+    """
+    assert catalog.format_column_types({"zip": "integer", "parcel_count": "bigint"}) == (
+        "zip=integer,parcel_count=bigint"
+    )
+    assert catalog.format_column_types({}) == ""
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# * coding: utf8 *
+"""
+test_changes - A script that tests the changes.py file
+"""
+
+from cloudb import changes
+
+COLUMNS = ['"name"', '"shape"']
+
+
+def test_get_row_statements_without_key_counts_occurrences():
+    """
+    Tests duplicate rows are told apart by the occurrence of their hash
+    """
+    source, destination = changes.get_row_statements("staging.boundaries_counties", "boundaries.counties", COLUMNS)
+
+    assert source == (
+        "CREATE TEMP TABLE source_rows ON COMMIT DROP AS\n"
+        'SELECT xid, md5(ROW("name", "shape")::text) AS row_hash, '
+        'row_number() OVER (PARTITION BY md5(ROW("name", "shape")::text)) AS occurrence\n'
+        "FROM staging.boundaries_counties;"
+    )
+    assert destination.startswith("CREATE TEMP TABLE destination_rows ON COMMIT DROP AS\n")
+    assert destination.endswith("FROM boundaries.counties;")
+
+
+def test_get_row_statements_with_key_snapshots_key():
+    """
+    Tests the key is snapshot next to the hash
+    """
+    source, destination = changes.get_row_statements(
+        "staging.location_address_points", "location.address_points", COLUMNS, '"utaddptid"'
+    )
+
+    assert 'SELECT xid, "utaddptid" AS sync_key, md5(ROW("name", "shape")::text) AS row_hash\n' in source
+    assert "occurrence" not in source
+    assert destination.endswith("FROM location.address_points;")
+
+
+def test_get_change_statements_without_key_deletes_and_inserts():
+    """
+    Tests a changed row is a delete and an insert when there is no key
+    """
+    statements = changes.get_change_statements("staging.boundaries_counties", "boundaries.counties", COLUMNS)
+
+    assert list(statements) == ["deleted", "inserted"]
+    assert statements["deleted"] == (
+        "DELETE FROM boundaries.counties t USING destination_rows d\n"
+        "WHERE t.xid = d.xid\n"
+        "AND NOT EXISTS (SELECT 1 FROM source_rows s WHERE s.row_hash = d.row_hash AND s.occurrence = d.occurrence);"
+    )
+    assert statements["inserted"] == (
+        'INSERT INTO boundaries.counties ("name", "shape")\n'
+        'SELECT st."name", st."shape" FROM staging.boundaries_counties st\n'
+        "INNER JOIN source_rows s ON s.xid = st.xid\n"
+        "WHERE NOT EXISTS (SELECT 1 FROM destination_rows d "
+        "WHERE s.row_hash = d.row_hash AND s.occurrence = d.occurrence);"
+    )
+
+
+def test_get_change_statements_with_key_updates_in_place():
+    """
+    Tests rows are matched on the key and changed rows are updated
+    """
+    statements = changes.get_change_statements(
+        "staging.location_address_points", "location.address_points", COLUMNS, '"utaddptid"'
+    )
+
+    assert list(statements) == ["deleted", "updated", "inserted"]
+    assert "WHERE s.sync_key = d.sync_key);" in statements["deleted"]
+    assert statements["updated"] == (
+        'UPDATE location.address_points t SET ("name", "shape") = (st."name", st."shape")\n'
+        "FROM staging.location_address_points st\n"
+        "INNER JOIN source_rows s ON s.xid = st.xid\n"
+        "INNER JOIN destination_rows d ON d.sync_key = s.sync_key\n"
+        "WHERE t.xid = d.xid AND s.row_hash <> d.row_hash;"
+    )
+    assert "WHERE s.sync_key = d.sync_key);" in statements["inserted"]
+
+
+def test_unique_keys_checks_both_snapshots():
+    """
+    Tests the key is checked in the source and destination snapshots
+    """
+    assert "FROM source_rows" in changes.UNIQUE_KEYS
+    assert "FROM destination_rows" in changes.UNIQUE_KEYS
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# * coding: utf8 *
+"""
+test_chunks - A script that tests the chunks.py file
+"""
+
+from cloudb import chunks
+
+
+def test_get_ranges_covers_every_key_once():
+    """
+    Tests the ranges are contiguous, cover the keys, and small or unknown tables load at once
+    """
+    assert chunks.get_ranges(1, 10, 3) == [(1, 5), (5, 9), (9, 11)]
+    assert chunks.get_ranges(5, 6, 4) == [(5, 6), (6, 7)]
+    assert chunks.get_ranges(None, None, 4) == [None]
+    assert chunks.get_ranges(1, 10, 1) == [None]
+    assert chunks.get_where((5, 9)) == "objectid >= 5 AND objectid < 9"
+
+
+def test_load_retries_each_chunk_on_its_own():
+    """
+    Tests a failing chunk is retried without loading the others again and a chunk that keeps failing fails the load
+    """
+    attempts = {}
+
+    def target(chunk):
+        attempts[chunk] = attempts.get(chunk, 0) + 1
+
+        if chunk == "b" and attempts[chunk] < 3:
+            raise RuntimeError("connection reset")
+
+        if chunk == "d":
+            raise RuntimeError("timeout")
+
+    assert chunks.load(["a", "b", "c"], target, retries=3, retry_delay=0, workers=3) == (2, None)
+    assert attempts == {"a": 1, "b": 3, "c": 1}
+
+    retries, error = chunks.load(["d"], target, retries=2, retry_delay=0)
+    assert retries == 1
+    assert str(error) == "timeout"
+
+
+def test_append_options_target_the_qualified_load_table():
+    """
+    Tests the chunks append to the schema qualified table that was created instead of a table in the search path
+    """
+    options = [
+        "-f",
+        "PostgreSQL",
+        "-lco",
+        "FID=xid",
+        "-nlt",
+        "MULTIPOLYGON",
+        "-gt",
+        "unlimited",
+        "-lco",
+        "SCHEMA=water",
+        "-nln",
+        "lakes_shadow",
+    ]
+
+    assert chunks.get_append_options(options, 'SELECT "name" FROM "water.lakes"', (1, 5), "water.lakes_shadow") == [
+        "-f",
+        "PostgreSQL",
+        "-nlt",
+        "MULTIPOLYGON",
+        "-gt",
+        "unlimited",
+        "-nln",
+        "water.lakes_shadow",
+        "-append",
+        "-sql",
+        'SELECT "name" FROM "water.lakes" WHERE objectid >= 1 AND objectid < 5',
+    ]
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# * coding: utf8 *
+"""
+test_cluster - A script that tests the cluster.py file
+"""
+
+import pytest
+
+from cloudb import cluster
+
+
+def test_get_statements_writes_ordered_table():
+    """
+    Tests the rows are written once in curve order to a new table that keeps the xid and records the state
+    """
+    statements = cluster.get_statements(
+        "cadastre.utah_county_parcels_shadow",
+        "cadastre.utah_county_parcels_shadow_ordered_shadow",
+        cluster.GEOHASH,
+        "cadastre.utah_county_parcels_shadow_xid_seq",
+    )
+
+    assert statements[0] == "DROP TABLE IF EXISTS cadastre.utah_county_parcels_shadow_ordered_shadow"
+    assert statements[1] == (
+        "CREATE TABLE cadastre.utah_county_parcels_shadow_ordered_shadow AS "
+        "SELECT * FROM cadastre.utah_county_parcels_shadow ORDER BY "
+        "CASE WHEN ST_IsEmpty(shape) THEN NULL ELSE ST_GeoHash(ST_Transform(ST_PointOnSurface(shape), 4326)) END "
+        "NULLS LAST"
+    )
+    assert statements[2] == "ALTER TABLE cadastre.utah_county_parcels_shadow_ordered_shadow ADD PRIMARY KEY (xid)"
+    assert statements[4] == (
+        "ALTER SEQUENCE cadastre.utah_county_parcels_shadow_xid_seq "
+        "OWNED BY cadastre.utah_county_parcels_shadow_ordered_shadow.xid"
+    )
+    assert statements[5] == (
+        "COMMENT ON TABLE cadastre.utah_county_parcels_shadow_ordered_shadow IS 'cloudb:cluster=geohash'"
+    )
+    assert not any("INSERT" in sql or "TRUNCATE" in sql or "INDEX" in sql for sql in statements)
+    assert cluster.get_order(cluster.HILBERT) == "shape"
+    assert cluster.CLUSTERS["cadastre.utah_county_parcels"] == cluster.HILBERT
+
+    with pytest.raises(ValueError):
+        cluster.get_order("zorder")
+
+
+def test_get_statements_keeps_unlogged_table_without_xid():
+    """
+    Tests a staging table stays unlogged and a table without an xid gets no primary key
+    """
+    statements = cluster.get_statements("staging.location_address_points", "staging.t", cluster.HILBERT, unlogged=True)
+
+    assert statements[1].startswith("CREATE UNLOGGED TABLE staging.t AS ")
+    assert not any("xid" in sql for sql in statements)
+
+
+def test_get_ordered_name_never_matches_table():
+    """
+    Tests the ordered table fits the identifier limit and does not collide with a truncated shadow table
+    """
+    table = f"cadastre.{'a' * 56}_shadow"
+    ordered = cluster.get_ordered_name(table)
+
+    assert ordered != table
+    assert len(ordered.split(".")[1]) == cluster.MAX_IDENTIFIER_LENGTH
+    assert ordered.endswith("_shadow")
+    assert cluster.get_ordered_name("location.address_points") == "location.address_points_ordered_shadow"
@@ -0,0 +1,39 @@
+#!/usr/bin/env python
+# * coding: utf8 *
+"""
+test_generalize - A script that tests the generalize.py file
+"""
+
+from cloudb import generalize
+
+
+def test_get_statements_simplifies_the_shape():
+    """
+    Tests the companion table keeps the attributes and simplifies the shape
+    """
+    columns = [("xid", "integer"), ("owner", "character varying"), ("shape", "geometry(MultiPolygon,26912)")]
+    target = "cadastre.land_ownership_generalized_50m_shadow"
+
+    assert generalize.get_statements("cadastre.land_ownership", 50, target, columns) == [
+        f"DROP TABLE IF EXISTS {target}",
+        f'CREATE TABLE {target} AS SELECT "xid", "owner", '
+        'ST_SimplifyPreserveTopology("shape", 50)::geometry(MultiPolygon,26912) AS "shape" '
+        "FROM cadastre.land_ownership",
+        f"ALTER TABLE {target} ADD PRIMARY KEY (xid)",
+        f"CREATE INDEX ON {target} USING gist (shape)",
+        f"ANALYZE {target}",
+    ]
+
+
+def test_companions_are_named_per_tolerance():
+    """
+    Tests the companion tables can be found from their layer
+    """
+    assert generalize.get_companions("cadastre.land_ownership") == [
+        "cadastre.land_ownership_generalized_10m",
+        "cadastre.land_ownership_generalized_50m",
+        "cadastre.land_ownership_generalized_250m",
+    ]
+    assert generalize.is_companion("cadastre.salt_lake_county_parcels_generalized_25m")
+    assert not generalize.is_companion("cadastre.land_ownership")
+    assert generalize.get_companions("water.lakes") == []
@@ -12,3 +12,85 @@ def test_index_creation():
     Tests the creation of the indices
     """
     assert len(index.INDEXES) == 34
+
+
+def test_get_statements_targets_another_table():
+    """
+    Tests the index sql can be created on a shadow table
+    """
+    statements = index.get_statements("location.address_points", "location.address_points_shadow")
+
+    assert statements == [
+        "create index if not exists idx_address_points_shadow_fulladd on location.address_points_shadow (fulladd);",
+        "create index if not exists trgm_idx_address_points_shadow_fulladd on location.address_points_shadow using gin (fulladd gin_trgm_ops);",
+    ]
+    assert index.get_statements("location.address_points")[0] == (
+        "create index if not exists idx_address_points_fulladd on location.address_points (fulladd);"
+    )
+
+
+def test_get_statement_formats_each_method():
+    """
+    Tests the sql for the declared index methods
+    """
+    table = "cadastre.parcels"
+
+    assert index.get_statement(index.btree("parcel_id", include=["owner"], where="owner is not null"), table) == (
+        "create index if not exists idx_parcels_parcel_id on cadastre.parcels (parcel_id) include (owner) "
+        "where owner is not null;"
+    )
+    assert index.get_statement(index.spatial(method="spgist"), table, concurrently=True) == (
+        "create index concurrently if not exists spgist_idx_parcels_shape on cadastre.parcels using spgist (shape);"
+    )
+    assert index.get_statement(index.brin("objectid", pages_per_range=32), table) == (
+        "create index if not exists brin_idx_parcels_objectid on cadastre.parcels using brin (objectid) "
+        "with (pages_per_range = 32);"
+    )
+
+
+class FakeCursor:
+    """a cursor that returns canned catalog rows"""
+
+    def __init__(self, exists, rows):
+        self.results = [[(exists,)], rows]
+
+    def execute(self, sql, params=None):
+        self.current = self.results.pop(0)
+
+    def fetchone(self):
+        return self.current[0]
+
+    def fetchall(self):
+        return self.current
+
+
+def test_diff_only_returns_missing_and_changed_indexes():
+    """
+    Tests the diff skips matching indexes and rebuilds invalid or changed ones
+    """
+    layer = "location.address_points"
+    btree, trigram = index.INDEXES[layer]
+
+    assert index.diff(FakeCursor(False, []), layer) is None
+    assert index.diff(FakeCursor(True, []), layer) == [
+        ("create", "idx_address_points_fulladd", btree),
+        ("create", "trgm_idx_address_points_fulladd", trigram),
+    ]
+
+    rows = [
+        (
+            "idx_address_points_fulladd",
+            True,
+            None,
+            "CREATE INDEX idx_address_points_fulladd ON location.address_points USING btree (fulladd)",
+        ),
+        ("trgm_idx_address_points_fulladd", True, index.get_signature(trigram), ""),
+    ]
+    assert index.diff(FakeCursor(True, rows), layer) == []
+
+    rows[0] = ("idx_address_points_fulladd", False, index.get_signature(btree), "")
+    rows[1] = ("trgm_idx_address_points_fulladd", True, "cloudb:outdated", "")
+    assert index.diff(FakeCursor(True, rows), layer) == [
+        ("replace", "idx_address_points_fulladd", btree),
+        ("replace", "trgm_idx_address_points_fulladd", trigram),
+    ]
@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+# * coding: utf8 *
+"""
+test_jobs - A script that tests the jobs.py file
+"""
+
+from threading import Event
+
+from cloudb import jobs
+
+
+def test_submit_coalesces_and_tracks_progress():
+    """
+    Tests a trigger while a job is running joins it and the job reports its progress
+    """
+    started = Event()
+    release = Event()
+
+    def sync():
+        jobs.set_phase("update")
+        jobs.start_tables(["location.address_points", "water.lakes"])
+        jobs.start_table("location.address_points")
+        jobs.finish_table("location.address_points")
+        jobs.start_table("water.lakes")
+        started.set()
+        release.wait(5)
+        jobs.finish_table("water.lakes", failed=True)
+
+        return ["water.lakes: timeout"]
+
+    job, created = jobs.submit("scheduled", sync)
+    assert created
+
+    assert started.wait(5)
+    duplicate, created = jobs.submit("scheduled", sync)
+    assert not created
+    assert duplicate["id"] == job["id"]
+
+    running = jobs.get(job["id"])
+    assert running["status"] == jobs.RUNNING
+    assert running["phase"] == "update"
+    assert running["current"] == ["water.lakes"]
+    assert running["tables"] == {"total": 2, "done": 1, "remaining": 1, "failed": 0}
+
+    release.set()
+    jobs._get_executor().submit(lambda: None).result(5)
+
+    finished = jobs.get(job["id"])
+    assert finished["status"] == jobs.FAILED
+    assert finished["errors"] == ["water.lakes: timeout"]
+    assert finished["tables"] == {"total": 2, "done": 2, "remaining": 0, "failed": 1}
+    assert jobs.get("unknown") is None
+
+    jobs.finish_table("water.lakes")
+    assert jobs.get(job["id"])["tables"]["done"] == 2
@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+# * coding: utf8 *
+"""
+test_journal - A script that tests the journal.py file
+"""
+
+from cloudb import journal, state
+
+
+def test_an_unfinished_run_continues_and_a_finished_run_starts_over(tmp_path):
+    """
+    Tests the checkpoints of a run survive a restart until the run ends, even with errors
+    """
+    store = state.get_store(str(tmp_path))
+
+    run = journal.start(store, "scheduled")
+    run.complete("trim")
+    run.complete("import", "water.lakes")
+    run.complete("import", "water.lakes")
+
+    restarted = journal.start(store, "scheduled")
+    assert restarted.id == run.id
+    assert restarted.run["resumed"] == 1
+    assert restarted.is_done("trim")
+    assert not restarted.is_done("update")
+    assert restarted.get_tables("import") == ["water.lakes"]
+    assert journal.get_unfinished(store, "scheduled")["id"] == run.id
+    assert journal.get_unfinished(store, "manual") is None
+
+    restarted.finish(failed=True)
+    assert journal.get_unfinished(store, "scheduled") is None
+    assert restarted.run["failed"]
+
+    fresh = journal.start(store, "scheduled")
+    assert fresh.id != run.id
+    assert not fresh.is_done("trim")
+
+
+def test_chunks_belong_to_their_run(tmp_path):
+    """
+    Tests chunk checkpoints from another run are ignored and clearing them starts the table over
+    """
+    store = state.get_store(str(tmp_path))
+
+    journal.complete_chunk(store, "a", "cadastre.utah_county_parcels", (1, 500))
+    journal.complete_chunk(store, "a", "cadastre.utah_county_parcels", (500, 1000))
+
+    assert journal.read_chunks(store, "a", "cadastre.utah_county_parcels") == [(1, 500), (500, 1000)]
+    assert journal.read_chunks(store, "b", "cadastre.utah_county_parcels") == []
+    assert journal.read_chunks(store, "a", "water.lakes") == []
+
+    journal.clear_chunks(store, "a", "cadastre.utah_county_parcels")
+    assert journal.read_chunks(store, "a", "cadastre.utah_county_parcels") == []
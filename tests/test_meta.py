@@ -0,0 +1,28 @@
+#!/usr/bin/env python
+# * coding: utf8 *
+"""
+test_meta - A script that tests the meta.py file
+"""
+
+from cloudb import meta
+
+
+def test_snapshot_indexes_both_directions():
+    """
+    Tests the snapshot maps source tables to titles and titles back to source tables
+    """
+    snapshot = meta.create_snapshot(
+        [
+            ("SGID.WATER.CulinaryWaterServiceAreas", "Utah Retail Culinary Water Service Areas", "POLYGON"),
+            ("SGID.LOCATION.AddressPoints", "Utah Address Points", "POINT"),
+            ("SGID.LOCATION.Unpublished", None, "POINT"),
+        ]
+    )
+
+    assert snapshot.tables["water"]["culinarywaterserviceareas"] == {
+        "title": "retail_culinary_water_service_areas",
+        "geometry_type": "POLYGON",
+    }
+    assert snapshot.get_source_table("location.address_points") == "location.addresspoints"
+    assert snapshot.get_source_table("water.retail_culinary_water_service_areas") == "water.culinarywaterserviceareas"
+    assert snapshot.get_source_table("location.missing") is None
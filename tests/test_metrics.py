@@ -0,0 +1,30 @@
+#!/usr/bin/env python
+# * coding: utf8 *
+"""
+test_metrics - A script that tests the metrics.py file
+"""
+
+from cloudb import metrics
+
+
+def test_render_histograms_and_counters():
+    """
+    Tests the metrics are rendered in the prometheus text format
+    """
+    metrics.reset()
+
+    metrics.observe("cloudb_table_phase_seconds", 0.5, buckets=(1, 10), phase="transfer")
+    metrics.observe("cloudb_table_phase_seconds", 20, buckets=(1, 10), phase="transfer")
+    metrics.increment("cloudb_tables_total", status="success")
+
+    lines = metrics.render().splitlines()
+
+    assert "# TYPE cloudb_table_phase_seconds histogram" in lines
+    assert 'cloudb_table_phase_seconds_bucket{phase="transfer",le="1"} 1' in lines
+    assert 'cloudb_table_phase_seconds_bucket{phase="transfer",le="10"} 1' in lines
+    assert 'cloudb_table_phase_seconds_bucket{phase="transfer",le="+Inf"} 2' in lines
+    assert 'cloudb_table_phase_seconds_sum{phase="transfer"} 20.5' in lines
+    assert 'cloudb_table_phase_seconds_count{phase="transfer"} 2' in lines
+    assert 'cloudb_tables_total{status="success"} 1' in lines
+
+    metrics.reset()
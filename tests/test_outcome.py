@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# * coding: utf8 *
+"""
+test_outcome - A script that tests the outcome.py file
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+from cloudb import outcome
+
+
+def _sync(table, fail=False):
+    """a stand in for main._replace_data"""
+    if fail:
+        raise RuntimeError("connection reset")
+
+    if table == "water.springs":
+        return outcome.create(table, outcome.SKIPPED, "not in the meta table")
+
+    return outcome.create(table, outcome.SUCCESS, rows=10)
+
+
+def test_summarize_buckets_each_status():
+    """
+    Tests each result lands in the bucket for its status and every result is kept by table
+    """
+    summary = outcome.summarize(
+        [
+            outcome.create("water.lakes", outcome.SUCCESS, rows=10),
+            outcome.create("water.springs", outcome.SKIPPED, "dry run"),
+            outcome.create("water.rivers", outcome.FAILED, "timeout"),
+            outcome.create("water.dams", outcome.SUCCESS, resumed=True),
+        ]
+    )
+
+    assert summary["succeeded"] == ["water.lakes", "water.dams"]
+    assert summary["skipped"] == ["water.springs"]
+    assert summary["failed"] == {"water.rivers": "timeout"}
+    assert summary["tables"]["water.lakes"]["rows"] == 10
+    assert summary["tables"]["water.dams"]["resumed"]
+
+
+def test_split_finished_resumes_finished_tables():
+    """
+    Tests the tables a run finished before a restart are successes that are not synced again
+    """
+    resumed, left = outcome.split_finished(["water.lakes", "water.rivers"], lambda table: table == "water.lakes")
+
+    assert resumed == [{"table": "water.lakes", "status": outcome.SUCCESS, "error": None, "resumed": True}]
+    assert left == ["water.rivers"]
+
+
+def test_run_tables_turns_errors_into_failures():
+    """
+    Tests an error while syncing a table fails that table, serially and in a pool, and the others still sync
+    """
+    tables = [
+        ("water.lakes", ("water.lakes",)),
+        ("water.rivers", ("water.rivers", True)),
+        ("water.springs", ("water.springs",)),
+    ]
+
+    for workers in (1, 2):
+        started = []
+        finished = []
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = outcome.run_tables(tables, _sync, workers, executor, started.append, finished.append)
+
+        summary = outcome.summarize(results)
+
+        assert started == ["water.lakes", "water.rivers", "water.springs"]
+        assert finished == results
+        assert summary["succeeded"] == ["water.lakes"]
+        assert summary["skipped"] == ["water.springs"]
+        assert summary["failed"] == {"water.rivers": "connection reset"}
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# * coding: utf8 *
+"""
+test_planner - A script that tests the planner.py file
+"""
+
+from cloudb import planner, state
+
+
+def test_plan_orders_the_largest_loads_first_and_projects_the_workers():
+    """
+    Tests the estimates scale the history by the source rows and the projection packs the loads onto the workers
+    """
+    history = {
+        "cadastre.utah_county_parcels": {"rows": 100000, "bytes": 10**8, "seconds": 60},
+        "water.lakes": {"rows": 1000, "bytes": 10**6, "seconds": 10},
+    }
+    actions = {
+        "cadastre.utah_county_parcels": planner.RELOAD,
+        "water.lakes": planner.RELOAD,
+        "location.address_points": planner.CREATE,
+        "boundaries.counties": planner.SKIP,
+        "old.table": planner.DROP,
+    }
+    sizes = {"cadastre.utah_county_parcels": (200000, 2 * 10**8), "location.address_points": (240000, None)}
+
+    steps = planner.create_plan(actions, sizes, history)
+
+    assert [(step["table"], step["seconds"]) for step in steps] == [
+        ("cadastre.utah_county_parcels", 120),
+        ("location.address_points", 50),
+        ("water.lakes", 10),
+        ("boundaries.counties", 0),
+        ("old.table", 0),
+    ]
+    assert steps[2]["rows"] == 1000
+    assert planner.project(steps, 1) == 180
+    assert planner.project(steps, 2) == 120
+    assert "projected 2.0 minutes" in planner.format_plan(steps, 2)
+
+
+def test_record_averages_the_successful_runs(tmp_path):
+    """
+    Tests only the tables that synced are added to the history and the seconds are smoothed
+    """
+    store = state.get_store(str(tmp_path))
+    summary = {
+        "succeeded": ["water.lakes"],
+        "tables": {
+            "water.lakes": {"status": "success", "rows": 1200, "bytes": 10**6, "timings": {"transfer": 8, "swap": 2}},
+            "water.streams": {"status": "failed", "timings": {"transfer": 30}},
+        },
+    }
+
+    planner.record(store, summary)
+    assert planner.read_history(store) == {"water.lakes": {"rows": 1200, "bytes": 10**6, "seconds": 10}}
+
+    summary["tables"]["water.lakes"]["timings"] = {"transfer": 20}
+    planner.record(store, summary)
+    assert planner.read_history(store)["water.lakes"]["seconds"] == 15
@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+# * coding: utf8 *
+"""
+test_profiles - A script that tests the profiles.py file
+"""
+
+from cloudb import profiles
+
+
+def test_select_picks_the_profile_by_weight(monkeypatch):
+    """
+    Tests tables are sized by rows times vertices and the overrides and forced profile win
+    """
+    monkeypatch.delenv("CLOUDB_LOAD_PROFILES", raising=False)
+    monkeypatch.delenv("CLOUDB_LOAD_PROFILE", raising=False)
+    monkeypatch.setattr(profiles, "OVERRIDES", {"cadastre.land_ownership": {"name": "large", "retries": 5}})
+
+    assert profiles.select("boundaries.counties", 29, 5000)["name"] == "medium"
+    assert profiles.select("location.address_points", 1000, None)["name"] == "small"
+    assert profiles.select("location.address_points", 2000000, None)["weight"] == 2000000
+    assert profiles.select("transportation.roads", 2000000, 10)["name"] == "large"
+    assert profiles.select("water.lakes")["name"] == "medium"
+
+    override = profiles.select("cadastre.land_ownership", 10, 1)
+    assert (override["name"], override["retries"], override["weight"]) == ("large", 5, 10)
+
+    monkeypatch.setenv("CLOUDB_LOAD_PROFILE", "small")
+    assert profiles.select("transportation.roads", 2000000, 10)["name"] == "small"
+
+
+def test_calibrate_moves_the_boundaries_to_the_fastest_profile():
+    """
+    Tests each boundary moves to the heaviest table a profile up to it was fastest for
+    """
+    measurements = [
+        (1000, "small", 900),
+        (1000, "medium", 500),
+        (50000, "small", 400),
+        (50000, "medium", 700),
+        (500000, "medium", 600),
+        (500000, "large", 800),
+        (20000000, "large", None),
+    ]
+
+    calibrated = profiles.calibrate(measurements, profiles.PROFILES)
+
+    assert [profile["max_weight"] for profile in calibrated] == [1000, 50000, None]
+    assert profiles.PROFILES[0]["max_weight"] == 100000
@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+# * coding: utf8 *
+"""
+test_renames - A script that tests the renames.py file
+"""
+
+from cloudb import meta, renames, state
+
+
+def test_find_renames_pairs_tables_that_share_a_source_table(tmp_path):
+    """
+    Tests a changed published name is paired with the old destination table through the names of the last run
+    """
+    store = state.FileStore(tmp_path)
+    before = meta.create_snapshot(
+        [
+            ("SGID.WATER.Lakes", "Utah Lakes", "POLYGON"),
+            ("SGID.LOCATION.AddressPoints", "Utah Address Points", "POINT"),
+        ]
+    )
+    renames.record_names(store, {"water.lakes", "location.address_points", "water.unknown"}, before)
+
+    after = meta.create_snapshot(
+        [
+            ("SGID.WATER.Lakes", "Utah Lakes and Reservoirs", "POLYGON"),
+            ("SGID.LOCATION.AddressPoints", "Utah Address Points", "POINT"),
+            ("SGID.WATER.Streams", "Utah Streams", "POLYLINE"),
+        ]
+    )
+
+    pairs = renames.find_renames(
+        {"water.lakes", "water.dropped"},
+        {"water.lakes_and_reservoirs", "water.streams"},
+        renames.read_names(store),
+        after,
+    )
+
+    assert renames.read_names(store) == {
+        "location.address_points": "location.addresspoints",
+        "water.lakes": "water.lakes",
+    }
+    assert pairs == {"water.lakes": "water.lakes_and_reservoirs"}
+    assert renames.find_renames({"water.lakes"}, {"water.lakes_and_reservoirs"}, {}, after) == {}
@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# * coding: utf8 *
+"""
+test_report - A script that tests the report.py file
+"""
+
+from cloudb import metrics, report
+
+
+def test_report_breaks_down_tables_by_phase():
+    """
+    Tests the report keeps the measurements of each table and ranks the slowest
+    """
+    metrics.reset()
+
+    summary = {
+        "tables": {
+            "location.address_points": {
+                "table": "location.address_points",
+                "status": "success",
+                "error": None,
+                "rows": 100,
+                "bytes": 2048,
+                "retries": 1,
+                "timings": {"transfer": 3, "index": 1},
+            },
+            "water.lakes": {
+                "table": "water.lakes",
+                "status": "failed",
+                "error": "timeout",
+                "retries": 2,
+                "timings": {"transfer": 10},
+            },
+        }
+    }
+
+    run_report = report.create("update")
+    report.add_step(run_report, "trim", 1)
+    report.add_step(run_report, "update", 14, summary)
+    report.finish(run_report, 15)
+
+    assert run_report["steps"] == {"trim": 1, "update": 14}
+    assert run_report["tables"]["location.address_points"] == {
+        "status": "success",
+        "rows": 100,
+        "bytes": 2048,
+        "retries": 1,
+        "timings": {"transfer": 3, "index": 1},
+        "step": "update",
+    }
+    assert run_report["tables"]["water.lakes"]["error"] == "timeout"
+    assert run_report["totals"] == {"tables": 2, "failed": 1, "rows": 100, "bytes": 2048}
+    assert run_report["slowest"] == ["water.lakes", "location.address_points"]
+    assert "cloudb_table_retries_total 3" in metrics.render().splitlines()
+
+    metrics.reset()
@@ -0,0 +1,32 @@
+#!/usr/bin/env python
+# * coding: utf8 *
+"""
+test_sinks - A script that tests the sinks.py file
+"""
+
+from cloudb import sinks
+
+
+def test_publish_replaces_the_files_in_a_directory(tmp_path):
+    """
+    Tests each sink writes its own file through a temporary file and a failed sink does not stop the others
+    """
+    written = []
+
+    def translate(path, sink):
+        if sink == "flatgeobuf":
+            raise RuntimeError("no driver")
+
+        assert path.endswith(".tmp.parquet")
+        written.append(sinks.get_options(sink, "water.lakes"))
+
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(sink)
+
+    files = sinks.publish(translate, ["geoparquet", "flatgeobuf"], "water.lakes", str(tmp_path))
+
+    assert files == {"geoparquet": str(tmp_path / "water" / "lakes.parquet"), "flatgeobuf": "failed"}
+    assert (tmp_path / "water" / "lakes.parquet").read_text(encoding="utf-8") == "geoparquet"
+    assert [path.name for path in (tmp_path / "water").iterdir()] == ["lakes.parquet"]
+    assert written[0][:2] == ["-f", "Parquet"]
+    assert written[0][-3:] == ["-nln", "lakes", "water.lakes"]
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# * coding: utf8 *
+"""
+test_state - A script that tests the state.py file
+"""
+
+from datetime import datetime
+
+from cloudb import state
+
+
+def test_watermarks_start_from_last_checked_and_advance_on_success(tmp_path):
+    """
+    Tests the watermarks migrate from the legacy date and only move for tables that synced
+    """
+    store = state.get_store(str(tmp_path))
+    store.write(state.LEGACY_LAST_CHECKED, "2024-05-01\n")
+
+    watermarks = state.read_watermarks(store)
+    assert watermarks == {"default": datetime(2024, 5, 1), "tables": {}}
+    assert store.read(state.WATERMARKS) is not None
+
+    rows = [
+        ("location.address_points", datetime(2024, 5, 1, 8, 30)),
+        ("location.address_points", datetime(2024, 5, 1, 9, 15, 30, 250)),
+        ("water.lakes", datetime(2024, 5, 1, 10)),
+        ("boundaries.counties", datetime(2024, 4, 30)),
+    ]
+    changes = state.get_changed_tables(rows, watermarks)
+
+    assert changes == {
+        "location.address_points": datetime(2024, 5, 1, 9, 15, 30, 250),
+        "water.lakes": datetime(2024, 5, 1, 10),
+    }
+    assert state.advance_watermarks(store, changes, ["location.address_points", "boundaries.counties"]) == 1
+
+    #: the default follows the newest change and the table that failed stays behind it
+    watermarks = state.read_watermarks(store)
+    assert watermarks == {"default": datetime(2024, 5, 1, 10), "tables": {"water.lakes": datetime(2024, 5, 1)}}
+    assert state.get_since(watermarks) == datetime(2024, 5, 1)
+
+    #: the same change is not synced twice but the failed table is retried
+    assert state.get_changed_tables(rows, watermarks) == {"water.lakes": datetime(2024, 5, 1, 10)}
+
+    assert state.advance_watermarks(store, {"water.lakes": datetime(2024, 5, 1, 10)}, ["water.lakes"]) == 1
+    assert state.get_since(state.read_watermarks(store)) == datetime(2024, 5, 1, 10)
+
+
+def test_get_store_uses_files_for_directories(tmp_path):
+    """
+    Tests a local directory is a file store
+    """
+    assert isinstance(state.get_store(str(tmp_path)), state.FileStore)
+    assert state.FileStore(tmp_path / "missing").read(state.WATERMARKS) is None
+
+
+def test_lazy_store_opens_the_store_when_it_is_used(tmp_path):
+    """
+    Tests the lazy store does not open the store until it is read or written
+    """
+    store = state.LazyStore(str(tmp_path / "state"))
+
+    assert store.store is None
+    assert store.read("history.json") is None
+
+    store.write("history.json", "{}")
+
+    assert isinstance(store.store, state.FileStore)
+    assert (tmp_path / "state" / "history.json").read_text(encoding="utf-8") == "{}"